@@ -1,10 +1,30 @@
 # uvicorn app.main:app --reload --port 8080
+from contextlib import asynccontextmanager
 from .config import get_allowed_origins
+from .metrics import RequestIdMiddleware, configure_logging, registry
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.video_overview import video_overview
+from app.video_overview.video_overview_deps import client_registry
+from app.video_overview.video_overview_io import run_blocking, shutdown_blocking_io
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client_registry.start()
+    video_overview.get_prompt_prefix()
+    # loads the search index's postings before the first query needs them
+    await run_blocking(video_overview.get_search_index)
+    await video_overview.job_queue.start()
+    yield
+    await video_overview.job_queue.stop()
+    await client_registry.close()
+    shutdown_blocking_io()
+
+
+configure_logging()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS setup
 allowed_origins = get_allowed_origins()
@@ -16,9 +36,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(RequestIdMiddleware)
+
 app.include_router(video_overview.router)
 
 
 @app.get("/")
 def read_root():
     return {"message": "Hi world"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
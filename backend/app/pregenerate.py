@@ -0,0 +1,363 @@
+# Bulk pre-generation of video overviews for lecture series and playlists.
+# Runs the same pipeline as POST /generate-overview in-process, so it skips
+# HTTP and the per-IP limits:
+#   python -m app.pregenerate ids.txt [--playlist PLAYLIST_ID] [--llm-concurrency 4]
+# Progress is checkpointed in SQLite, so rerunning the same command after a
+# crash picks up where it stopped.
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .metrics import configure_logging
+from .video_overview import video_overview
+from .video_overview.video_overview_deps import (
+    client_registry,
+    get_anthropic_client,
+    get_supabase_client,
+)
+from .video_overview.video_overview_io import execute, run_blocking, shutdown_blocking_io
+from .video_overview.video_overview_schemas import VideoOverview
+from .video_overview.video_overview_services import (
+    get_transcript,
+    get_video_metadata,
+    list_playlist_video_ids,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+PREGENERATE_CHECKPOINT_PATH = os.getenv(
+    "PREGENERATE_CHECKPOINT_PATH", "data/pregenerate.sqlite3"
+)
+# transcript and metadata fetches are cheap next to an LLM call, so they run
+# well ahead of generation
+PREGENERATE_FETCH_CONCURRENCY = int(os.getenv("PREGENERATE_FETCH_CONCURRENCY", "16"))
+PREGENERATE_LLM_CONCURRENCY = int(os.getenv("PREGENERATE_LLM_CONCURRENCY", "4"))
+PREGENERATE_BATCH_SIZE = int(os.getenv("PREGENERATE_BATCH_SIZE", "20"))
+PREGENERATE_MAX_RETRIES = 3
+PREGENERATE_RETRY_BASE_S = 10.0
+# ids per `in` filter when checking which videos already have an overview
+EXISTING_LOOKUP_CHUNK = 100
+
+VIDEO_ID_PATTERN = re.compile(r"(?:v=|youtu\.be/|shorts/)([\w-]{11})")
+
+# checkpoint statuses: generated overviews are kept until their batch is
+# inserted, so a crash between the LLM call and the insert costs nothing
+GENERATED = "generated"
+SAVED = "saved"
+FAILED = "failed"
+
+
+class Checkpoint:
+    # sqlite3 calls block, so callers go through run_blocking
+    def __init__(self, path: str):
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._conn.execute(
+            """create table if not exists pregenerate (
+                video_id text primary key,
+                status text not null,
+                overview text,
+                detail text,
+                updated_at real not null
+            )"""
+        )
+        self._conn.commit()
+
+    def load(self) -> Dict[str, Tuple[str, Optional[str]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "select video_id, status, overview from pregenerate"
+            ).fetchall()
+        return {video_id: (status, overview) for video_id, status, overview in rows}
+
+    def _upsert(self, rows: List[Tuple[str, str, Optional[str], Optional[str]]]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "insert or replace into pregenerate values (?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows],
+            )
+            self._conn.commit()
+
+    def mark_generated(self, video_id: str, overview_json: str):
+        self._upsert([(video_id, GENERATED, overview_json, None)])
+
+    def mark_saved(self, video_ids: List[str]):
+        self._upsert([(video_id, SAVED, None, None) for video_id in video_ids])
+
+    def mark_failed(self, video_id: str, detail: str):
+        self._upsert([(video_id, FAILED, None, detail)])
+
+    def close(self):
+        self._conn.close()
+
+
+@dataclass
+class PregenerateStats:
+    total: int = 0
+    generated: int = 0
+    saved: int = 0
+    existing: int = 0
+    checkpointed: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+
+    def videos_per_minute(self) -> float:
+        return self.generated / self.elapsed_s * 60 if self.elapsed_s else 0.0
+
+
+def parse_video_ids(lines) -> List[str]:
+    # one id or watch URL per line; blank lines and # comments are ignored
+    video_ids = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        match = VIDEO_ID_PATTERN.search(line)
+        video_ids.append(match.group(1) if match else line)
+    # keep the first occurrence of each id
+    return list(dict.fromkeys(video_ids))
+
+
+async def find_existing(video_ids: List[str], supabase) -> set:
+    existing = set()
+    for i in range(0, len(video_ids), EXISTING_LOOKUP_CHUNK):
+        chunk = video_ids[i : i + EXISTING_LOOKUP_CHUNK]
+        response = await execute(
+            supabase.table("video_overviews").select("video_id").in_("video_id", chunk)
+        )
+        existing.update(row["video_id"] for row in response.data)
+    return existing
+
+
+async def pregenerate(
+    video_ids: List[str],
+    anthropic_client,
+    supabase,
+    checkpoint: Checkpoint,
+    fetch_concurrency: int = PREGENERATE_FETCH_CONCURRENCY,
+    llm_concurrency: int = PREGENERATE_LLM_CONCURRENCY,
+    batch_size: int = PREGENERATE_BATCH_SIZE,
+    retry_failed: bool = False,
+) -> PregenerateStats:
+    started = time.monotonic()
+    stats = PregenerateStats(total=len(video_ids))
+    state = await run_blocking(checkpoint.load)
+
+    candidates = []
+    for video_id in video_ids:
+        status, _ = state.get(video_id, (None, None))
+        if status == SAVED or (status == FAILED and not retry_failed):
+            stats.checkpointed += 1
+        else:
+            candidates.append(video_id)
+
+    existing = await find_existing(candidates, supabase)
+    stats.existing = len(existing)
+    if existing:
+        await run_blocking(checkpoint.mark_saved, list(existing))
+
+    pending: List[Tuple[str, VideoOverview]] = []
+    to_generate = []
+    for video_id in candidates:
+        if video_id in existing:
+            continue
+        status, overview_json = state.get(video_id, (None, None))
+        if status == GENERATED:
+            # generated before a crash but never inserted
+            pending.append((video_id, VideoOverview.model_validate_json(overview_json)))
+        else:
+            to_generate.append(video_id)
+    logger.info(
+        f"pregenerate: {len(to_generate)} to generate, {len(pending)} to insert, "
+        f"{stats.existing} already stored, {stats.checkpointed} done in an earlier run"
+    )
+
+    flush_lock = asyncio.Lock()
+
+    async def flush():
+        async with flush_lock:
+            if not pending:
+                return
+            batch = pending[:]
+            del pending[:]
+            try:
+                await video_overview.save_video_overviews(batch, supabase)
+                saved = [video_id for video_id, _ in batch]
+            except Exception as e:
+                # one bad row (e.g. an overview the API stored meanwhile) should
+                # not sink the batch, so fall back to row-at-a-time
+                logger.warning(f"batched insert of {len(batch)} failed, retrying per row: {e}")
+                saved = []
+                for video_id, overview in batch:
+                    try:
+                        await video_overview.save_video_overviews([(video_id, overview)], supabase)
+                        saved.append(video_id)
+                    except Exception as row_error:
+                        # stays `generated` in the checkpoint; the next run retries it
+                        logger.error(f"insert failed for {video_id}: {row_error}")
+            await run_blocking(checkpoint.mark_saved, saved)
+            stats.saved += len(saved)
+
+    async def fail(video_id: str, detail: str):
+        logger.error(f"{video_id} failed: {detail}")
+        stats.failed += 1
+        await run_blocking(checkpoint.mark_failed, video_id, detail)
+
+    async def fetch(video_id: str):
+        transcript, video_metadata = await asyncio.gather(
+            get_transcript(video_id), get_video_metadata(video_id)
+        )
+        if not transcript:
+            raise HTTPException(status_code=422, detail="Transcript not available")
+        return transcript, video_metadata
+
+    async def generate(video_id: str, transcript, video_metadata) -> VideoOverview:
+        for attempt in range(PREGENERATE_MAX_RETRIES + 1):
+            try:
+                return await video_overview.build_video_overview(
+                    transcript, video_metadata, anthropic_client
+                )
+            except HTTPException as e:
+                if e.status_code != 429 or attempt == PREGENERATE_MAX_RETRIES:
+                    raise
+                delay = PREGENERATE_RETRY_BASE_S * 2**attempt
+                logger.warning(f"rate limited on {video_id}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    # fetch workers feed a bounded queue, so at most a few transcripts wait
+    # in memory for an LLM slot
+    ids: asyncio.Queue = asyncio.Queue()
+    for video_id in to_generate:
+        ids.put_nowait(video_id)
+    fetched: asyncio.Queue = asyncio.Queue(maxsize=llm_concurrency * 2)
+
+    async def fetch_worker():
+        while True:
+            try:
+                video_id = ids.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                item = (video_id, *await fetch(video_id))
+            except HTTPException as e:
+                await fail(video_id, f"{e.status_code}: {e.detail}")
+                continue
+            except Exception as e:
+                await fail(video_id, str(e))
+                continue
+            await fetched.put(item)
+
+    async def llm_worker():
+        while True:
+            item = await fetched.get()
+            if item is None:
+                return
+            video_id, transcript, video_metadata = item
+            try:
+                overview = await generate(video_id, transcript, video_metadata)
+            except HTTPException as e:
+                await fail(video_id, f"{e.status_code}: {e.detail}")
+                continue
+            except Exception as e:
+                await fail(video_id, str(e))
+                continue
+            await run_blocking(checkpoint.mark_generated, video_id, overview.model_dump_json())
+            stats.generated += 1
+            pending.append((video_id, overview))
+            elapsed_min = (time.monotonic() - started) / 60
+            logger.info(
+                f"[{stats.generated + stats.failed}/{len(to_generate)}] {video_id} done, "
+                f"{stats.generated / elapsed_min:.1f} videos/min"
+            )
+            if len(pending) >= batch_size:
+                await flush()
+
+    llm_workers = [asyncio.create_task(llm_worker()) for _ in range(llm_concurrency)]
+    try:
+        await asyncio.gather(*(fetch_worker() for _ in range(fetch_concurrency)))
+        for _ in llm_workers:
+            await fetched.put(None)
+        await asyncio.gather(*llm_workers)
+    finally:
+        for task in llm_workers:
+            task.cancel()
+    await flush()
+
+    stats.elapsed_s = time.monotonic() - started
+    return stats
+
+
+def print_stats(stats: PregenerateStats):
+    print(f"videos:               {stats.total}")
+    print(f"generated:            {stats.generated}")
+    print(f"inserted:             {stats.saved}")
+    print(f"already stored:       {stats.existing}")
+    print(f"done in earlier run:  {stats.checkpointed}")
+    print(f"failed:               {stats.failed}")
+    print(f"elapsed:              {stats.elapsed_s:.1f}s")
+    print(f"throughput:           {stats.videos_per_minute():.1f} videos/min")
+
+
+async def run(args) -> PregenerateStats:
+    video_ids = []
+    if args.ids_file:
+        with open(args.ids_file) as f:
+            video_ids.extend(parse_video_ids(f))
+    for playlist_id in args.playlist:
+        video_ids.extend(await run_blocking(list_playlist_video_ids, playlist_id))
+    video_ids = list(dict.fromkeys(video_ids))
+
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        return await pregenerate(
+            video_ids,
+            get_anthropic_client(user_api_key_only=False),
+            get_supabase_client(),
+            checkpoint,
+            fetch_concurrency=args.fetch_concurrency,
+            llm_concurrency=args.llm_concurrency,
+            batch_size=args.batch_size,
+            retry_failed=args.retry_failed,
+        )
+    finally:
+        checkpoint.close()
+        await client_registry.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate video overviews in bulk")
+    parser.add_argument("ids_file", nargs="?", help="file with one video id or URL per line")
+    parser.add_argument("--playlist", action="append", default=[], help="YouTube playlist id")
+    parser.add_argument("--checkpoint", default=PREGENERATE_CHECKPOINT_PATH)
+    parser.add_argument("--fetch-concurrency", type=int, default=PREGENERATE_FETCH_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, default=PREGENERATE_LLM_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=PREGENERATE_BATCH_SIZE)
+    parser.add_argument(
+        "--retry-failed", action="store_true", help="retry ids that failed in an earlier run"
+    )
+    args = parser.parse_args()
+    if not args.ids_file and not args.playlist:
+        parser.error("pass an ids file, --playlist, or both")
+
+    configure_logging()
+    try:
+        stats = asyncio.run(run(args))
+    finally:
+        shutdown_blocking_io()
+    print_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Rebuilds the search index from every overview stored in Supabase:
+#   python -m app.rebuild_search_index            build a fresh index and swap it in
+#   python -m app.rebuild_search_index --missing  only add overviews the index lacks
+# Servers keep answering searches from the old index until the swap, and pick
+# up the new one on their next query.
+import argparse
+import asyncio
+import os
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+from .metrics import configure_logging
+from .video_overview.video_overview_codec import decode_overview_row, overview_columns
+from .video_overview.video_overview_deps import client_registry, get_supabase_client
+from .video_overview.video_overview_io import execute, run_blocking, shutdown_blocking_io
+from .video_overview.video_overview_schemas import VideoOverview
+from .video_overview.video_overview_search import SEARCH_INDEX_PATH, SearchIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+REBUILD_PAGE_SIZE = 500
+
+
+def to_overview(row: dict) -> Optional[VideoOverview]:
+    body = decode_overview_row(row)
+    if body is None:
+        return None
+    return VideoOverview.model_validate_json(body)
+
+
+async def stored_overviews(
+    supabase, skip: frozenset = frozenset(), page_size: int = REBUILD_PAGE_SIZE
+) -> AsyncIterator[List[Tuple[str, VideoOverview]]]:
+    # pages through video_overviews by video_id; ids in `skip` are never decoded
+    last_video_id = ""
+    while True:
+        response = await execute(
+            supabase.table("video_overviews")
+            .select("video_id")
+            .gt("video_id", last_video_id)
+            .order("video_id")
+            .limit(page_size)
+        )
+        if not response.data:
+            return
+        video_ids = [row["video_id"] for row in response.data]
+        last_video_id = video_ids[-1]
+        wanted = [video_id for video_id in video_ids if video_id not in skip]
+        if not wanted:
+            continue
+        response = await execute(
+            supabase.table("video_overviews")
+            .select(f"video_id,{overview_columns()}")
+            .in_("video_id", wanted)
+        )
+        page = []
+        for row in response.data:
+            try:
+                overview = to_overview(row)
+            except Exception as e:
+                logger.error(f"Skipping unreadable overview {row['video_id']}: {str(e)}")
+                continue
+            if overview is not None:
+                page.append((row["video_id"], overview))
+        yield page
+
+
+def remove_index_files(path: str):
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+async def rebuild(index_path: str, supabase, missing_only: bool = False) -> int:
+    index = SearchIndex(index_path)
+    try:
+        if missing_only:
+            skip = frozenset(await run_blocking(index.indexed_video_ids))
+            added = 0
+            async for page in stored_overviews(supabase, skip):
+                added += await run_blocking(index.add, page)
+            await run_blocking(index.merge)
+            return added
+
+        rebuilt_path = f"{index_path}.rebuild"
+        remove_index_files(rebuilt_path)
+        rebuilt = SearchIndex(rebuilt_path)
+        try:
+            added = 0
+            async for page in stored_overviews(supabase):
+                added += await run_blocking(rebuilt.add, page)
+                await run_blocking(rebuilt.merge)
+                logger.info(f"Indexed {added} overviews")
+        finally:
+            rebuilt.close()
+        carried = await run_blocking(index.replace_with, rebuilt_path)
+        remove_index_files(rebuilt_path)
+        return added + carried
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the overview search index")
+    parser.add_argument("--index", default=SEARCH_INDEX_PATH, help="search index file")
+    parser.add_argument(
+        "--missing", action="store_true", help="only index overviews the index does not have"
+    )
+    args = parser.parse_args()
+    if not args.index:
+        parser.error("SEARCH_INDEX_PATH is empty; pass --index")
+
+    configure_logging()
+
+    async def run():
+        try:
+            return await rebuild(args.index, get_supabase_client(), args.missing)
+        finally:
+            await client_registry.close()
+
+    start = time.monotonic()
+    try:
+        indexed = asyncio.run(run())
+    finally:
+        shutdown_blocking_io()
+    print(f"indexed {indexed} overviews in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
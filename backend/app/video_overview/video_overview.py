@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, Request
-from pydantic import ValidationError, BaseModel
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError, BaseModel, Field
 
 from .video_overview_deps import (
+    EPHEMERAL_CACHE,
     assistant,
     get_anthropic_client,
     user,
@@ -9,22 +11,86 @@ from .video_overview_deps import (
 from .video_overview_schemas import (
     Chapter,
     ChapterData,
+    Job,
     KeyPoint,
+    SearchResponse,
     Transcript,
+    VideoMetadata,
     VideoOverview,
     VideoOverviewFunctionCallResponse,
 )
-from typing import List, Optional
+from functools import lru_cache
+from typing import Callable, Dict, List, Literal, Optional, Set, Tuple
+import asyncio
+import json
 import logging
+import os
+import time
+import orjson
 from .video_overview_deps import get_supabase_client
+from ..metrics import registry, span
+from .video_overview_admission import FREE, PRIORITY, AdmissionController
+from .video_overview_cache import (
+    CachedOverview,
+    make_cached_overview,
+    overview_cache,
+)
+from .video_overview_chunking import (
+    CHUNK_MAX_CHARS,
+    CHUNKED_GENERATION,
+    generate_chunked_chapters,
+    split_transcript_windows,
+)
+from .video_overview_codec import (
+    decode_overview_row,
+    encode_overview_row,
+    overview_body,
+    overview_columns,
+)
+from .video_overview_io import execute, run_blocking
+from .video_overview_jobs import JOB_STORE_PATH, JobQueue
+from .video_overview_parsing import ChapterStreamParser, parse_complete_chapters
+from .video_overview_rate_limit import Admission, get_rate_limiter
+from .video_overview_lease import (
+    LEASE_POLL_INTERVAL_S,
+    LEASE_WAIT_TIMEOUT_S,
+    get_generation_lease,
+    holding,
+)
+from .video_overview_search import (
+    SEARCH_MAX_QUERY_CHARS,
+    SEARCH_MAX_RESULTS,
+    get_search_index,
+)
+from .video_overview_singleflight import SingleFlight
+from .video_overview_stages import (
+    ShortCircuit,
+    Stage,
+    StageGraph,
+    stage_stats,
+    stage_timeout_s,
+)
+from .video_overview_transcript import (
+    TRANSCRIPT_TOKEN_BUDGET,
+    compact_transcript_text,
+    estimate_tokens,
+    transcript_text_after,
+)
+from .video_overview_transcript_fetch import get_transcript_fetcher, transcript_fetch_stats
 from fastapi import HTTPException
+from .video_overview_llm_router import Completion
 from .video_overview_services import (
-    net_api_limit_reached,
-    incr_api_usage,
+    fetch_and_store_transcript,
     get_claude_completion,
     get_transcript,
     get_video_metadata,
-    incr_user_rate_limit,
+    get_client_ip,
+    llm_router,
+    read_stored_transcript,
+    llm_usage,
+    metadata_batcher,
+    metadata_cache,
+    stream_claude_completion,
     user_rate_limit_exceeded,
 )
 
@@ -35,18 +101,23 @@ testing = False
 chapter_min_range = 3 if testing else 5
 chapter_max_range = 5 if testing else 30
 
+# stored overviews never change, so CDNs and browsers may keep them for good
+OVERVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-def get_system_prompt(existing_chapters: List[str] | None = None):
-    chapters_str = "\n".join(existing_chapters)
-    chapters_info = (
-        f"""The existing chapters are:
- {chapters_str}"""
-        if existing_chapters
-        else ""
-    )
-    return f"""Your job is to generate a video overview for the provided transcript. 
+# follow-up requests for the rest of a transcript when the output hits max_tokens
+GENERATION_MAX_CONTINUATIONS = int(os.getenv("GENERATION_MAX_CONTINUATIONS", "2"))
+
+generation_flight = SingleFlight()
+generation_admission = AdmissionController()
+generation_stats = {"lease_coalesced": 0}
+
+
+# Static, so it can be cached by the provider. Everything that varies per video
+# goes into get_transcript_prompt.
+def get_system_prompt():
+    return """Your job is to generate a video overview for the provided transcript. 
 The transcript might contain typos. Do your best to infer the correct text.
-Output about {chapter_min_range}-{chapter_max_range} chapters depending on the length and density of the transcript.
+Output the number of chapters requested alongside the transcript, depending on the length and density of the transcript.
 For each chapter, output the following:
 - a chapter title that encapsulates the current section
 - 2-8 key points to provide an overview of the chapter. Each key point is a sentence that is either a direct quote or an essential fact / detail.
@@ -54,9 +125,51 @@ For each chapter, output the following:
     - Key points are concise and entity dense, with concrete examples when relevant.
     - Key points can be a paraphrase or summary of a few sentences.
 - for each key point, output the start time of the beginning of the key point in the transcript.
-- 2-4 associations that a user might search or associate with this chapter. Each association should be a specific keyword or phrase.
+- 2-4 associations that a user might search or associate with this chapter. Each association should be a specific keyword or phrase."""
 
-{chapters_info}"""
+
+def get_transcript_prompt(
+    transcript_text: str,
+    existing_chapters: List[str] | None = None,
+    chapter_range: Tuple[int, int] = (chapter_min_range, chapter_max_range),
+):
+    chapters_str = "\n".join(existing_chapters or [])
+    chapters_info = (
+        f"""The existing chapters are:
+ {chapters_str}
+"""
+        if existing_chapters
+        else ""
+    )
+    return f"""Output about {chapter_range[0]}-{chapter_range[1]} chapters depending on the length and density of the transcript.
+{chapters_info}
+Here is the transcript: 
+{transcript_text}"""
+
+
+@lru_cache
+def get_prompt_prefix():
+    # Built once: the system prompt and the few-shot turn are identical for every
+    # request, and the cache breakpoint after the few-shot makes the provider
+    # reuse them instead of reprocessing them each time
+    system_prompt = [
+        {"type": "text", "text": get_system_prompt(), "cache_control": EPHEMERAL_CACHE}
+    ]
+    few_shot = [
+        user(
+            "Here is the transcript: \n<REDACTED transcript for 'How to Build An MVP'>"
+        ),
+        assistant(
+            [
+                {
+                    "type": "text",
+                    "text": get_example_output().model_dump_json(),
+                    "cache_control": EPHEMERAL_CACHE,
+                }
+            ]
+        ),
+    ]
+    return system_prompt, few_shot
 
 
 def get_example_output():
@@ -134,13 +247,10 @@ def get_example_output():
     )
 
 
-def get_timestamped_transcript_text(transcript: Transcript):
-    result = ""
-    for moment in transcript.moments:
-        time = moment.start
-        text = moment.text
-        result += f"{time}: {text}\n"
-    return result
+def get_timestamped_transcript_text(
+    transcript: Transcript, token_budget: Optional[int] = None
+):
+    return compact_transcript_text(transcript.moments, token_budget)
 
 
 class GenerateOverviewRequest(BaseModel):
@@ -156,100 +266,506 @@ async def generate_video_overview(
     body: GenerateOverviewRequest,
     supabase=Depends(get_supabase_client),
 ):
-    user_api_key = body.user_api_key
-    existing_overview = await get_video_overview(video_id, supabase)
-    if existing_overview:
-        return existing_overview
-
-    user_api_limit_reached = await user_rate_limit_exceeded(request, supabase)
-    if user_api_limit_reached:
-        if not user_api_key:
-            raise HTTPException(
-                status_code=429,
-                detail="Free tier quota exceeded. Please use your API key to continue.",
-            )
-        else:
-            anthropic_client = get_anthropic_client(True, user_api_key)
- 
-    else:
-        api_limit_reached = await net_api_limit_reached(supabase)
-        if not api_limit_reached:
-            anthropic_client = get_anthropic_client(False)
-            await incr_user_rate_limit(request, supabase)
-        else:
-            if not user_api_key:
-                raise HTTPException(
-                    status_code=429,
-                    detail="Total API limit reached right now. Please use your API key.",
+    cached = overview_cache.get(video_id)
+    if cached is not None:
+        return overview_response(cached, request)
+
+    graph = generation_graph(video_id, request, body.user_api_key, supabase)
+    try:
+        overview = await graph.result("generate")
+    except ShortCircuit as done:
+        overview = done.value
+    finally:
+        graph.cancel()
+    return overview_response(overview, request)
+
+
+# Streams each chapter as a server-sent event as soon as the model finishes it,
+# then a final "overview" event with the stored overview
+@router.post("/generate-overview-stream/{video_id}")
+async def generate_video_overview_stream(
+    video_id: str,
+    request: Request,
+    body: GenerateOverviewRequest,
+    supabase=Depends(get_supabase_client),
+):
+    cached = overview_cache.get(video_id)
+    if cached is not None:
+        return overview_event_response(cached)
+
+    chapter_queue: asyncio.Queue = asyncio.Queue()
+    graph = generation_graph(
+        video_id, request, body.user_api_key, supabase, on_chapter=chapter_queue.put_nowait
+    )
+    # rejections are plain HTTP errors, so wait for admission before streaming
+    try:
+        await graph.result("admit")
+    except ShortCircuit as done:
+        graph.cancel()
+        return overview_event_response(done.value)
+    except BaseException:
+        graph.cancel()
+        raise
+
+    async def run_generation():
+        try:
+            return await graph.result("generate")
+        finally:
+            chapter_queue.put_nowait(None)
+
+    async def events():
+        generation = asyncio.create_task(run_generation())
+        try:
+            while (chapter := await chapter_queue.get()) is not None:
+                yield sse_event("chapter", chapter.model_dump_json())
+            try:
+                overview = await generation
+            except HTTPException as e:
+                yield sse_event(
+                    "error", json.dumps({"status_code": e.status_code, "detail": e.detail})
                 )
-            else:
-                anthropic_client = get_anthropic_client(True, user_api_key)
+                return
+            except Exception as e:
+                logger.error(f"Error streaming video overview: {str(e)}")
+                yield sse_event("error", json.dumps({"status_code": 500, "detail": str(e)}))
+                return
+            yield sse_event("overview", overview.body.decode())
+        finally:
+            # a disconnected client stops waiting; a started generation carries on
+            graph.cancel()
 
-    logger.info(f"Generate new video overview for video_id: {video_id}")
-    await incr_api_usage(supabase)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def overview_event_response(overview: CachedOverview) -> StreamingResponse:
+    return StreamingResponse(
+        iter([sse_event("overview", overview.body.decode())]),
+        media_type="text/event-stream",
+    )
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+LOOKUP_TIMEOUT_S = stage_timeout_s("lookup", 10)
+ADMIT_TIMEOUT_S = stage_timeout_s("admit", 10)
+TRANSCRIPT_TIMEOUT_S = stage_timeout_s("transcript", 60)
+METADATA_TIMEOUT_S = stage_timeout_s("metadata", 15)
+JOIN_TIMEOUT_S = stage_timeout_s("join", 600)
+GENERATE_TIMEOUT_S = stage_timeout_s("generate", 600)
+
+
+# Stages of a generate request:
+#   lookup -> join -> slot -> admit -+-> transcript -+-> generate
+#   stored_transcript ---------------+               |
+#                                    +-> metadata ---+
+# Only the local transcript-store lookup starts with the database lookup.
+# slot waits for one of generation_admission's slots and holds it until
+# generate ends, and admit charges the quota only once it has one, so a
+# request shed with a 503 has cost nothing. The transcript API and YouTube are
+# not called until the request is admitted, so stored or in-flight overviews
+# and rejected requests never reach them.
+def generation_graph(
+    video_id: str,
+    request: Request,
+    user_api_key: Optional[str],
+    supabase,
+    on_chapter=None,
+) -> StageGraph:
+    async def lookup():
+        existing_overview = await read_video_overview(video_id, supabase)
+        if existing_overview:
+            raise ShortCircuit(existing_overview)
+
+    async def join(lookup):
+        # Another request is already generating this video: wait for it instead of
+        # paying for a second transcript fetch and completion
+        in_flight = generation_flight.join(video_id)
+        if in_flight is not None:
+            logger.info(f"Coalesced generate request for video_id: {video_id}")
+            raise ShortCircuit(await in_flight)
+
+    priority_class = PRIORITY if user_api_key else FREE
+
+    # the slot's release function, until the slot is given back
+    held_slot: List[Callable[[], None]] = []
+
+    async def slot(join):
+        held_slot.append(await generation_admission.acquire(priority_class))
+
+    def release_slot():
+        while held_slot:
+            held_slot.pop()()
+
+    async def admit(slot):
+        return await select_anthropic_client(request, user_api_key, supabase)
+
+    async def stored_transcript():
+        return await read_stored_transcript(video_id)
+
+    async def transcript(admit, stored_transcript):
+        if stored_transcript is not None:
+            return stored_transcript
+        # the fetch runs on a blocking-io thread that cancelling would not
+        # stop, so let it finish and reach the transcript store regardless
+        return await asyncio.shield(keep_running(fetch_and_store_transcript(video_id)))
+
+    async def metadata(admit):
+        return await get_video_metadata(video_id)
+
+    async def generate(admit, transcript, metadata):
+        async def admitted_generation(release):
+            try:
+                return await generate_with_lease(
+                    video_id, admit, supabase, on_chapter, fetched=(transcript, metadata)
+                )
+            finally:
+                release()
+
+        # the slot moves to the generation, which carries on if this request
+        # goes away; a request that joins another's generation keeps its slot
+        # until this stage ends
+        return await generation_flight.do(
+            video_id, lambda: admitted_generation(held_slot.pop())
+        )
+
+    graph = StageGraph(
+        [
+            Stage("lookup", lookup, timeout_s=LOOKUP_TIMEOUT_S),
+            Stage("join", join, ("lookup",), JOIN_TIMEOUT_S),
+            # the queue wait is bounded by GENERATION_QUEUE_TIMEOUT_S
+            Stage("slot", slot, ("join",)),
+            Stage("admit", admit, ("slot",), ADMIT_TIMEOUT_S),
+            Stage(
+                "stored_transcript",
+                stored_transcript,
+                timeout_s=TRANSCRIPT_TIMEOUT_S,
+                speculative=True,
+            ),
+            Stage(
+                "transcript",
+                transcript,
+                ("admit", "stored_transcript"),
+                TRANSCRIPT_TIMEOUT_S,
+            ),
+            Stage("metadata", metadata, ("admit",), METADATA_TIMEOUT_S),
+            Stage(
+                "generate", generate, ("admit", "transcript", "metadata"), GENERATE_TIMEOUT_S
+            ),
+        ]
+    ).start()
+    graph.when_done("generate", release_slot)
+    return graph
+
+
+# tasks that outlive the request that started them; the loop only keeps
+# weak references to tasks
+background_tasks: Set[asyncio.Task] = set()
+
+
+def keep_running(coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def select_anthropic_client(
+    request: Request, user_api_key: Optional[str], supabase
+):
+    if await admit_generation(request, user_api_key, supabase):
+        return get_anthropic_client(True, user_api_key)
+    return get_anthropic_client(False)
+
+
+# Charges the free tier or the caller's own key; returns True when the
+# generation has to run on user_api_key
+async def admit_generation(
+    request: Request, user_api_key: Optional[str], supabase
+) -> bool:
+    rate_limiter = get_rate_limiter()
+    client_ip = get_client_ip(request)
     # Note: for now I increment usage limits before even testing if the transcript is available
     # to prevent an attacker from repeatedly hitting the transcript API
     # TODO: This is unideal
+    if client_ip:
+        with span("rate_limit"):
+            admission = await rate_limiter.admit_free(client_ip, supabase)
+    else:
+        # When running locally, assume rate limit is exceeded
+        admission = Admission.USER_LIMIT
 
+    if admission == Admission.OK:
+        return False
+    if not user_api_key:
+        if admission == Admission.USER_LIMIT:
+            detail = "Free tier quota exceeded. Please use your API key to continue."
+        else:
+            detail = "Total API limit reached right now. Please use your API key."
+        raise HTTPException(status_code=429, detail=detail)
+    with span("rate_limit"):
+        await rate_limiter.record_api_usage(supabase)
+    return True
 
-    transcript = await get_transcript(video_id)
-    if not transcript:
-        raise HTTPException(
-            status_code=422,
-            detail="Unable to process request. Transcript not available for the given video ID.",
+
+# Gives back what admit_generation charged, for a generation that never started
+async def refund_generation(request: Request, uses_user_key: bool, supabase):
+    rate_limiter = get_rate_limiter()
+    try:
+        with span("rate_limit"):
+            if uses_user_key:
+                await rate_limiter.refund_api_usage(supabase)
+            else:
+                await rate_limiter.refund_free(get_client_ip(request), supabase)
+    except Exception as e:
+        logger.error(f"Error refunding generation quota: {str(e)}")
+
+
+async def generate_with_lease(
+    video_id: str, anthropic_client, supabase, on_chapter=None, fetched=None
+) -> CachedOverview:
+    lease = get_generation_lease()
+    if lease is None:
+        return await create_cached_overview(
+            video_id, anthropic_client, supabase, on_chapter, fetched
         )
-    transcript_text = get_timestamped_transcript_text(transcript)
 
-    video_metadata = await get_video_metadata(video_id)
-    chapters = [data.title for data in video_metadata.chapters]
-    if testing:
-        chapters = chapters[:chapter_max_range]
-    max_transcript_length = 20_000 if testing else 200_000
-    if len(transcript_text) > max_transcript_length:
-        logger.warning(
-            f"transcript length is {len(transcript_text)}, truncating to {max_transcript_length}"
+    deadline = time.monotonic() + LEASE_WAIT_TIMEOUT_S
+    while True:
+        if await lease.acquire(video_id, supabase):
+            async with holding(lease, video_id, supabase):
+                # the previous holder may have finished between our lookups
+                existing_overview = await load_video_overview(video_id, supabase)
+                if existing_overview:
+                    return existing_overview
+                return await create_cached_overview(
+                    video_id, anthropic_client, supabase, on_chapter, fetched
+                )
+
+        existing_overview = await load_video_overview(video_id, supabase)
+        if existing_overview:
+            generation_stats["lease_coalesced"] += 1
+            return existing_overview
+        if time.monotonic() > deadline:
+            raise HTTPException(
+                status_code=503,
+                detail="Overview generation is still in progress. Please try again shortly.",
+            )
+        await asyncio.sleep(LEASE_POLL_INTERVAL_S)
+
+
+async def create_cached_overview(
+    video_id: str, anthropic_client, supabase, on_chapter=None, fetched=None
+) -> CachedOverview:
+    video_overview = await create_video_overview(
+        video_id, anthropic_client, supabase, on_chapter, fetched
+    )
+    return overview_cache.get(video_id) or make_cached_overview(overview_body(video_overview))
+
+
+def to_chapter(chapter: ChapterData) -> Chapter:
+    return Chapter(
+        title=chapter.title,
+        key_points=[
+            KeyPoint(text=point, time=time)
+            for point, time in zip(chapter.key_points, chapter.key_point_start_times)
+        ],
+        associations=chapter.associations,
+    )
+
+
+def completion_is_usable(completion: Completion) -> bool:
+    # a complete overview, or at least one whole chapter of a truncated one
+    result = "{" + completion.text
+    if completion.stop_reason == "max_tokens":
+        return bool(parse_complete_chapters(result))
+    try:
+        VideoOverviewFunctionCallResponse.model_validate_json(
+            result[: result.rfind("}") + 1]
         )
-        transcript_text = transcript_text[:max_transcript_length]
+        return True
+    except ValidationError:
+        return False
+
 
-    example_output = get_example_output()
+async def generate_chapters(
+    transcript_text: str,
+    existing_chapters: List[str],
+    anthropic_client,
+    chapter_range: Tuple[int, int] = (chapter_min_range, chapter_max_range),
+    on_chapter: Optional[Callable[[Chapter], None]] = None,
+    continuations: int = GENERATION_MAX_CONTINUATIONS,
+) -> List[Chapter]:
+    system_prompt, few_shot = get_prompt_prefix()
     messages = [
-        user(
-            "Here is the transcript: \n<REDACTED transcript for 'How to Build An MVP'>"
-        ),
-        assistant(example_output.model_dump_json()),
-        user(f"Here is the transcript: \n{transcript_text}"),
+        *few_shot,
+        user(get_transcript_prompt(transcript_text, existing_chapters, chapter_range)),
         assistant("Here is the JSON overview:\n{"),
     ]
-    system_prompt = get_system_prompt(existing_chapters=chapters)
-    content = await get_claude_completion(messages, system_prompt, anthropic_client)
+    if on_chapter is None:
+        with span("llm"):
+            completion = await get_claude_completion(
+                messages, system_prompt, anthropic_client, completion_is_usable
+            )
+    else:
+        parser = ChapterStreamParser()
+        parser.feed("{")
+
+        def on_text(text: str):
+            for chapter_json in parser.feed(text):
+                try:
+                    on_chapter(to_chapter(ChapterData.model_validate_json(chapter_json)))
+                except ValidationError as e:
+                    # the final parse below decides whether the response is usable
+                    logger.warning(f"Skipping malformed streamed chapter: {str(e)}")
 
-    result = "{" + content
+        with span("llm"):
+            completion = await stream_claude_completion(
+                messages, system_prompt, anthropic_client, on_text, completion_is_usable
+            )
 
-    json_end = result.rfind("}")
+    result = "{" + completion.text
 
-    if json_end == -1:
-        raise ValueError("No valid JSON found in the response")
+    if completion.stop_reason != "max_tokens":
+        json_end = result.rfind("}")
+        try:
+            with span("parse"):
+                response = VideoOverviewFunctionCallResponse.model_validate_json(
+                    result[: json_end + 1]
+                )
+            return [to_chapter(chapter) for chapter in response.chapters]
+        except ValidationError as e:
+            logger.error(f"JSON validation error: {str(e)}")
 
-    json_content = result[: json_end + 1]
+    # Truncated or partly invalid output: keep every chapter that parses, and
+    # if the output was cut off, ask for the rest of the transcript only
+    with span("parse"):
+        chapter_data = parse_complete_chapters(result)
+    if not chapter_data:
+        raise ValueError("No valid chapters found in the response")
+    chapters = [to_chapter(chapter) for chapter in chapter_data]
+    if completion.stop_reason != "max_tokens":
+        return chapters
+    if continuations == 0:
+        logger.warning(f"Output still truncated, keeping {len(chapters)} chapters")
+        return chapters
 
+    last_time = max(
+        (point.time for chapter in chapters for point in chapter.key_points), default=0
+    )
+    remaining_text = transcript_text_after(transcript_text, last_time)
+    if not remaining_text:
+        return chapters
+    logger.warning(
+        f"Output hit max_tokens after {len(chapters)} chapters, continuing after {last_time:.0f}s"
+    )
+    remaining_range = (
+        max(1, chapter_range[0] - len(chapters)),
+        max(1, chapter_range[1] - len(chapters)),
+    )
+
+    def continues(chapter: Chapter) -> bool:
+        # the continuation may repeat the chapter the cut-off one belonged to
+        return bool(chapter.key_points) and chapter.key_points[0].time > last_time
+
+    def on_continued_chapter(chapter: Chapter):
+        # streamed chapters pass the same filter as the returned ones
+        if continues(chapter):
+            on_chapter(chapter)
+
+    # the video's own chapter titles cover the whole video, so they are not
+    # passed on to a request about its tail
+    rest = await generate_chapters(
+        remaining_text,
+        [],
+        anthropic_client,
+        remaining_range,
+        on_continued_chapter if on_chapter is not None else None,
+        continuations - 1,
+    )
+    return chapters + [chapter for chapter in rest if continues(chapter)]
+
+
+# fetched: the (transcript, metadata) pair when the caller already has them
+async def create_video_overview(
+    video_id: str,
+    anthropic_client,
+    supabase,
+    on_chapter=None,
+    fetched: Optional[Tuple[Optional[Transcript], VideoMetadata]] = None,
+) -> VideoOverview:
+    logger.info(f"Generate new video overview for video_id: {video_id}")
+
+    if fetched is not None:
+        transcript, video_metadata = fetched
+    else:
+        with span("transcript"):
+            transcript = await get_transcript(video_id)
+    if not transcript:
+        raise HTTPException(
+            status_code=422,
+            detail="Unable to process request. Transcript not available for the given video ID.",
+        )
+
+    if fetched is None:
+        with span("metadata"):
+            video_metadata = await get_video_metadata(video_id)
+
+    video_overview = await build_video_overview(
+        transcript, video_metadata, anthropic_client, on_chapter
+    )
     try:
-        response = VideoOverviewFunctionCallResponse.model_validate_json(json_content)
-        formatted_chapters = [
-            Chapter(
-                title=chapter.title,
-                key_points=[
-                    KeyPoint(text=point, time=time)
-                    for point, time in zip(
-                        chapter.key_points, chapter.key_point_start_times
-                    )
-                ],
-                associations=chapter.associations,
+        await save_video_overviews([(video_id, video_overview)], supabase)
+        logger.info(f"Video overview saved for video_id: {video_id}")
+    except Exception as e:
+        logger.error(f"Error saving video overview: {str(e)}")
+        overview_cache.invalidate(video_id)
+
+    return video_overview
+
+
+async def build_video_overview(
+    transcript: Transcript, video_metadata: VideoMetadata, anthropic_client, on_chapter=None
+) -> VideoOverview:
+    transcript_text = get_timestamped_transcript_text(transcript)
+    chapters = [data.title for data in video_metadata.chapters]
+    if testing:
+        chapters = chapters[:chapter_max_range]
+
+    if CHUNKED_GENERATION and len(transcript_text) > CHUNK_MAX_CHARS:
+        windows = split_transcript_windows(transcript, video_metadata, CHUNK_MAX_CHARS)
+        logger.info(
+            f"transcript length is {len(transcript_text)}, generating over {len(windows)} windows"
+        )
+        formatted_chapters = await generate_chunked_chapters(
+            windows,
+            lambda window, chapter_range: generate_chapters(
+                get_timestamped_transcript_text(Transcript(moments=window.moments)),
+                window.existing_chapters,
+                anthropic_client,
+                chapter_range,
+            ),
+            (chapter_min_range, chapter_max_range),
+        )
+        # windows finish out of order, so chapters are only final after the merge
+        if on_chapter is not None:
+            for chapter in formatted_chapters:
+                on_chapter(chapter)
+    else:
+        token_budget = 5_000 if testing else TRANSCRIPT_TOKEN_BUDGET
+        if estimate_tokens(transcript_text) > token_budget:
+            logger.warning(
+                f"transcript is about {estimate_tokens(transcript_text)} tokens, compacting to {token_budget}"
             )
-            for chapter in response.chapters
-        ]
-    except ValidationError as e:
-        logger.error(f"JSON validation error: {str(e)}")
-        raise ValueError("Invalid JSON structure in the response")
+            transcript_text = get_timestamped_transcript_text(transcript, token_budget)
+        formatted_chapters = await generate_chapters(
+            transcript_text, chapters, anthropic_client, on_chapter=on_chapter
+        )
 
     video_overview = VideoOverview(
         video_title=video_metadata.title,
@@ -258,42 +774,286 @@ async def generate_video_overview(
         duration_iso=video_metadata.duration_iso,
         channel_title=video_metadata.channel_title,
     )
-    video_overview_dict = video_overview.model_dump()
+    return video_overview
+
 
+async def save_video_overviews(overviews: List[Tuple[str, VideoOverview]], supabase):
+    # one insert for the whole list; raises if the insert fails
+    with span("insert"):
+        await execute(
+            supabase.table("video_overviews").insert(
+                [
+                    {
+                        "video_id": video_id,
+                        "video_title": video_overview.video_title,
+                        **encode_overview_row(video_overview),
+                    }
+                    for video_id, video_overview in overviews
+                ]
+            )
+        )
+    for video_id, video_overview in overviews:
+        # replaces any stale entry for this id
+        overview_cache.set(video_id, make_cached_overview(overview_body(video_overview)))
+    await index_video_overviews(overviews)
+
+
+# at most one segment merge per worker at a time, off the request path
+search_merge: Optional[asyncio.Task] = None
+
+
+async def index_video_overviews(overviews: List[Tuple[str, VideoOverview]]):
+    # the overviews are saved either way; a missed one comes back with
+    # python -m app.rebuild_search_index --missing
+    global search_merge
+    search_index = get_search_index()
+    if search_index is None:
+        return
     try:
-        supabase.table("video_overviews").insert(
-            {
-                "video_id": video_id,
-                "video_title": video_metadata.title,
-                "overview": video_overview_dict,
-            }
-        ).execute()
-        logger.info(f"Video overview saved for video_id: {video_id}")
+        with span("search_index"):
+            await run_blocking(search_index.add, overviews)
     except Exception as e:
-        logger.error(f"Error saving video overview: {str(e)}")
+        logger.error(f"Error indexing video overviews: {str(e)}")
+        return
+    if search_index.merge_due() and (search_merge is None or search_merge.done()):
+        search_merge = asyncio.create_task(merge_search_index(search_index))
+
+
+async def merge_search_index(search_index):
+    try:
+        await run_blocking(search_index.merge)
+    except Exception as e:
+        logger.error(f"Error merging search index segments: {str(e)}")
+
+
+@router.get("/search")
+async def search_video_overviews(
+    q: str = Query(min_length=1, max_length=SEARCH_MAX_QUERY_CHARS),
+    limit: int = Query(10, ge=1, le=SEARCH_MAX_RESULTS),
+) -> SearchResponse:
+    search_index = get_search_index()
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Search is not enabled on this server.")
+    with span("search"):
+        return await run_blocking(search_index.search, q, limit)
+
+
+@router.post("/jobs/generate-overview/{video_id}", status_code=202)
+async def enqueue_video_overview(
+    video_id: str,
+    request: Request,
+    body: GenerateOverviewRequest,
+    supabase=Depends(get_supabase_client),
+) -> Job:
+    if await load_video_overview(video_id, supabase):
+        return await job_queue.record_finished(video_id)
+    # reject before charging any quota when the queue is full
+    job_queue.ensure_capacity()
+
+    async def admit() -> Optional[str]:
+        uses_user_key = await admit_generation(request, body.user_api_key, supabase)
+        return body.user_api_key if uses_user_key else None
+
+    # concurrent requests for one video share a job, and only its creator pays
+    return await job_queue.find_active_or_enqueue(
+        video_id,
+        admit,
+        lambda user_api_key: refund_generation(request, user_api_key is not None, supabase),
+    )
 
-    return video_overview
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Job:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def run_generation_job(job: Job, user_api_key: Optional[str]):
+    if job.uses_user_key and user_api_key is None:
+        # keys only live in memory, so they do not survive a restart
+        raise HTTPException(
+            status_code=410,
+            detail="The job was interrupted. Please submit it again with your API key.",
+        )
+    anthropic_client = (
+        get_anthropic_client(True, user_api_key)
+        if job.uses_user_key
+        else get_anthropic_client(False)
+    )
+    supabase = get_supabase_client()
+    await generation_flight.do(
+        job.video_id,
+        lambda: generate_with_lease(job.video_id, anthropic_client, supabase),
+    )
+
+
+job_queue = JobQueue(JOB_STORE_PATH, run_generation_job)
 
 
 @router.get("/get-overview/{video_id}")
 async def get_video_overview(
-    video_id: str, supabase=Depends(get_supabase_client)
+    video_id: str, request: Request, supabase=Depends(get_supabase_client)
 ) -> Optional[VideoOverview]:
-    try:
-        result = (
-            supabase.table("video_overviews")
-            .select("overview")
-            .eq("video_id", video_id)
-            .execute()
+    overview = await load_video_overview(video_id, supabase)
+    if overview is None:
+        # the overview may be generated any moment, so never cache the miss
+        return Response(
+            content=b"null",
+            media_type="application/json",
+            headers={"Cache-Control": "no-store"},
         )
-        if result.data:
-            return VideoOverview(**result.data[0]["overview"])
-        else:
+    return overview_response(overview, request)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def overview_response(
+    overview: CachedOverview, request: Optional[Request] = None
+) -> Response:
+    headers = {"ETag": overview.etag, "Cache-Control": OVERVIEW_CACHE_CONTROL}
+    if request is not None and etag_matches(
+        request.headers.get("if-none-match"), overview.etag
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=overview.body, media_type="application/json", headers=headers
+    )
+
+
+# Returns the serialized overview; the stored JSON is re-serialized once, into
+# the same bytes a fresh generation caches, and cache hits skip supabase too
+async def load_video_overview(video_id: str, supabase) -> Optional[CachedOverview]:
+    cached = overview_cache.get(video_id)
+    if cached is not None:
+        return cached
+    return await read_video_overview(video_id, supabase)
+
+
+# The database half of load_video_overview; fills the cache on a hit
+async def read_video_overview(video_id: str, supabase) -> Optional[CachedOverview]:
+    try:
+        with span("overview_read"):
+            result = await execute(
+                supabase.table("video_overviews")
+                .select(overview_columns())
+                .eq("video_id", video_id)
+            )
+        if not result.data:
             return None
+        with span("overview_decode"):
+            body = decode_overview_row(result.data[0])
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error retrieving video overview: {str(e)}"
         )
+    if body is None:
+        return None
+    overview = make_cached_overview(body)
+    overview_cache.set(video_id, overview)
+    return overview
+
+
+GET_OVERVIEWS_MAX_IDS = 100
+
+# what a listing view can ask for instead of whole overviews
+OverviewField = Literal[
+    "video_title",
+    "channel_title",
+    "published_iso",
+    "duration_iso",
+    "chapter_titles",
+    "chapters",
+]
+
+
+class GetOverviewsRequest(BaseModel):
+    video_ids: List[str] = Field(min_length=1, max_length=GET_OVERVIEWS_MAX_IDS)
+    fields: Optional[List[OverviewField]] = None
+
+
+# Response: {"overviews": {video_id: overview}, "missing": [video_id, ...]}.
+# Without `fields` each overview is its cached body spliced in as-is.
+@router.post("/get-overviews")
+async def get_video_overviews(
+    body: GetOverviewsRequest, supabase=Depends(get_supabase_client)
+) -> Response:
+    video_ids = list(dict.fromkeys(body.video_ids))
+    overviews = await load_video_overviews(video_ids, supabase)
+    missing = orjson.dumps([video_id for video_id in video_ids if video_id not in overviews])
+    if body.fields is None:
+        entries = b",".join(
+            orjson.dumps(video_id) + b":" + overview.body
+            for video_id, overview in overviews.items()
+        )
+    else:
+        entries = b",".join(
+            orjson.dumps(video_id)
+            + b":"
+            + orjson.dumps(project_overview(orjson.loads(overview.body), body.fields))
+            for video_id, overview in overviews.items()
+        )
+    return Response(
+        content=b'{"overviews":{' + entries + b'},"missing":' + missing + b"}",
+        media_type="application/json",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+def project_overview(overview: dict, fields: List[str]) -> dict:
+    projected = {}
+    for field in fields:
+        if field == "chapter_titles":
+            projected[field] = [chapter["title"] for chapter in overview["chapters"]]
+        else:
+            projected[field] = overview[field]
+    return projected
+
+
+# One `in` query for every id that is not cached; ids without a stored
+# overview are left out of the result
+async def load_video_overviews(
+    video_ids: List[str], supabase
+) -> Dict[str, CachedOverview]:
+    overviews = {}
+    uncached = []
+    for video_id in video_ids:
+        cached = overview_cache.get(video_id)
+        if cached is not None:
+            overviews[video_id] = cached
+        else:
+            uncached.append(video_id)
+    if uncached:
+        try:
+            with span("overview_read"):
+                result = await execute(
+                    supabase.table("video_overviews")
+                    .select(f"video_id,{overview_columns()}")
+                    .in_("video_id", uncached)
+                )
+            with span("overview_decode"):
+                rows = [(row["video_id"], decode_overview_row(row)) for row in result.data]
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Error retrieving video overviews: {str(e)}"
+            )
+        for video_id, body in rows:
+            if body is None:
+                continue
+            overview = make_cached_overview(body)
+            overview_cache.set(video_id, overview)
+            overviews[video_id] = overview
+    # keep the request order
+    return {video_id: overviews[video_id] for video_id in video_ids if video_id in overviews}
 
 
 # @router.get("/get-transcript/{video_id}")
@@ -319,4 +1079,170 @@ async def get_video_overview(
 # used for testing
 @router.get("/rate-limit-exceeded")
 async def rate_limit_exceeded(request: Request, supabase=Depends(get_supabase_client)):
-    return await user_rate_limit_exceeded(request, supabase)
\ No newline at end of file
+    return await user_rate_limit_exceeded(request, supabase)
+
+
+@router.get("/stats")
+async def get_stats():
+    return {
+        "generation": {
+            "started": generation_flight.started,
+            "coalesced": generation_flight.coalesced,
+            "lease_coalesced": generation_stats["lease_coalesced"],
+            "in_flight": generation_flight.in_flight_count(),
+        },
+        "overview_cache": overview_cache.stats(),
+        "video_metadata": {
+            "cache_hits": metadata_cache.hits,
+            "cache_misses": metadata_cache.misses,
+            "batches": metadata_batcher.batches,
+            "ids_fetched": metadata_batcher.keys_fetched,
+        },
+        "admission": generation_admission.summary(),
+        "jobs": {"pending": job_queue.pending_count()},
+        "stages": stage_stats,
+        "llm_usage": llm_usage,
+        "llm_router": llm_router.summary(),
+        "search": get_search_index().summary() if get_search_index() else None,
+        "transcript_fetch": get_transcript_fetcher().summary(),
+        "rate_limit": {
+            "cached_rejections": get_rate_limiter().cached_rejections,
+        },
+    }
+
+
+registry.register_callback(
+    "video_overview_cache_requests_total",
+    "Overview cache lookups by result",
+    "counter",
+    lambda: {"hit": overview_cache.hits, "miss": overview_cache.misses},
+    label="result",
+)
+registry.register_callback(
+    "video_overview_cache_evictions_total",
+    "Overview cache entries evicted for the byte budget",
+    "counter",
+    lambda: overview_cache.evictions,
+)
+registry.register_callback(
+    "video_overview_cache_bytes",
+    "Bytes held by the overview cache",
+    "gauge",
+    lambda: overview_cache.size_bytes,
+)
+registry.register_callback(
+    "video_overview_generations_total",
+    "Generate requests by how they were served",
+    "counter",
+    lambda: {
+        "started": generation_flight.started,
+        "coalesced": generation_flight.coalesced,
+        "lease_coalesced": generation_stats["lease_coalesced"],
+    },
+    label="outcome",
+)
+registry.register_callback(
+    "video_overview_generations_in_flight",
+    "Generations currently running in this worker",
+    "gauge",
+    generation_flight.in_flight_count,
+)
+registry.register_callback(
+    "video_overview_admission_in_flight",
+    "Generations holding an admission slot",
+    "gauge",
+    lambda: generation_admission.in_flight,
+)
+registry.register_callback(
+    "video_overview_admission_queue_depth",
+    "Generate requests waiting for an admission slot by priority class",
+    "gauge",
+    lambda: {
+        PRIORITY: generation_admission.queued(PRIORITY),
+        FREE: generation_admission.queued(FREE),
+    },
+    label="class",
+)
+registry.register_callback(
+    "video_overview_admission_admitted_total",
+    "Generate requests admitted by priority class",
+    "counter",
+    lambda: dict(generation_admission.admitted),
+    label="class",
+)
+registry.register_callback(
+    "video_overview_admission_shed_total",
+    "Generate requests turned away with a 503 by reason",
+    "counter",
+    lambda: dict(generation_admission.shed),
+    label="reason",
+)
+registry.register_callback(
+    "video_overview_search_documents",
+    "Overviews in the search index",
+    "gauge",
+    lambda: get_search_index().summary()["documents"] if get_search_index() else 0,
+)
+registry.register_callback(
+    "video_overview_search_queries_total",
+    "Search queries served",
+    "counter",
+    lambda: get_search_index().queries if get_search_index() else 0,
+)
+registry.register_callback(
+    "video_overview_stage_events_total",
+    "Generation pipeline runs, short circuits, stage timeouts and cancelled stages",
+    "counter",
+    lambda: dict(stage_stats),
+    label="event",
+)
+registry.register_callback(
+    "video_overview_llm_tokens_total",
+    "LLM tokens by kind",
+    "counter",
+    lambda: {key: value for key, value in llm_usage.items() if key != "requests"},
+    label="kind",
+)
+registry.register_callback(
+    "video_overview_llm_router_events_total",
+    "Hedged requests, hedges won by the backup, failovers and unusable completions",
+    "counter",
+    lambda: {
+        "hedge": llm_router.hedges,
+        "hedge_win": llm_router.hedge_wins,
+        "failover": llm_router.failovers,
+        "invalid": llm_router.invalid,
+    },
+    label="event",
+)
+registry.register_callback(
+    "video_overview_transcript_fetch_events_total",
+    "Transcript fetches, attempts, retries, errors, proxy rotations and circuit breaker events",
+    "counter",
+    lambda: dict(transcript_fetch_stats),
+    label="event",
+)
+registry.register_callback(
+    "video_overview_transcript_breaker_open",
+    "1 while transcript fetches fail fast because the proxy looks down",
+    "gauge",
+    lambda: int(get_transcript_fetcher().breaker.state == "open"),
+)
+registry.register_callback(
+    "video_overview_llm_requests_total",
+    "LLM completions",
+    "counter",
+    lambda: llm_usage["requests"],
+)
+registry.register_callback(
+    "video_overview_metadata_batches_total",
+    "videos.list calls issued by the metadata batcher",
+    "counter",
+    lambda: metadata_batcher.batches,
+)
+registry.register_callback(
+    "video_overview_jobs_pending",
+    "Generation jobs waiting for a worker",
+    "gauge",
+    job_queue.pending_count,
+)
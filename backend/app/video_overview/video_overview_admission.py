@@ -0,0 +1,154 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+# Caps the generations (transcript + LLM calls) one worker runs at a time.
+# Requests over the limit wait in a bounded queue; once that is full they are
+# turned away at once with a 503 instead of piling up behind the LLM.
+GENERATION_MAX_IN_FLIGHT = int(os.getenv("GENERATION_MAX_IN_FLIGHT", "16"))
+GENERATION_MAX_QUEUED = int(os.getenv("GENERATION_MAX_QUEUED", "32"))
+GENERATION_QUEUE_TIMEOUT_S = float(os.getenv("GENERATION_QUEUE_TIMEOUT_S", "30"))
+# Retry-After before any generation has finished, and the most ever suggested
+GENERATION_RETRY_AFTER_S = int(os.getenv("GENERATION_RETRY_AFTER_S", "10"))
+GENERATION_RETRY_AFTER_MAX_S = 120
+
+PRIORITY = "priority"
+FREE = "free"
+
+
+class AdmissionController:
+    # Requests with their own API key (PRIORITY) are woken before free-tier
+    # ones, and a priority request arriving at a full queue takes the place of
+    # the newest free-tier waiter, which is shed.
+    def __init__(
+        self,
+        max_in_flight: int = GENERATION_MAX_IN_FLIGHT,
+        max_queued: int = GENERATION_MAX_QUEUED,
+        queue_timeout_s: float = GENERATION_QUEUE_TIMEOUT_S,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout_s = queue_timeout_s
+        self.in_flight = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {PRIORITY: deque(), FREE: deque()}
+        self.admitted = {PRIORITY: 0, FREE: 0}
+        self.shed = {"queue_full": 0, "queue_timeout": 0, "displaced": 0}
+        # moving average of how long a slot is held
+        self.service_time_s: Optional[float] = None
+
+    def queued(self, priority_class: Optional[str] = None) -> int:
+        if priority_class is not None:
+            return len(self.waiters[priority_class])
+        return sum(len(queue) for queue in self.waiters.values())
+
+    def has_free_slot(self) -> bool:
+        return self.in_flight < self.max_in_flight and not self.queued()
+
+    def retry_after_s(self) -> int:
+        if self.service_time_s is None:
+            return GENERATION_RETRY_AFTER_S
+        # roughly when the current queue will have drained
+        drain_s = self.service_time_s * (self.queued() + 1) / self.max_in_flight
+        return max(1, min(GENERATION_RETRY_AFTER_MAX_S, math.ceil(drain_s)))
+
+    def overloaded(self, reason: str) -> HTTPException:
+        self.shed[reason] += 1
+        return HTTPException(
+            status_code=503,
+            detail="Too many overviews are being generated right now. Please try again shortly.",
+            headers={"Retry-After": str(self.retry_after_s())},
+        )
+
+    def ensure_capacity(self, priority_class: str):
+        # cheap check before the caller spends anything on the request
+        if self.has_free_slot() or self.queued() < self.max_queued:
+            return
+        if priority_class == PRIORITY and self.waiters[FREE]:
+            return
+        raise self.overloaded("queue_full")
+
+    async def acquire(self, priority_class: str) -> Callable[[], None]:
+        # waits for a slot and returns the function that gives it back, for
+        # holders that cannot wrap their work in `slot`; extra calls do nothing
+        await self._acquire(priority_class)
+        self.admitted[priority_class] += 1
+        start = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            held_s = time.monotonic() - start
+            self.service_time_s = (
+                held_s if self.service_time_s is None else 0.8 * self.service_time_s + 0.2 * held_s
+            )
+            self._release()
+
+        return release
+
+    @asynccontextmanager
+    async def slot(self, priority_class: str):
+        release = await self.acquire(priority_class)
+        try:
+            yield
+        finally:
+            release()
+
+    async def _acquire(self, priority_class: str):
+        if self.has_free_slot():
+            self.in_flight += 1
+            return
+        self.ensure_capacity(priority_class)
+        if self.queued() >= self.max_queued:
+            # only reachable for PRIORITY with free-tier requests waiting
+            displaced = self.waiters[FREE].pop()
+            displaced.set_exception(self.overloaded("displaced"))
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self.waiters[priority_class]
+        queue.append(waiter)
+        try:
+            # _release hands its slot straight to the waiter, so in_flight
+            # already counts it when this returns
+            await asyncio.wait_for(waiter, self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            if waiter in queue:
+                queue.remove(waiter)
+            elif waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                return
+            raise self.overloaded("queue_timeout")
+        except asyncio.CancelledError:
+            if waiter in queue:
+                queue.remove(waiter)
+            elif waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # the slot was handed over just as the caller went away
+                self._release()
+            raise
+
+    def _release(self):
+        for priority_class in (PRIORITY, FREE):
+            queue = self.waiters[priority_class]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.in_flight -= 1
+
+    def summary(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": {PRIORITY: self.queued(PRIORITY), FREE: self.queued(FREE)},
+            "max_queued": self.max_queued,
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+        }
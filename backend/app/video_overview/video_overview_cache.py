@@ -0,0 +1,80 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+OVERVIEW_CACHE_MAX_BYTES = int(os.getenv("OVERVIEW_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+OVERVIEW_CACHE_TTL_S = float(os.getenv("OVERVIEW_CACHE_TTL_S", "3600"))
+
+
+class CachedOverview(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def make_cached_overview(body: bytes) -> CachedOverview:
+    # Stored overviews are immutable, so a hash of the serialized body is a strong validator
+    return CachedOverview(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+class OverviewCache:
+    # LRU of already-serialized response bodies, bounded by total bytes and entry age.
+    # Only touched from the event loop, so no locking.
+    def __init__(self, max_bytes: int, ttl_s: float):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[CachedOverview, float]]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[CachedOverview]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_s:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: CachedOverview):
+        if len(value.body) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, time.monotonic())
+        self.size_bytes += len(value.body)
+        while self.size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[0].body)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+overview_cache = OverviewCache(OVERVIEW_CACHE_MAX_BYTES, OVERVIEW_CACHE_TTL_S)
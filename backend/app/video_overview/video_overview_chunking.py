@@ -0,0 +1,127 @@
+import asyncio
+import math
+import os
+from typing import Awaitable, Callable, List, Tuple
+
+from .video_overview_schemas import Chapter, Moment, Transcript, VideoMetadata
+
+# Long transcripts are split into time-aligned windows that are summarized
+# concurrently, so wall-clock time follows the longest window instead of the
+# total transcript length.
+CHUNKED_GENERATION = os.getenv("CHUNKED_GENERATION", "true").lower() == "true"
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "60000"))
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+
+class TranscriptWindow:
+    def __init__(self, moments: List[Moment], existing_chapters: List[str]):
+        self.moments = moments
+        self.existing_chapters = existing_chapters
+
+    @property
+    def start(self) -> float:
+        return self.moments[0].start
+
+
+def moment_line_length(moment: Moment) -> int:
+    # moments are merged into segments that share one short timestamp, so a
+    # moment costs about its text in the compacted prompt
+    return len(moment.text) + 1
+
+
+def split_transcript_windows(
+    transcript: Transcript, video_metadata: VideoMetadata, max_window_chars: int
+) -> List[TranscriptWindow]:
+    # Cut at YouTube chapter boundaries when there are any, then pack whole
+    # sections into windows. Sections longer than a window are split on moments.
+    boundaries = sorted({c.time_in_secs for c in video_metadata.chapters if c.time_in_secs > 0})
+    sections: List[List[Moment]] = []
+    current: List[Moment] = []
+    boundary_index = 0
+    for moment in transcript.moments:
+        while boundary_index < len(boundaries) and moment.start >= boundaries[boundary_index]:
+            if current:
+                sections.append(current)
+                current = []
+            boundary_index += 1
+        current.append(moment)
+    if current:
+        sections.append(current)
+
+    windows: List[List[Moment]] = []
+    window: List[Moment] = []
+    size = 0
+    for section in sections:
+        section_size = sum(moment_line_length(m) for m in section)
+        if window and size + section_size > max_window_chars:
+            windows.append(window)
+            window, size = [], 0
+        for moment in section:
+            length = moment_line_length(moment)
+            if window and size + length > max_window_chars:
+                windows.append(window)
+                window, size = [], 0
+            window.append(moment)
+            size += length
+    if window:
+        windows.append(window)
+
+    result = []
+    for i, moments in enumerate(windows):
+        end = windows[i + 1][0].start if i + 1 < len(windows) else math.inf
+        chapter_titles = [
+            c.title for c in video_metadata.chapters if moments[0].start <= c.time_in_secs < end
+        ]
+        result.append(TranscriptWindow(moments, chapter_titles))
+    return result
+
+
+def window_chapter_range(n_windows: int, chapter_range: Tuple[int, int]) -> Tuple[int, int]:
+    # spread the overall chapter budget over the windows
+    min_chapters, max_chapters = chapter_range
+    window_min = max(1, math.ceil(min_chapters / n_windows))
+    window_max = max(window_min + 1, max_chapters // n_windows)
+    return window_min, window_max
+
+
+def chapter_start(chapter: Chapter) -> float:
+    return chapter.key_points[0].time if chapter.key_points else math.inf
+
+
+def merge_window_chapters(window_chapters: List[List[Chapter]]) -> List[Chapter]:
+    merged: List[Chapter] = []
+    for chapters in window_chapters:
+        for chapter in sorted(chapters, key=chapter_start):
+            previous = merged[-1] if merged else None
+            # windows cut mid-topic can both emit the same chapter
+            if previous and previous.title.casefold() == chapter.title.casefold():
+                previous.key_points.extend(chapter.key_points)
+                previous.associations.extend(
+                    a for a in chapter.associations if a not in previous.associations
+                )
+            else:
+                merged.append(chapter)
+    return merged
+
+
+async def generate_chunked_chapters(
+    windows: List[TranscriptWindow],
+    generate_window: Callable[[TranscriptWindow, Tuple[int, int]], Awaitable[List[Chapter]]],
+    chapter_range: Tuple[int, int],
+    concurrency: int = CHUNK_CONCURRENCY,
+) -> List[Chapter]:
+    semaphore = asyncio.Semaphore(concurrency)
+    per_window_range = window_chapter_range(len(windows), chapter_range)
+
+    async def run(window: TranscriptWindow):
+        async with semaphore:
+            return await generate_window(window, per_window_range)
+
+    tasks = [asyncio.create_task(run(window)) for window in windows]
+    try:
+        window_chapters = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return merge_window_chapters(window_chapters)
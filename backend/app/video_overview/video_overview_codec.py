@@ -0,0 +1,79 @@
+import os
+from typing import Optional
+
+import orjson
+
+from .video_overview_schemas import VideoOverview
+
+# How new overviews are written to video_overviews:
+#   json     the `overview` jsonb column, readable from the Supabase dashboard
+#   compact  msgpack + zstd in the `overview_compact` bytea column (sql/video_overviews_compact.sql);
+#            needs the `compact` extra
+# Reads decode either, so old rows never need migrating. Reads only select
+# overview_compact once it exists: after writing compact rows, keep
+# OVERVIEW_COMPACT_READS on if the format is switched back to json.
+OVERVIEW_STORAGE_FORMAT = os.getenv("OVERVIEW_STORAGE_FORMAT", "json")
+OVERVIEW_COMPACT_READS = (
+    os.getenv("OVERVIEW_COMPACT_READS", str(OVERVIEW_STORAGE_FORMAT == "compact")).lower()
+    == "true"
+)
+OVERVIEW_ZSTD_LEVEL = int(os.getenv("OVERVIEW_ZSTD_LEVEL", "9"))
+
+
+def overview_columns() -> str:
+    # the jsonb column is cast to text so the stored JSON comes back as one
+    # string that orjson parses without building a VideoOverview
+    if OVERVIEW_COMPACT_READS:
+        return "overview::text,overview_compact"
+    return "overview::text"
+
+
+def encode_overview_row(overview: VideoOverview) -> dict:
+    # the storage columns of a video_overviews row
+    if OVERVIEW_STORAGE_FORMAT == "compact":
+        # PostgREST takes bytea as a \x-prefixed hex string
+        return {"overview": None, "overview_compact": "\\x" + pack_overview(overview).hex()}
+    return {"overview": overview.model_dump()}
+
+
+def canonical_json(data) -> bytes:
+    # jsonb hands rows back with its own key order and ", " separators, so
+    # every response body is written compact with sorted keys: the same
+    # overview gives the same bytes, and the same ETag, whichever path built it
+    return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+
+
+def overview_body(overview: VideoOverview) -> bytes:
+    return canonical_json(overview.model_dump())
+
+
+def pack_overview(overview: VideoOverview) -> bytes:
+    import msgpack
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=OVERVIEW_ZSTD_LEVEL).compress(
+        msgpack.packb(overview.model_dump())
+    )
+
+
+def unpack_overview(packed: bytes) -> dict:
+    import msgpack
+    import zstandard
+
+    return msgpack.unpackb(zstandard.ZstdDecompressor().decompress(packed))
+
+
+def decode_overview_row(row: dict) -> Optional[bytes]:
+    # JSON response body for a stored row, without building a VideoOverview:
+    # rows are only ever written from a validated model
+    compact = row.get("overview_compact")
+    if compact:
+        if isinstance(compact, str):
+            compact = bytes.fromhex(compact.removeprefix("\\x"))
+        return canonical_json(unpack_overview(compact))
+    overview = row.get("overview")
+    if overview is None:
+        return None
+    if isinstance(overview, str):
+        overview = orjson.loads(overview)
+    return canonical_json(overview)
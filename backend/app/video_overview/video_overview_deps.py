@@ -1,46 +1,142 @@
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Optional
-from openai import OpenAI
+from typing import TYPE_CHECKING
+import httpx
 from .video_overview_schemas import ChatRole
 import os
-from googleapiclient.discovery import build
-from supabase import create_client
-from fireworks.client import Fireworks
-import anthropic
+
+# The provider SDKs are imported where they are first used rather than at module
+# load: together they dominate `import app.main`, and openai/fireworks are
+# optional extras that the request path never touches.
+if TYPE_CHECKING:
+    import anthropic
 
 
 def get_openai_client():
+    # needs the `providers` extra
+    from openai import OpenAI
+
     openai_client = OpenAI()
     return openai_client
 
 
 def get_fireworks_client():
+    # needs the `providers` extra
+    from fireworks.client import Fireworks
+
     fireworks_client = Fireworks(api_key=os.getenv("FIREWORKS_API_KEY"))
     return fireworks_client
 
 
+ANTHROPIC_USER_CLIENT_CACHE_SIZE = int(os.getenv("ANTHROPIC_USER_CLIENT_CACHE_SIZE", "32"))
+
+
+class ClientRegistry:
+    # Application-lifetime clients: one pooled HTTP connection set shared by every
+    # Anthropic client, and one supabase client. Clients for user API keys live in
+    # a small LRU keyed by a hash of the key, so a client is only ever reused for
+    # the same key; the key itself is sent per request, so the shared pool never
+    # carries one user's credentials into another user's call.
+    def __init__(self, user_client_cache_size: int = ANTHROPIC_USER_CLIENT_CACHE_SIZE):
+        self.user_client_cache_size = user_client_cache_size
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._supabase = None
+        self._supabase_lock = threading.Lock()
+        self._anthropic = None
+        self._user_anthropic: "OrderedDict[str, anthropic.AsyncAnthropic]" = OrderedDict()
+
+    def start(self):
+        self.http_client()
+        if os.environ.get("SUPABASE_URL"):
+            self.supabase()
+
+    async def close(self):
+        self._anthropic = None
+        self._user_anthropic.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self._supabase is not None:
+            try:
+                self._supabase.postgrest.aclose()
+            except Exception:
+                pass
+            self._supabase = None
+
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=httpx.Timeout(600, connect=5),
+            )
+        return self._http_client
+
+    def supabase(self):
+        # FastAPI resolves sync dependencies on worker threads
+        with self._supabase_lock:
+            if self._supabase is None:
+                from supabase import create_client
+
+                self._supabase = create_client(
+                    os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_API_KEY")
+                )
+        return self._supabase
+
+    def anthropic(self, api_key: Optional[str] = None):
+        import anthropic
+
+        if api_key is None:
+            if self._anthropic is None:
+                self._anthropic = anthropic.AsyncAnthropic(
+                    api_key=os.getenv("ANTHROPIC_API_KEY"), http_client=self.http_client()
+                )
+            return self._anthropic
+
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        client = self._user_anthropic.get(key_hash)
+        if client is None:
+            client = anthropic.AsyncAnthropic(api_key=api_key, http_client=self.http_client())
+            self._user_anthropic[key_hash] = client
+            # evicted clients share the pool, so there is nothing to close
+            while len(self._user_anthropic) > self.user_client_cache_size:
+                self._user_anthropic.popitem(last=False)
+        else:
+            self._user_anthropic.move_to_end(key_hash)
+        return client
+
+
+client_registry = ClientRegistry()
+
+
 def get_anthropic_client(user_api_key_only: bool = True, api_key: Optional[str] = None):
     if user_api_key_only:
-        return anthropic.Anthropic(api_key=api_key)
+        return client_registry.anthropic(api_key)
     else:
-        return anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        return client_registry.anthropic()
 
 
 def get_supabase_client():
-    return create_client(
-        os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_API_KEY")
-    )
+    return client_registry.supabase()
 
 
 def get_youtube_client():
+    from googleapiclient.discovery import build
+
     yt_api_key = os.getenv("YOUTUBE_API_KEY")
     return build("youtube", "v3", developerKey=yt_api_key)
 
 
-def assistant(content: str):
+# marks the end of a prompt prefix for Anthropic prompt caching
+EPHEMERAL_CACHE = {"type": "ephemeral"}
+
+
+def assistant(content: str | list):
     return {"role": ChatRole.ASSISTANT, "content": content}
 
 
-def user(content: str):
+def user(content: str | list):
     return {"role": ChatRole.USER, "content": content}
 
 
@@ -0,0 +1,28 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking SDK calls (supabase, googleapiclient, youtube-transcript-api) run on a
+# bounded thread pool so a slow upstream never stalls the event loop.
+BLOCKING_IO_MAX_WORKERS = int(os.getenv("BLOCKING_IO_MAX_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_IO_MAX_WORKERS, thread_name_prefix="blocking-io"
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def execute(query):
+    # supabase-py query builders only expose a sync execute()
+    return await run_blocking(query.execute)
+
+
+def shutdown_blocking_io():
+    _executor.shutdown(wait=False, cancel_futures=True)
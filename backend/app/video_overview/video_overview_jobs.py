@@ -0,0 +1,366 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .video_overview_io import run_blocking
+from .video_overview_schemas import Job, JobStatus
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Generation jobs are persisted in SQLite so queued and interrupted jobs are
+# picked up again after a restart. An empty JOB_STORE_PATH keeps them in memory.
+# Workers sharing the file each own the jobs they accepted and keep them alive
+# with a heartbeat; a job whose owner has stopped beating for
+# JOB_STALE_AFTER_S is claimed by whichever worker sweeps first. Finished
+# jobs are deleted after JOB_RETENTION_S.
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "data/jobs.sqlite3")
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_QUEUE_MAX_PENDING = int(os.getenv("JOB_QUEUE_MAX_PENDING", "100"))
+JOB_HEARTBEAT_INTERVAL_S = float(os.getenv("JOB_HEARTBEAT_INTERVAL_S", "15"))
+JOB_STALE_AFTER_S = float(os.getenv("JOB_STALE_AFTER_S", "60"))
+JOB_RETENTION_S = float(os.getenv("JOB_RETENTION_S", str(7 * 24 * 3600)))
+JOB_RETRY_AFTER_S = 30
+
+ACTIVE_STATUSES = (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+FINISHED_STATUSES = (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value)
+JOB_COLUMNS = (
+    "job_id, video_id, status, uses_user_key, status_code, detail, created_at, updated_at"
+)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str,
+        run_job: Callable[[Job, Optional[str]], Awaitable[None]],
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        max_pending: int = JOB_QUEUE_MAX_PENDING,
+        heartbeat_interval_s: float = JOB_HEARTBEAT_INTERVAL_S,
+        stale_after_s: float = JOB_STALE_AFTER_S,
+        retention_s: float = JOB_RETENTION_S,
+    ):
+        self.run_job = run_job
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.heartbeat_interval_s = heartbeat_interval_s
+        self.stale_after_s = stale_after_s
+        self.retention_s = retention_s
+        self.owner = uuid.uuid4().hex
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._conn.execute(
+            """create table if not exists jobs (
+                job_id text primary key,
+                video_id text not null,
+                status text not null,
+                uses_user_key integer not null,
+                status_code integer,
+                detail text,
+                created_at real not null,
+                updated_at real not null,
+                owner text,
+                heartbeat_at real not null default 0
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("pragma table_info(jobs)")}
+        if "owner" not in columns:
+            # stores from before heartbeats; their active jobs count as stale
+            self._conn.execute("alter table jobs add column owner text")
+            self._conn.execute("alter table jobs add column heartbeat_at real not null default 0")
+        self._conn.execute("create index if not exists jobs_status on jobs (status)")
+        self._conn.execute("create index if not exists jobs_video_id on jobs (video_id)")
+        self._conn.commit()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        # user API keys are never written to disk
+        self._user_api_keys: Dict[str, str] = {}
+
+    def _query(self, sql: str, params=()) -> List[Job]:
+        with self._lock:
+            return self._query_locked(sql, params)
+
+    def _query_locked(self, sql: str, params=()) -> List[Job]:
+        rows = self._conn.execute(sql, params).fetchall()
+        return [
+            Job(
+                job_id=row[0],
+                video_id=row[1],
+                status=row[2],
+                uses_user_key=bool(row[3]),
+                status_code=row[4],
+                detail=row[5],
+                created_at=row[6],
+                updated_at=row[7],
+            )
+            for row in rows
+        ]
+
+    def _write(self, sql: str, params=()) -> int:
+        with self._lock:
+            rowcount = self._conn.execute(sql, params).rowcount
+            self._conn.commit()
+        return rowcount
+
+    def _insert(self, job: Job):
+        with self._lock:
+            self._insert_locked(job)
+            self._conn.commit()
+
+    def _insert_locked(self, job: Job):
+        self._conn.execute(
+            f"insert into jobs ({JOB_COLUMNS}, owner, heartbeat_at) "
+            "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.job_id,
+                job.video_id,
+                job.status.value,
+                int(job.uses_user_key),
+                job.status_code,
+                job.detail,
+                job.created_at,
+                job.updated_at,
+                self.owner,
+                job.updated_at,
+            ),
+        )
+
+    async def _set_status(
+        self,
+        job_id: str,
+        status: JobStatus,
+        status_code: Optional[int] = None,
+        detail: Optional[str] = None,
+    ):
+        await run_blocking(
+            self._write,
+            "update jobs set status = ?, status_code = ?, detail = ?, updated_at = ? where job_id = ?",
+            (status.value, status_code, detail, time.time(), job_id),
+        )
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        jobs = await run_blocking(
+            self._query, f"select {JOB_COLUMNS} from jobs where job_id = ?", (job_id,)
+        )
+        return jobs[0] if jobs else None
+
+    async def find_active(self, video_id: str) -> Optional[Job]:
+        jobs = await run_blocking(
+            self._query,
+            f"select {JOB_COLUMNS} from jobs where video_id = ? and status in (?, ?) "
+            "order by created_at limit 1",
+            (video_id, *ACTIVE_STATUSES),
+        )
+        return jobs[0] if jobs else None
+
+    def pending_count(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def ensure_capacity(self):
+        if self.pending_count() >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many overviews are queued right now. Please try again shortly.",
+                headers={"Retry-After": str(JOB_RETRY_AFTER_S)},
+            )
+
+    def _new_job(self, video_id: str, status: JobStatus, uses_user_key: bool) -> Job:
+        now = time.time()
+        return Job(
+            job_id=uuid.uuid4().hex,
+            video_id=video_id,
+            status=status,
+            uses_user_key=uses_user_key,
+            created_at=now,
+            updated_at=now,
+        )
+
+    async def enqueue(self, video_id: str, user_api_key: Optional[str] = None) -> Job:
+        self.ensure_capacity()
+        job = self._new_job(video_id, JobStatus.QUEUED, user_api_key is not None)
+        await run_blocking(self._insert, job)
+        if user_api_key is not None:
+            self._user_api_keys[job.job_id] = user_api_key
+        self._queue.put_nowait(job.job_id)
+        return job
+
+    def _find_active_or_insert(self, video_id: str) -> Tuple[Job, bool]:
+        # the active job for the video, or a new queued one; True when it is new
+        with self._lock:
+            # holds the write lock from the lookup on, so concurrent callers
+            # in other workers cannot both insert
+            self._conn.execute("begin immediate")
+            try:
+                jobs = self._query_locked(
+                    f"select {JOB_COLUMNS} from jobs where video_id = ? and status in (?, ?) "
+                    "order by created_at limit 1",
+                    (video_id, *ACTIVE_STATUSES),
+                )
+                if jobs:
+                    self._conn.commit()
+                    return jobs[0], False
+                job = self._new_job(video_id, JobStatus.QUEUED, False)
+                self._insert_locked(job)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return job, True
+
+    async def find_active_or_enqueue(
+        self,
+        video_id: str,
+        admit: Callable[[], Awaitable[Optional[str]]],
+        refund: Callable[[Optional[str]], Awaitable[None]],
+    ) -> Job:
+        # Returns the video's active job, or enqueues a new one. Only a new job
+        # calls `admit`, which charges for it and returns the user API key it
+        # runs on (None for the free tier); the job is removed if admit fails,
+        # and `refund` gets the key back if the job cannot be started after all.
+        job, created = await run_blocking(self._find_active_or_insert, video_id)
+        if not created:
+            return job
+        try:
+            user_api_key = await admit()
+        except BaseException:
+            await run_blocking(self._write, "delete from jobs where job_id = ?", (job.job_id,))
+            raise
+        try:
+            if user_api_key is not None:
+                await run_blocking(
+                    self._write,
+                    "update jobs set uses_user_key = 1 where job_id = ?",
+                    (job.job_id,),
+                )
+                job.uses_user_key = True
+                self._user_api_keys[job.job_id] = user_api_key
+            self._queue.put_nowait(job.job_id)
+        except BaseException:
+            self._user_api_keys.pop(job.job_id, None)
+            await refund(user_api_key)
+            await run_blocking(self._write, "delete from jobs where job_id = ?", (job.job_id,))
+            raise
+        return job
+
+    def _find_or_insert_finished(self, video_id: str) -> Job:
+        # one succeeded row per stored video, however often it is enqueued
+        with self._lock:
+            jobs = self._query_locked(
+                f"select {JOB_COLUMNS} from jobs where video_id = ? and status = ? "
+                "order by updated_at desc limit 1",
+                (video_id, JobStatus.SUCCEEDED.value),
+            )
+            if jobs:
+                return jobs[0]
+            job = self._new_job(video_id, JobStatus.SUCCEEDED, False)
+            self._insert_locked(job)
+            self._conn.commit()
+        return job
+
+    async def record_finished(self, video_id: str) -> Job:
+        return await run_blocking(self._find_or_insert_finished, video_id)
+
+    def _claim(self, job_id: str) -> bool:
+        # False when the job is no longer ours: a sweep took it over
+        now = time.time()
+        return bool(
+            self._write(
+                "update jobs set status = ?, updated_at = ?, heartbeat_at = ? "
+                "where job_id = ? and owner = ? and status in (?, ?)",
+                (JobStatus.RUNNING.value, now, now, job_id, self.owner, *ACTIVE_STATUSES),
+            )
+        )
+
+    def _beat(self) -> List[str]:
+        # renews this worker's jobs, takes over stale ones and drops old
+        # finished ones; returns the ids taken over
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "update jobs set heartbeat_at = ? where owner = ? and status in (?, ?)",
+                (now, self.owner, *ACTIVE_STATUSES),
+            )
+            # one statement, so two workers sweeping at once never both win a job
+            taken = self._conn.execute(
+                "update jobs set owner = ?, heartbeat_at = ?, status = ? "
+                "where status in (?, ?) and heartbeat_at < ? returning job_id, created_at",
+                (
+                    self.owner,
+                    now,
+                    JobStatus.QUEUED.value,
+                    *ACTIVE_STATUSES,
+                    now - self.stale_after_s,
+                ),
+            ).fetchall()
+            self._conn.execute(
+                "delete from jobs where status in (?, ?) and updated_at < ?",
+                (*FINISHED_STATUSES, now - self.retention_s),
+            )
+            self._conn.commit()
+        return [job_id for job_id, _ in sorted(taken, key=lambda row: row[1])]
+
+    async def _sweep(self):
+        taken = await run_blocking(self._beat)
+        for job_id in taken:
+            self._queue.put_nowait(job_id)
+        if taken:
+            logger.info(f"Recovered {len(taken)} overview generation jobs")
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval_s)
+            try:
+                await self._sweep()
+            except Exception as e:
+                logger.error(f"Error in job heartbeat: {str(e)}")
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        # jobs left behind by a worker that stopped, this one's previous run included
+        await self._sweep()
+        self._heartbeat = asyncio.create_task(self._keep_alive())
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        # mark what is left as stale, so the next sweep anywhere picks it up
+        await run_blocking(
+            self._write,
+            "update jobs set heartbeat_at = 0 where owner = ? and status in (?, ?)",
+            (self.owner, *ACTIVE_STATUSES),
+        )
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            job = await self.get(job_id)
+            if job is None or not await run_blocking(self._claim, job_id):
+                continue
+            try:
+                await self.run_job(job, self._user_api_keys.pop(job_id, None))
+            except asyncio.CancelledError:
+                # left as running; stop() hands it to the next sweep
+                raise
+            except HTTPException as e:
+                await self._set_status(job_id, JobStatus.FAILED, e.status_code, e.detail)
+            except Exception as e:
+                logger.error(f"Error running job {job_id}: {str(e)}")
+                await self._set_status(job_id, JobStatus.FAILED, 500, str(e))
+            else:
+                await self._set_status(job_id, JobStatus.SUCCEEDED, 200)
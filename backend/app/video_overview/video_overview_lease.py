@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from .video_overview_io import execute, run_blocking
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cross-worker generation leases. With several uvicorn workers the in-process
+# SingleFlight only coalesces within a worker; the lease makes the other workers
+# wait for the row to appear instead of starting their own generation.
+# GENERATION_LEASE_BACKEND: "none" (default), "file" (workers on one host) or "supabase"
+# A held lease is renewed every third of its TTL, so it only expires when the
+# holder dies, however long the generation takes.
+LEASE_TTL_S = int(os.getenv("GENERATION_LEASE_TTL_S", "180"))
+LEASE_POLL_INTERVAL_S = float(os.getenv("GENERATION_LEASE_POLL_INTERVAL_S", "1.0"))
+LEASE_WAIT_TIMEOUT_S = float(os.getenv("GENERATION_LEASE_WAIT_TIMEOUT_S", "240"))
+
+
+class SupabaseLease:
+    # backed by the generation_leases table, see sql/generation_leases.sql
+    def __init__(self, ttl_s: int = LEASE_TTL_S):
+        self.ttl_s = ttl_s
+        self.owner = uuid.uuid4().hex
+
+    def _expires_at(self, now: datetime) -> str:
+        return (now + timedelta(seconds=self.ttl_s)).isoformat()
+
+    async def acquire(self, video_id: str, supabase) -> bool:
+        now = datetime.now(timezone.utc)
+        expires_at = self._expires_at(now)
+        try:
+            await execute(
+                supabase.table("generation_leases").insert(
+                    {"video_id": video_id, "owner": self.owner, "expires_at": expires_at}
+                )
+            )
+            return True
+        except Exception:
+            # primary key conflict: someone holds it, take it over only if it expired
+            result = await execute(
+                supabase.table("generation_leases")
+                .update({"owner": self.owner, "expires_at": expires_at})
+                .eq("video_id", video_id)
+                .lt("expires_at", now.isoformat())
+            )
+            return bool(result.data)
+
+    async def renew(self, video_id: str, supabase) -> bool:
+        # False once another worker has taken the lease over
+        result = await execute(
+            supabase.table("generation_leases")
+            .update({"expires_at": self._expires_at(datetime.now(timezone.utc))})
+            .eq("video_id", video_id)
+            .eq("owner", self.owner)
+        )
+        return bool(result.data)
+
+    async def release(self, video_id: str, supabase):
+        try:
+            await execute(
+                supabase.table("generation_leases")
+                .delete()
+                .eq("video_id", video_id)
+                .eq("owner", self.owner)
+            )
+        except Exception as e:
+            logger.error(f"Error releasing generation lease for {video_id}: {str(e)}")
+
+
+class FileLease:
+    # Local stand-in for SupabaseLease: O_EXCL lock files in a shared directory,
+    # holding the owner's id; the mtime is the last renewal
+    def __init__(self, directory: str, ttl_s: int = LEASE_TTL_S):
+        self.directory = directory
+        self.ttl_s = ttl_s
+        self.owner = uuid.uuid4().hex
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, video_id: str) -> str:
+        name = hashlib.sha1(video_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.lease")
+
+    def _try_acquire(self, video_id: str) -> bool:
+        path = self._path(video_id)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                expired = time.time() - os.path.getmtime(path) > self.ttl_s
+            except FileNotFoundError:
+                expired = True
+            if not expired:
+                return False
+            # rename is atomic, so only one worker wins the stale lease
+            try:
+                os.rename(path, f"{path}.{uuid.uuid4().hex}.stale")
+            except FileNotFoundError:
+                pass
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+        try:
+            os.write(fd, self.owner.encode())
+        finally:
+            os.close(fd)
+        return True
+
+    def _holds(self, path: str) -> bool:
+        try:
+            with open(path, "rb") as f:
+                return f.read() == self.owner.encode()
+        except FileNotFoundError:
+            return False
+
+    def _renew(self, video_id: str) -> bool:
+        path = self._path(video_id)
+        if not self._holds(path):
+            return False
+        os.utime(path)
+        return True
+
+    def _release(self, video_id: str):
+        path = self._path(video_id)
+        if not self._holds(path):
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def acquire(self, video_id: str, supabase) -> bool:
+        return await run_blocking(self._try_acquire, video_id)
+
+    async def renew(self, video_id: str, supabase) -> bool:
+        return await run_blocking(self._renew, video_id)
+
+    async def release(self, video_id: str, supabase):
+        await run_blocking(self._release, video_id)
+
+
+@asynccontextmanager
+async def holding(lease, video_id: str, supabase):
+    # for the body of `if await lease.acquire(...)`: renews the lease while the
+    # body runs and releases it afterwards
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease.ttl_s / 3)
+            try:
+                if not await lease.renew(video_id, supabase):
+                    logger.warning(f"Generation lease for {video_id} was taken over")
+                    return
+            except Exception as e:
+                # the next beat retries before the lease can expire
+                logger.error(f"Error renewing generation lease for {video_id}: {str(e)}")
+
+    renewal = asyncio.create_task(heartbeat())
+    try:
+        yield
+    finally:
+        renewal.cancel()
+        await lease.release(video_id, supabase)
+
+
+@lru_cache
+def get_generation_lease():
+    backend = os.getenv("GENERATION_LEASE_BACKEND", "none")
+    if backend == "supabase":
+        return SupabaseLease()
+    if backend == "file":
+        directory = os.getenv(
+            "GENERATION_LEASE_DIR",
+            os.path.join(tempfile.gettempdir(), "video-navigator-leases"),
+        )
+        return FileLease(directory)
+    return None
@@ -0,0 +1,290 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .video_overview_io import run_blocking
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hedged routing over LLM providers. The first provider is tried first; if it
+# has not answered within its recent p95 latency, one backup request goes to the
+# next provider and the first usable answer wins. A rate-limited provider is
+# failed over immediately and skipped for LLM_RATE_LIMIT_COOLDOWN_S.
+LLM_BACKUP_PROVIDERS = [
+    name.strip() for name in os.getenv("LLM_BACKUP_PROVIDERS", "").split(",") if name.strip()
+]
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "100"))
+# below this many samples the p95 is not trusted and LLM_HEDGE_DEFAULT_DELAY_S is used
+LLM_LATENCY_MIN_SAMPLES = 10
+LLM_HEDGE_DEFAULT_DELAY_S = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_S", "45"))
+LLM_HEDGE_MIN_DELAY_S = float(os.getenv("LLM_HEDGE_MIN_DELAY_S", "5"))
+LLM_RATE_LIMIT_COOLDOWN_S = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN_S", "30"))
+# providers failing more often than this are tried after the healthy ones
+LLM_MAX_ERROR_RATE = 0.5
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+FIREWORKS_MODEL = os.getenv(
+    "FIREWORKS_MODEL", "accounts/fireworks/models/llama-v3p1-70b-instruct"
+)
+
+
+class Completion(NamedTuple):
+    text: str
+    # "max_tokens" when the output was cut off
+    stop_reason: Optional[str]
+    usage: Any = None
+
+
+def is_rate_limit(error: BaseException) -> bool:
+    # every SDK here names its 429 error RateLimitError
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+class ProviderStats:
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.cooldown_until = 0.0
+
+    def record_success(self, latency_s: float):
+        self.requests += 1
+        self.latencies.append(latency_s)
+        self.outcomes.append(True)
+
+    def record_error(self, rate_limited: bool = False):
+        self.requests += 1
+        self.errors += 1
+        self.outcomes.append(False)
+        if rate_limited:
+            self.rate_limited += 1
+            self.cooldown_until = time.monotonic() + LLM_RATE_LIMIT_COOLDOWN_S
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < LLM_LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def error_rate(self) -> float:
+        if len(self.outcomes) < LLM_LATENCY_MIN_SAMPLES:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def available(self) -> bool:
+        return (
+            time.monotonic() >= self.cooldown_until
+            and self.error_rate() <= LLM_MAX_ERROR_RATE
+        )
+
+    def summary(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "p50_s": round(p50, 3) if p50 is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "available": self.available(),
+        }
+
+
+class AnthropicProvider:
+    def __init__(self, client, name: str, model: str, max_tokens: int, extra_headers=None):
+        self.client = client
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.extra_headers = extra_headers
+
+    async def complete(self, messages, system_prompt) -> Completion:
+        message = await self.client.messages.create(
+            model=self.model,
+            system=system_prompt,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=0.2,
+            extra_headers=self.extra_headers,
+        )
+        return Completion(message.content[0].text, message.stop_reason, message.usage)
+
+
+class SimpleUsage(NamedTuple):
+    input_tokens: int
+    output_tokens: int
+
+
+def text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+# JSON mode is rejected unless some message asks for JSON, and the one that
+# does in the Anthropic prompt is the assistant prefill these APIs never see
+CHAT_JSON_INSTRUCTION = (
+    "Respond with a single JSON object in the same format as the example overview, "
+    "and nothing else."
+)
+
+
+class ChatCompletionsProvider:
+    # OpenAI-style chat completions (OpenAI, Fireworks). These APIs cannot
+    # continue a pre-filled assistant turn, so the trailing "{" prefill is
+    # dropped and stripped from the answer instead. The SDK clients are sync.
+    def __init__(self, client, name: str, model: str, max_tokens: int):
+        self.client = client
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+
+    async def complete(self, messages, system_prompt) -> Completion:
+        if messages and messages[-1]["role"] == "assistant":
+            messages = messages[:-1]
+        chat = [
+            {
+                "role": "system",
+                "content": f"{text_of(system_prompt)}\n\n{CHAT_JSON_INSTRUCTION}",
+            }
+        ]
+        chat += [
+            {"role": message["role"], "content": text_of(message["content"])}
+            for message in messages
+        ]
+        response = await run_blocking(
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=chat,
+            max_tokens=self.max_tokens,
+            temperature=0.2,
+            response_format={"type": "json_object"},
+        )
+        choice = response.choices[0]
+        text = (choice.message.content or "").lstrip()
+        usage = response.usage
+        return Completion(
+            text[1:] if text.startswith("{") else text,
+            "max_tokens" if choice.finish_reason == "length" else choice.finish_reason,
+            SimpleUsage(
+                getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0)
+            ),
+        )
+
+
+class LLMRouter:
+    def __init__(self, on_usage: Optional[Callable[[Any], None]] = None):
+        self.on_usage = on_usage
+        self.stats: Dict[str, ProviderStats] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.invalid = 0
+
+    def provider_stats(self, name: str) -> ProviderStats:
+        if name not in self.stats:
+            self.stats[name] = ProviderStats()
+        return self.stats[name]
+
+    def hedge_delay_s(self, name: str) -> float:
+        p95 = self.provider_stats(name).percentile(0.95)
+        return max(LLM_HEDGE_MIN_DELAY_S, p95 if p95 is not None else LLM_HEDGE_DEFAULT_DELAY_S)
+
+    async def _call(self, provider, messages, system_prompt) -> Completion:
+        stats = self.provider_stats(provider.name)
+        start = time.monotonic()
+        try:
+            completion = await provider.complete(messages, system_prompt)
+        except Exception as e:
+            stats.record_error(rate_limited=is_rate_limit(e))
+            logger.warning(f"LLM provider {provider.name} failed: {str(e)}")
+            raise
+        stats.record_success(time.monotonic() - start)
+        if self.on_usage is not None and completion.usage is not None:
+            self.on_usage(completion.usage)
+        return completion
+
+    async def complete(
+        self,
+        providers: List,
+        messages,
+        system_prompt,
+        validate: Optional[Callable[[Completion], bool]] = None,
+    ) -> Completion:
+        # available providers keep their order, cooling or failing ones go last
+        remaining = sorted(
+            providers, key=lambda p: not self.provider_stats(p.name).available()
+        )
+        pending: Dict[asyncio.Task, Any] = {}
+        started_at: Dict[asyncio.Task, float] = {}
+        first = remaining[0]
+        hedged = False
+        last_error: Optional[BaseException] = None
+        last_invalid: Optional[Completion] = None
+
+        def launch():
+            provider = remaining.pop(0)
+            task = asyncio.create_task(self._call(provider, messages, system_prompt))
+            pending[task] = provider
+            started_at[task] = time.monotonic()
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if remaining and not hedged and len(pending) == 1:
+                    task, provider = next(iter(pending.items()))
+                    elapsed = time.monotonic() - started_at[task]
+                    timeout = max(0.0, self.hedge_delay_s(provider.name) - elapsed)
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # the request is slower than this provider's usual p95
+                    hedged = True
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        if remaining and not pending:
+                            self.failovers += 1
+                            launch()
+                        continue
+                    completion = task.result()
+                    if validate is None or validate(completion):
+                        if hedged and provider is not first:
+                            self.hedge_wins += 1
+                        return completion
+                    self.invalid += 1
+                    self.provider_stats(provider.name).outcomes.append(False)
+                    logger.warning(f"LLM provider {provider.name} returned an unusable completion")
+                    last_invalid = completion
+                    if remaining and not pending:
+                        self.failovers += 1
+                        launch()
+        finally:
+            # the losing request is not needed any more
+            for task in pending:
+                task.cancel()
+        # nothing usable: hand back an invalid completion for the caller's own
+        # error handling, or the last error
+        if last_invalid is not None:
+            return last_invalid
+        raise last_error
+
+    def summary(self):
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "invalid": self.invalid,
+            "providers": {name: stats.summary() for name, stats in self.stats.items()},
+        }
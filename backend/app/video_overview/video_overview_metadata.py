@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar
+
+V = TypeVar("V")
+
+METADATA_CACHE_TTL_S = float(os.getenv("METADATA_CACHE_TTL_S", str(6 * 3600)))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "10000"))
+METADATA_BATCH_WINDOW_S = float(os.getenv("METADATA_BATCH_WINDOW_S", "0.01"))
+# videos.list accepts at most 50 ids per call
+METADATA_MAX_BATCH = 50
+
+
+class TTLCache(Generic[V]):
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[V, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl_s:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, value: V):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class MicroBatcher(Generic[V]):
+    # Collects keys requested within window_s and resolves them with a single
+    # fetch_batch call of at most max_batch keys. Keys missing from the batch
+    # result raise KeyError in their callers.
+    def __init__(
+        self,
+        fetch_batch: Callable[[List[str]], Awaitable[Dict[str, V]]],
+        window_s: float = METADATA_BATCH_WINDOW_S,
+        max_batch: int = METADATA_MAX_BATCH,
+    ):
+        self.fetch_batch = fetch_batch
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # the loop only keeps weak references to tasks
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.keys_fetched = 0
+
+    async def get(self, key: str) -> V:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # keys whose callers were all cancelled are not worth a fetch
+        for key in [
+            key
+            for key, futures in self._pending.items()
+            if all(future.cancelled() for future in futures)
+        ]:
+            del self._pending[key]
+        while self._pending:
+            keys = list(self._pending)[: self.max_batch]
+            batch = {key: self._pending.pop(key) for key in keys}
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: Dict[str, List[asyncio.Future]]):
+        self.batches += 1
+        self.keys_fetched += len(batch)
+        try:
+            results = await self.fetch_batch(list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in batch.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if key in results:
+                    future.set_result(results[key])
+                else:
+                    future.set_exception(KeyError(key))
@@ -0,0 +1,61 @@
+from typing import List, Optional
+
+from pydantic import ValidationError
+
+from .video_overview_schemas import ChapterData
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChapterStreamParser:
+    # Scans a streamed {"chapters": [{...}, {...}]} document and returns the raw
+    # JSON of each chapter object as soon as its closing brace arrives.
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._chapter_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[str]:
+        self.text += chunk
+        completed = []
+        text = self.text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                # depth 2 is inside the outer object and the chapters array
+                if char == "{" and self._depth == 2:
+                    self._chapter_start = pos
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._depth == 2 and self._chapter_start is not None:
+                    completed.append(text[self._chapter_start : pos + 1])
+                    self._chapter_start = None
+        self._pos = len(text)
+        return completed
+
+
+def parse_complete_chapters(document: str) -> List[ChapterData]:
+    # Every well-formed chapter of a possibly truncated or partly invalid
+    # document; a chapter that fails validation is dropped on its own
+    chapters = []
+    for chapter_json in ChapterStreamParser().feed(document):
+        try:
+            chapters.append(ChapterData.model_validate_json(chapter_json))
+        except ValidationError as e:
+            logger.warning(f"Dropping malformed chapter: {str(e)}")
+    return chapters
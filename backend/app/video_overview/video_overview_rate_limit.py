@@ -0,0 +1,247 @@
+import abc
+import os
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from .video_overview_io import execute
+
+TOTAL_API_USAGE_LIMIT = 100
+USER_RATE_LIMIT = 10
+
+# RATE_LIMIT_BACKEND: "supabase" (default) or "memory" for tests and single-node use
+# Over-limit decisions are remembered locally for RATE_LIMIT_DECISION_TTL_S so
+# rejected clients do not cost a round trip each time.
+RATE_LIMIT_DECISION_TTL_S = float(os.getenv("RATE_LIMIT_DECISION_TTL_S", "60"))
+# Token refill per second for the in-memory buckets. 0 keeps today's lifetime quotas.
+RATE_LIMIT_REFILL_PER_S = float(os.getenv("RATE_LIMIT_REFILL_PER_S", "0"))
+# Client IPs the in-memory limiter keeps a bucket for. Buckets that have
+# refilled completely are dropped first, since a new one is the same; past the
+# cap the least recently seen IP goes regardless and starts over with a full quota.
+RATE_LIMIT_MAX_TRACKED_IPS = int(os.getenv("RATE_LIMIT_MAX_TRACKED_IPS", "100000"))
+
+
+class Admission(str, Enum):
+    OK = "ok"
+    USER_LIMIT = "user_limit"
+    TOTAL_LIMIT = "total_limit"
+
+
+class RateLimiter(abc.ABC):
+    # Subclasses implement _admit_free, _user_limit_exceeded and record_api_usage.
+    # admit_free checks both limits and increments both counters as one atomic step.
+    def __init__(self, decision_ttl_s: float = RATE_LIMIT_DECISION_TTL_S):
+        self.decision_ttl_s = decision_ttl_s
+        self._over_limit_until: Dict[str, float] = {}
+        self._prune_decisions_at = 1024
+        self._total_over_limit_until = 0.0
+        self.cached_rejections = 0
+
+    def _cached_decision(self, ip: str) -> Optional[Admission]:
+        now = time.monotonic()
+        if self._over_limit_until.get(ip, 0) > now:
+            return Admission.USER_LIMIT
+        if self._total_over_limit_until > now:
+            return Admission.TOTAL_LIMIT
+        return None
+
+    def _remember(self, ip: str, admission: Admission):
+        now = time.monotonic()
+        expires = now + self.decision_ttl_s
+        if admission == Admission.USER_LIMIT:
+            if len(self._over_limit_until) >= self._prune_decisions_at:
+                # expired decisions are never read again
+                for expired in [k for k, until in self._over_limit_until.items() if until <= now]:
+                    del self._over_limit_until[expired]
+                self._prune_decisions_at = max(1024, 2 * len(self._over_limit_until))
+            self._over_limit_until[ip] = expires
+        elif admission == Admission.TOTAL_LIMIT:
+            self._total_over_limit_until = expires
+
+    async def admit_free(self, ip: str, supabase) -> Admission:
+        cached = self._cached_decision(ip)
+        if cached is not None:
+            self.cached_rejections += 1
+            return cached
+        admission = await self._admit_free(ip, supabase)
+        self._remember(ip, admission)
+        return admission
+
+    async def user_limit_exceeded(self, ip: str, supabase) -> bool:
+        if self._cached_decision(ip) == Admission.USER_LIMIT:
+            return True
+        return await self._user_limit_exceeded(ip, supabase)
+
+    @abc.abstractmethod
+    async def _admit_free(self, ip: str, supabase) -> Admission:
+        ...
+
+    @abc.abstractmethod
+    async def _user_limit_exceeded(self, ip: str, supabase) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def record_api_usage(self, supabase):
+        ...
+
+    # give back what admit_free / record_api_usage charged, for work that was
+    # never started
+    @abc.abstractmethod
+    async def refund_free(self, ip: str, supabase):
+        ...
+
+    @abc.abstractmethod
+    async def refund_api_usage(self, supabase):
+        ...
+
+
+class SupabaseRateLimiter(RateLimiter):
+    # one RPC per admission, see sql/rate_limits.sql
+    def __init__(
+        self,
+        user_limit: int = USER_RATE_LIMIT,
+        total_limit: int = TOTAL_API_USAGE_LIMIT,
+        decision_ttl_s: float = RATE_LIMIT_DECISION_TTL_S,
+    ):
+        super().__init__(decision_ttl_s)
+        self.user_limit = user_limit
+        self.total_limit = total_limit
+
+    async def _admit_free(self, ip: str, supabase) -> Admission:
+        result = await execute(
+            supabase.rpc(
+                "admit_free_generation",
+                {
+                    "p_ip": ip,
+                    "p_user_limit": self.user_limit,
+                    "p_total_limit": self.total_limit,
+                },
+            )
+        )
+        return Admission(result.data)
+
+    async def _user_limit_exceeded(self, ip: str, supabase) -> bool:
+        result = await execute(
+            supabase.table("rate_limits").select("count").eq("ip", ip)
+        )
+        if not result.data:
+            return False
+        return result.data[0]["count"] >= self.user_limit
+
+    async def record_api_usage(self, supabase):
+        await execute(supabase.rpc("incr_api_usage", {}))
+
+    async def refund_free(self, ip: str, supabase):
+        await execute(supabase.rpc("refund_free_generation", {"p_ip": ip}))
+
+    async def refund_api_usage(self, supabase):
+        await execute(supabase.rpc("decr_api_usage", {}))
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_s: float):
+        self.capacity = capacity
+        self.refill_per_s = refill_per_s
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_s
+        )
+        self.updated_at = now
+
+
+class InMemoryRateLimiter(RateLimiter):
+    def __init__(
+        self,
+        user_limit: int = USER_RATE_LIMIT,
+        total_limit: int = TOTAL_API_USAGE_LIMIT,
+        refill_per_s: float = RATE_LIMIT_REFILL_PER_S,
+        decision_ttl_s: float = RATE_LIMIT_DECISION_TTL_S,
+        max_tracked_ips: int = RATE_LIMIT_MAX_TRACKED_IPS,
+    ):
+        super().__init__(decision_ttl_s)
+        self.user_limit = user_limit
+        self.refill_per_s = refill_per_s
+        self.max_tracked_ips = max_tracked_ips
+        self._lock = threading.Lock()
+        # least recently seen first
+        self._user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._total_bucket = TokenBucket(total_limit, refill_per_s)
+        self.total_hits = 0
+        self.evicted_ips = 0
+
+    def _user_bucket(self, ip: str) -> TokenBucket:
+        bucket = self._user_buckets.get(ip)
+        if bucket is None:
+            self._evict()
+            bucket = self._user_buckets[ip] = TokenBucket(self.user_limit, self.refill_per_s)
+        else:
+            self._user_buckets.move_to_end(ip)
+        bucket.refill()
+        return bucket
+
+    def _evict(self):
+        # runs before each new IP is added, so the oldest few buckets are checked
+        while self._user_buckets:
+            ip, oldest = next(iter(self._user_buckets.items()))
+            if len(self._user_buckets) < self.max_tracked_ips:
+                oldest.refill()
+                if oldest.tokens < oldest.capacity:
+                    return
+            del self._user_buckets[ip]
+            self.evicted_ips += 1
+
+    def usage(self, ip: str) -> Tuple[int, int]:
+        with self._lock:
+            bucket = self._user_bucket(ip)
+            return int(self.user_limit - bucket.tokens), self.total_hits
+
+    async def _admit_free(self, ip: str, supabase) -> Admission:
+        with self._lock:
+            user_bucket = self._user_bucket(ip)
+            if user_bucket.tokens < 1:
+                return Admission.USER_LIMIT
+            self._total_bucket.refill()
+            if self._total_bucket.tokens < 1:
+                return Admission.TOTAL_LIMIT
+            user_bucket.tokens -= 1
+            self._total_bucket.tokens -= 1
+            self.total_hits += 1
+            return Admission.OK
+
+    async def _user_limit_exceeded(self, ip: str, supabase) -> bool:
+        with self._lock:
+            return self._user_bucket(ip).tokens < 1
+
+    async def record_api_usage(self, supabase):
+        with self._lock:
+            self._total_bucket.refill()
+            self._total_bucket.tokens = max(0, self._total_bucket.tokens - 1)
+            self.total_hits += 1
+
+    async def refund_free(self, ip: str, supabase):
+        with self._lock:
+            user_bucket = self._user_bucket(ip)
+            user_bucket.tokens = min(user_bucket.capacity, user_bucket.tokens + 1)
+        await self.refund_api_usage(supabase)
+
+    async def refund_api_usage(self, supabase):
+        with self._lock:
+            self._total_bucket.refill()
+            self._total_bucket.tokens = min(
+                self._total_bucket.capacity, self._total_bucket.tokens + 1
+            )
+            self.total_hits = max(0, self.total_hits - 1)
+
+
+@lru_cache
+def get_rate_limiter() -> RateLimiter:
+    if os.getenv("RATE_LIMIT_BACKEND", "supabase") == "memory":
+        return InMemoryRateLimiter()
+    return SupabaseRateLimiter()
@@ -20,6 +20,29 @@ class Chapter(BaseModel):
     associations: List[str]
 
 
+class SearchChapter(BaseModel):
+    title: str
+    # when the chapter starts
+    time: float
+    # only the key points that matched the query
+    key_points: List[KeyPoint]
+
+
+class SearchResult(BaseModel):
+    video_id: str
+    video_title: str
+    channel_title: str
+    score: float
+    chapters: List[SearchChapter]
+
+
+class SearchResponse(BaseModel):
+    query: str
+    # videos matching any query term; results holds the best ones
+    total: int
+    results: List[SearchResult]
+
+
 class ChapterData(BaseModel):
     title: str
     key_points: List[str]
@@ -66,3 +89,21 @@ class Moment(BaseModel):
 
 class Transcript(BaseModel):
     moments: List[Moment]
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job(BaseModel):
+    job_id: str
+    video_id: str
+    status: JobStatus
+    uses_user_key: bool = False
+    status_code: Optional[int] = None
+    detail: Optional[str] = None
+    created_at: float
+    updated_at: float
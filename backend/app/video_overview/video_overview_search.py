@@ -0,0 +1,567 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from itertools import accumulate, repeat
+from operator import add, itemgetter, mul, sub, truediv
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import orjson
+
+from .video_overview_schemas import (
+    KeyPoint,
+    SearchChapter,
+    SearchResponse,
+    SearchResult,
+    VideoOverview,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over every generated overview, ranked with BM25. The index
+# lives in SQLite next to the other local stores:
+#   documents  one row per overview: its weighted length and a zlib-compressed
+#              record of the searchable text with key-point times, used both to
+#              show matches and to re-index without going back to Supabase
+#   postings   per (segment, term): the sorted doc ids, delta-encoded, and the
+#              term's weight in each doc, as one zlib-compressed blob of
+#              uint32/uint16 arrays; about 2 bytes a posting
+# Each add writes a new small segment; once MERGE_FACTOR segments of similar
+# size exist they are merged, so a write never rewrites the whole index.
+# Every worker keeps the compressed postings in memory and picks up segments
+# written or merged by other workers on its next query. Writes go through a
+# connection of their own, so a merge never holds up a query.
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "data/search.sqlite3")
+SEARCH_MAX_RESULTS = 50
+SEARCH_MAX_QUERY_CHARS = 200
+MERGE_FACTOR = 8
+# a binary search into a posting list costs about this many steps of a scan
+PROBE_COST = 16
+
+# BM25 parameters, and how much a term counts depending on where it appears
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3
+ASSOCIATION_WEIGHT = 2
+KEY_POINT_WEIGHT = 1
+MAX_TERM_WEIGHT = 65535
+SMALL_WBITS = 10
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset(
+    """a about an and are as at be but by can do does for from has have how i if in
+    into is it its not of on or so than that the their them then there these they
+    this to was we were what when where which while who why will with you your""".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    # lowercased words without stopwords; a trailing plural "s" is dropped so
+    # "transformers" finds "transformer"
+    tokens = [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+    return [
+        token[:-1] if len(token) > 3 and token[-1] == "s" and token[-2] != "s" else token
+        for token in tokens
+    ]
+
+
+# [video_title, channel_title,
+#  [[chapter title, [[key point, time], ...], [association, ...]], ...]]
+def index_record(overview: VideoOverview) -> list:
+    return [
+        overview.video_title,
+        overview.channel_title,
+        [
+            [
+                chapter.title,
+                [[point.text, point.time] for point in chapter.key_points],
+                chapter.associations,
+            ]
+            for chapter in overview.chapters
+        ],
+    ]
+
+
+def record_terms(record: list) -> Tuple[Counter, int]:
+    # term -> weight in this document, and the document's weighted length
+    video_title, _, chapters = record
+    titles = tokenize(video_title)
+    associations: List[str] = []
+    key_points: List[str] = []
+    for title, points, chapter_associations in chapters:
+        titles += tokenize(title)
+        for association in chapter_associations:
+            associations += tokenize(association)
+        for text, _ in points:
+            key_points += tokenize(text)
+    weights: Counter = Counter()
+    for tokens, weight in [
+        (titles, TITLE_WEIGHT),
+        (associations, ASSOCIATION_WEIGHT),
+        (key_points, KEY_POINT_WEIGHT),
+    ]:
+        for term, count in Counter(tokens).items():
+            weights[term] += weight * count
+    return weights, sum(weights.values())
+
+
+def encode_postings(postings: List[Tuple[int, int]]) -> bytes:
+    # the doc ids as uint32 deltas followed by the weights as uint16, compressed together
+    postings.sort()
+    doc_ids, weights = zip(*postings)
+    deltas = array("I", doc_ids[:1])
+    deltas.extend(map(sub, doc_ids[1:], doc_ids))
+    weight_values = array("H", map(min, weights, repeat(MAX_TERM_WEIGHT)))
+    raw = deltas.tobytes() + weight_values.tobytes()
+    # most lists are a few bytes, and zlib sets up a smaller window much faster
+    return zlib.compress(raw, wbits=SMALL_WBITS if len(raw) <= 1 << SMALL_WBITS else 15)
+
+
+def decode_postings(blob: bytes) -> Tuple[List[int], array]:
+    data = zlib.decompress(blob)
+    split = len(data) // 6 * 4
+    deltas = array("I")
+    deltas.frombytes(data[:split])
+    weights = array("H")
+    weights.frombytes(data[split:])
+    return list(accumulate(deltas)), weights
+
+
+class SearchIndex:
+    # sqlite3 calls block, so callers go through run_blocking
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # _lock guards the in-memory view and the connection queries use,
+        # _write_lock the one writes use
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # other workers write to the same file; wait for them rather than fail
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.isolation_level = None
+        # only takes effect on a new file; a record is a few KB, and 4 KB
+        # pages would fit just one of them each
+        self._conn.execute("pragma page_size=8192")
+        self._conn.execute("pragma journal_mode=wal")
+        self._writer = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._writer.isolation_level = None
+        self._writer.executescript(
+            """
+            create table if not exists documents (
+                doc_id integer primary key autoincrement,
+                video_id text not null unique,
+                length integer not null,
+                record blob not null
+            );
+            create table if not exists segments (
+                segment integer primary key autoincrement,
+                docs integer not null
+            );
+            create table if not exists postings (
+                segment integer not null,
+                term text not null,
+                data blob not null,
+                primary key (segment, term)
+            );
+            create table if not exists meta (key text primary key, value integer not null);
+            insert or ignore into meta values ('generation', 0);
+            """
+        )
+        self.queries = 0
+        self.merges = 0
+        self._reset()
+        with self._lock:
+            self._refresh(force=True)
+
+    # -- in-memory view of the file ---------------------------------------
+
+    def _reset(self):
+        self.generation: Optional[int] = None
+        self.data_version: Optional[int] = None
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self.max_doc_id = 0
+        # term -> segment -> encoded postings, still compressed
+        self.postings: Dict[str, Dict[int, bytes]] = {}
+        self.segment_terms: Dict[int, List[str]] = {}
+        self.segment_docs: Dict[int, int] = {}
+        self._norms: Dict[int, float] = {}
+
+    def _refresh(self, force: bool = False):
+        # data_version only moves when another connection commits
+        (data_version,) = self._conn.execute("pragma data_version").fetchone()
+        if data_version == self.data_version and not force:
+            return
+        # one read transaction, so documents and segments agree
+        self._conn.execute("begin")
+        try:
+            self._load(data_version)
+        finally:
+            self._conn.execute("commit")
+
+    def _load(self, data_version: int):
+        (generation,) = self._conn.execute(
+            "select value from meta where key = 'generation'"
+        ).fetchone()
+        if generation != self.generation:
+            # rebuilt by another process: nothing in memory is valid
+            self._reset()
+        self.generation = generation
+        self.data_version = data_version
+
+        for doc_id, length in self._conn.execute(
+            "select doc_id, length from documents where doc_id > ?", (self.max_doc_id,)
+        ):
+            self.lengths[doc_id] = length
+            self.total_length += length
+            self.max_doc_id = max(self.max_doc_id, doc_id)
+
+        current = dict(self._conn.execute("select segment, docs from segments"))
+        for segment in set(self.segment_terms) - set(current):
+            # merged away
+            del self.segment_docs[segment]
+            for term in self.segment_terms.pop(segment):
+                segments = self.postings[term]
+                del segments[segment]
+                if not segments:
+                    del self.postings[term]
+        added = sorted(set(current) - set(self.segment_terms))
+        for segment in added:
+            terms = []
+            for term, data in self._conn.execute(
+                "select term, data from postings where segment = ?", (segment,)
+            ):
+                self.postings.setdefault(term, {})[segment] = data
+                terms.append(term)
+            self.segment_terms[segment] = terms
+            self.segment_docs[segment] = current[segment]
+
+    # -- writes -----------------------------------------------------------
+
+    def add(self, overviews: Iterable[Tuple[str, VideoOverview]]) -> int:
+        # overviews that are already indexed are skipped; returns how many were
+        # added. They are searchable as soon as this returns; segments are
+        # merged separately, see merge().
+        records = [(video_id, index_record(overview)) for video_id, overview in overviews]
+        with self._write_lock:
+            added = self._transaction(self._insert, records)
+        with self._lock:
+            self._refresh()
+        return added
+
+    def _transaction(self, func, *args):
+        self._writer.execute("begin immediate")
+        try:
+            result = func(*args)
+            self._writer.execute("commit")
+        except BaseException:
+            self._writer.execute("rollback")
+            raise
+        return result
+
+    def _insert(self, records: List[Tuple[str, list]]) -> int:
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        docs = 0
+        for video_id, record in records:
+            weights, length = record_terms(record)
+            cursor = self._writer.execute(
+                "insert or ignore into documents (video_id, length, record) values (?, ?, ?)",
+                (video_id, length, zlib.compress(orjson.dumps(record))),
+            )
+            if cursor.rowcount == 0:
+                continue
+            docs += 1
+            for term, weight in weights.items():
+                postings.setdefault(term, []).append((cursor.lastrowid, weight))
+        if not postings:
+            return docs
+        segment = self._writer.execute(
+            "insert into segments (docs) values (?)", (docs,)
+        ).lastrowid
+        self._writer.executemany(
+            "insert into postings values (?, ?, ?)",
+            ((segment, term, encode_postings(entries)) for term, entries in postings.items()),
+        )
+        return docs
+
+    def merge_due(self) -> bool:
+        return bool(merge_groups(self.segment_docs.items()))
+
+    def merge(self) -> int:
+        # Tiered: MERGE_FACTOR segments of the same size class become one of
+        # the next class, so each doc is rewritten about log8(docs) times.
+        # One group per transaction, so other workers' writes get a turn.
+        merged = 0
+        with self._write_lock:
+            while self._transaction(self._merge_next):
+                merged += 1
+        if merged:
+            with self._lock:
+                self._refresh()
+        return merged
+
+    def _merge_next(self) -> bool:
+        # groups are read inside the transaction, so two workers merging at
+        # once never pick the same segments
+        groups = merge_groups(self._writer.execute("select segment, docs from segments"))
+        if not groups:
+            return False
+        group = groups[0]
+        placeholders = ",".join("?" * len(group))
+        merged: Dict[str, List[Tuple[int, int]]] = {}
+        for term, data in self._writer.execute(
+            f"select term, data from postings where segment in ({placeholders})", group
+        ):
+            merged.setdefault(term, []).extend(zip(*decode_postings(data)))
+        segment = self._writer.execute(
+            f"insert into segments (docs) select sum(docs) from segments "
+            f"where segment in ({placeholders})",
+            group,
+        ).lastrowid
+        self._writer.execute(f"delete from postings where segment in ({placeholders})", group)
+        self._writer.execute(f"delete from segments where segment in ({placeholders})", group)
+        self._writer.executemany(
+            "insert into postings values (?, ?, ?)",
+            ((segment, term, encode_postings(entries)) for term, entries in merged.items()),
+        )
+        self.merges += 1
+        logger.info(f"Merged {len(group)} search index segments into segment {segment}")
+        return True
+
+    def replace_with(self, rebuilt_path: str) -> int:
+        # Swaps in an index built elsewhere (see app.rebuild_search_index) in
+        # one transaction. Overviews indexed here meanwhile but missing from
+        # the rebuilt index are carried over from their stored records.
+        with self._write_lock:
+            self._writer.execute("attach database ? as rebuilt", (rebuilt_path,))
+            try:
+                carried = self._transaction(self._replace)
+            finally:
+                self._writer.execute("detach database rebuilt")
+        self.merge()
+        with self._lock:
+            self._refresh()
+        return carried
+
+    def _replace(self) -> int:
+        carried = [
+            (video_id, orjson.loads(zlib.decompress(record)))
+            for video_id, record in self._writer.execute(
+                "select video_id, record from main.documents where video_id not in "
+                "(select video_id from rebuilt.documents)"
+            )
+        ]
+        for table in ["postings", "segments", "documents"]:
+            self._writer.execute(f"delete from main.{table}")
+            self._writer.execute(f"insert into main.{table} select * from rebuilt.{table}")
+        self._insert(carried)
+        self._writer.execute("update main.meta set value = value + 1 where key = 'generation'")
+        return len(carried)
+
+    # -- queries ----------------------------------------------------------
+
+    def search(self, query: str, limit: int = 10) -> SearchResponse:
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            self.queries += 1
+            self._refresh()
+            top, total = self._score(terms, limit)
+            records = {}
+            if top:
+                placeholders = ",".join("?" * len(top))
+                for doc_id, video_id, record in self._conn.execute(
+                    f"select doc_id, video_id, record from documents where doc_id in ({placeholders})",
+                    [doc_id for doc_id, _ in top],
+                ):
+                    records[doc_id] = (video_id, orjson.loads(zlib.decompress(record)))
+        pattern = term_pattern(terms)
+        return SearchResponse(
+            query=query,
+            total=total,
+            results=[
+                search_result(*records[doc_id], score, terms, pattern)
+                for doc_id, score in top
+                if doc_id in records
+            ],
+        )
+
+    def norms(self) -> Dict[int, float]:
+        # BM25's length normalisation per doc, k1 * (1 - b + b * length / avg_length);
+        # only recomputed after documents were added
+        if len(self._norms) != len(self.lengths):
+            per_unit = BM25_K1 * BM25_B * len(self.lengths) / self.total_length
+            base = BM25_K1 * (1 - BM25_B)
+            self._norms = {doc_id: base + per_unit * length for doc_id, length in self.lengths.items()}
+        return self._norms
+
+    def _score(self, terms: List[str], limit: int) -> Tuple[List[Tuple[int, float]], int]:
+        # the `limit` best docs with their scores, and how many docs matched
+        n_docs = len(self.lengths)
+        if not n_docs:
+            return [], 0
+        norms = self.norms()
+        lists = []
+        for term in terms:
+            segments = self.postings.get(term)
+            if not segments:
+                continue
+            decoded = [decode_postings(data) for data in segments.values()]
+            df = sum(len(doc_ids) for doc_ids, _ in decoded)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            boost = idf * (BM25_K1 + 1)
+            max_weight = max(max(weights) for _, weights in decoded)
+            # no doc gets more than this from the term: its norm is at least k1 * (1 - b)
+            bound = boost * max_weight / (max_weight + BM25_K1 * (1 - BM25_B))
+            lists.append((bound, boost, decoded))
+
+        # Term at a time, rarest (highest bound) first. Once the current
+        # limit-th score beats everything the remaining terms could add, docs
+        # not scored yet cannot make the top any more, so the remaining
+        # (common, long) lists are only probed for the candidates.
+        lists.sort(key=itemgetter(0), reverse=True)
+        remaining = sum(bound for bound, _, _ in lists)
+        scores: Dict[int, float] = {}
+        total = None
+        for bound, boost, decoded in lists:
+            postings = sum(len(doc_ids) for doc_ids, _ in decoded)
+            # probing only pays off for few candidates; a scan is exact anyway
+            threshold = top_score(scores, limit) if len(scores) * PROBE_COST < postings else None
+            if threshold is not None and threshold >= remaining:
+                if total is None:
+                    # from here on, scores no longer holds every matching doc
+                    total = len(
+                        set(scores).union(
+                            *(doc_ids for _, _, later in lists for doc_ids, _ in later)
+                        )
+                    )
+                for doc_id in [
+                    doc_id for doc_id, score in scores.items() if score + remaining < threshold
+                ]:
+                    del scores[doc_id]
+                for doc_ids, weights in decoded:
+                    for doc_id in scores:
+                        i = bisect_left(doc_ids, doc_id)
+                        if i < len(doc_ids) and doc_ids[i] == doc_id:
+                            weight = weights[i]
+                            scores[doc_id] += boost * weight / (weight + norms[doc_id])
+            elif not scores:
+                # segments hold disjoint docs
+                for doc_ids, weights in decoded:
+                    scores.update(zip(doc_ids, contributions(boost, doc_ids, weights, norms)))
+            else:
+                for doc_ids, weights in decoded:
+                    for doc_id, score in zip(doc_ids, contributions(boost, doc_ids, weights, norms)):
+                        scores[doc_id] = scores.get(doc_id, 0.0) + score
+            remaining -= bound
+        threshold = top_score(scores, limit)
+        top = [
+            (doc_id, score)
+            for doc_id, score in scores.items()
+            if threshold is None or score >= threshold
+        ]
+        top.sort(key=itemgetter(1), reverse=True)
+        return top[:limit], len(scores) if total is None else total
+
+    def indexed_video_ids(self) -> Set[str]:
+        with self._lock:
+            return {video_id for (video_id,) in self._conn.execute("select video_id from documents")}
+
+    def summary(self):
+        return {
+            "documents": len(self.lengths),
+            "terms": len(self.postings),
+            "segments": len(self.segment_terms),
+            "queries": self.queries,
+            "merges": self.merges,
+        }
+
+    def close(self):
+        self._conn.close()
+        self._writer.close()
+
+
+def top_score(scores: Dict[int, float], limit: int) -> Optional[float]:
+    # the limit-th best score so far, once there are that many
+    if len(scores) < limit:
+        return None
+    return heapq.nlargest(limit, scores.values())[-1]
+
+
+def contributions(boost: float, doc_ids: List[int], weights: array, norms: Dict[int, float]):
+    # boost * weight / (weight + norm) for each posting, computed without a
+    # Python-level loop
+    return map(
+        truediv,
+        map(mul, repeat(boost), weights),
+        map(add, weights, map(norms.__getitem__, doc_ids)),
+    )
+
+
+def merge_groups(segments: Iterable[Tuple[int, int]]) -> List[List[int]]:
+    # segments (id, docs) that are due to be merged, MERGE_FACTOR at a time
+    levels: Dict[int, List[int]] = {}
+    for segment, docs in segments:
+        levels.setdefault(int(math.log(max(docs, 1), MERGE_FACTOR)), []).append(segment)
+    return [
+        sorted(group)[:MERGE_FACTOR] for group in levels.values() if len(group) >= MERGE_FACTOR
+    ]
+
+
+def term_pattern(terms: List[str]) -> re.Pattern:
+    # matches, in lowercased text, exactly the words tokenize() turns into one
+    # of the terms, so results are not tokenized again word by word
+    forms = []
+    for term in terms:
+        forms.append(re.escape(term))
+        if len(term) >= 3 and not term.endswith("s"):
+            forms.append(re.escape(term) + "s")
+    return re.compile(r"(?<![^\W_])(?:%s)(?![^\W_])" % "|".join(forms))
+
+
+def search_result(
+    video_id: str, record: list, score: float, terms: List[str], pattern: re.Pattern
+) -> SearchResult:
+    # the chapters the query matched, with the key points that contain a query term
+    video_title, channel_title, chapters = record
+
+    def mentions(text: str) -> bool:
+        # the substring test rules most texts out before the slower regex
+        lowered = text.lower()
+        return any(term in lowered for term in terms) and pattern.search(lowered) is not None
+
+    matched = []
+    for title, key_points, associations in chapters:
+        points = [KeyPoint(text=text, time=time) for text, time in key_points if mentions(text)]
+        if points or mentions(title) or any(mentions(association) for association in associations):
+            matched.append(
+                SearchChapter(
+                    title=title,
+                    time=key_points[0][1] if key_points else 0.0,
+                    key_points=points,
+                )
+            )
+    return SearchResult(
+        video_id=video_id,
+        video_title=video_title,
+        channel_title=channel_title,
+        score=round(score, 4),
+        chapters=matched,
+    )
+
+
+@lru_cache
+def get_search_index() -> Optional[SearchIndex]:
+    # an empty SEARCH_INDEX_PATH disables search
+    if not SEARCH_INDEX_PATH:
+        return None
+    return SearchIndex(SEARCH_INDEX_PATH)
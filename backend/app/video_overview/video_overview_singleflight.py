@@ -0,0 +1,32 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class SingleFlight:
+    # Concurrent callers for the same key share one in-flight task. The task is
+    # detached from whoever started it, so a disconnecting client does not throw
+    # away work the other callers are waiting on.
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: str) -> Optional[Awaitable]:
+        task = self._in_flight.get(key)
+        if task is None:
+            return None
+        self.coalesced += 1
+        return asyncio.shield(task)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        joined = self.join(key)
+        if joined is not None:
+            return await joined
+        task = asyncio.create_task(fn())
+        self._in_flight[key] = task
+        self.started += 1
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def in_flight_count(self) -> int:
+        return len(self._in_flight)
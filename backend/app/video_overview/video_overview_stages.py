@@ -0,0 +1,102 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ..metrics import span
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def stage_timeout_s(name: str, default: float) -> float:
+    return float(os.getenv(f"STAGE_TIMEOUT_{name.upper()}_S", str(default)))
+
+
+class Stage(NamedTuple):
+    name: str
+    # called with the results of `deps` as keyword arguments
+    run: Callable[..., Awaitable[Any]]
+    deps: Tuple[str, ...] = ()
+    # bounds the stage's own work, not the wait for its dependencies
+    timeout_s: Optional[float] = None
+    # a speculative stage's failure only reaches the stages that use its result
+    speculative: bool = False
+
+
+class ShortCircuit(Exception):
+    # raised by a stage to end the whole graph early with `value`
+    def __init__(self, value: Any):
+        super().__init__("short circuit")
+        self.value = value
+
+
+stage_stats = {"runs": 0, "short_circuits": 0, "timeouts": 0, "cancelled": 0}
+
+
+class StageGraph:
+    # Runs a small DAG of async stages. Every stage starts as soon as its
+    # dependencies are done, so independent stages overlap. The first failure
+    # of a non-speculative stage (including a ShortCircuit) cancels everything
+    # still running, and result() re-raises it for every stage.
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: Dict[str, Stage] = {stage.name: stage for stage in stages}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._failure: Optional[BaseException] = None
+
+    def start(self) -> "StageGraph":
+        stage_stats["runs"] += 1
+        for name in self.stages:
+            self._tasks[name] = asyncio.create_task(self._run(self.stages[name]))
+        for name, task in self._tasks.items():
+            task.add_done_callback(lambda task, name=name: self._on_done(name, task))
+        return self
+
+    async def _run(self, stage: Stage):
+        kwargs = {}
+        for dep in stage.deps:
+            # asyncio.wait, not await: cancelling this stage must not cancel
+            # a dependency that other stages share
+            await asyncio.wait([self._tasks[dep]])
+            kwargs[dep] = self._tasks[dep].result()
+        with span(stage.name):
+            try:
+                return await asyncio.wait_for(stage.run(**kwargs), stage.timeout_s)
+            except asyncio.TimeoutError:
+                stage_stats["timeouts"] += 1
+                logger.warning(f"stage {stage.name} timed out after {stage.timeout_s}s")
+                raise HTTPException(
+                    status_code=504,
+                    detail=f"Timed out while processing the request ({stage.name}).",
+                )
+
+    def _on_done(self, name: str, task: asyncio.Task):
+        if task.cancelled():
+            return
+        # reading the exception also keeps asyncio from logging it as unretrieved
+        error = task.exception()
+        if error is None or self._failure is not None or self.stages[name].speculative:
+            return
+        if isinstance(error, ShortCircuit):
+            stage_stats["short_circuits"] += 1
+        self._failure = error
+        self.cancel()
+
+    def when_done(self, name: str, callback: Callable[[], None]):
+        # runs `callback` once the stage has returned, failed or been cancelled;
+        # the stage may never have started
+        self._tasks[name].add_done_callback(lambda task: callback())
+
+    def cancel(self):
+        for task in self._tasks.values():
+            if not task.done():
+                stage_stats["cancelled"] += 1
+                task.cancel()
+
+    async def result(self, name: str):
+        task = self._tasks[name]
+        await asyncio.wait([task])
+        if self._failure is not None and (task.cancelled() or task.exception() is not None):
+            raise self._failure
+        return task.result()
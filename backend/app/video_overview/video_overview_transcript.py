@@ -0,0 +1,83 @@
+import os
+from typing import List, Optional, Tuple
+
+from .video_overview_schemas import Moment
+
+# Caption moments are tiny (a few words each), so the prompt spends a large share
+# of its tokens on repeated float timestamps. Adjacent moments are merged into
+# sentence- or window-sized segments with integer-second timestamps.
+TRANSCRIPT_TOKEN_BUDGET = int(os.getenv("TRANSCRIPT_TOKEN_BUDGET", "50000"))
+SEGMENT_MAX_SECONDS = 20.0
+SEGMENT_MAX_CHARS = 300
+SEGMENT_MIN_CHARS = 80
+# rough average for English transcripts with the Claude tokenizer
+CHARS_PER_TOKEN = 4
+SENTENCE_ENDINGS = (".", "?", "!")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def segment_moments(
+    moments: List[Moment],
+    max_seconds: float = SEGMENT_MAX_SECONDS,
+    max_chars: int = SEGMENT_MAX_CHARS,
+    min_chars: int = SEGMENT_MIN_CHARS,
+) -> List[Tuple[int, str]]:
+    segments = []
+    texts: List[str] = []
+    start = 0.0
+    length = 0
+    for moment in moments:
+        if not moment.text:
+            continue
+        if texts and (
+            length >= max_chars
+            or moment.start - start >= max_seconds
+            or (length >= min_chars and texts[-1].endswith(SENTENCE_ENDINGS))
+        ):
+            segments.append((int(start), " ".join(texts)))
+            texts = []
+        if not texts:
+            start = moment.start
+            length = 0
+        texts.append(moment.text)
+        length += len(moment.text) + 1
+    if texts:
+        segments.append((int(start), " ".join(texts)))
+    return segments
+
+
+def format_segments(segments: List[Tuple[int, str]]) -> str:
+    return "".join([f"{start}: {text}\n" for start, text in segments])
+
+
+def compact_transcript_text(
+    moments: List[Moment], token_budget: Optional[int] = None
+) -> str:
+    # Coarser segments trade timestamp granularity for tokens; if even the
+    # coarsest segmentation is over budget, the tail is cut at the budget.
+    max_seconds, max_chars = SEGMENT_MAX_SECONDS, SEGMENT_MAX_CHARS
+    text = format_segments(segment_moments(moments, max_seconds, max_chars))
+    if token_budget is None:
+        return text
+    for _ in range(2):
+        if estimate_tokens(text) <= token_budget:
+            return text
+        max_seconds, max_chars = max_seconds * 3, max_chars * 3
+        text = format_segments(segment_moments(moments, max_seconds, max_chars))
+    if estimate_tokens(text) <= token_budget:
+        return text
+    cut = text.rfind("\n", 0, token_budget * CHARS_PER_TOKEN)
+    return text[: cut + 1] if cut != -1 else text[: token_budget * CHARS_PER_TOKEN]
+
+
+def transcript_text_after(transcript_text: str, after_s: float) -> str:
+    # the segments of a formatted transcript that start after `after_s`
+    lines = transcript_text.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        start, _, _ = line.partition(":")
+        if start.isdigit() and int(start) > after_s:
+            return "".join(lines[i:])
+    return ""
@@ -0,0 +1,336 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from ..config import is_prod
+from .video_overview_io import run_blocking
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Transcripts come through a residential proxy because YouTube blocks cloud IPs.
+# Each smartproxy port above PROXY_FIRST_STICKY_PORT pins one exit IP, so the
+# fetcher keeps a few of those sticky sessions open with a pooled HTTP session
+# each, and moves a slot to a fresh port when its exit IP starts failing.
+PROXY_HOST = os.getenv("PROXY_HOST", "gate.smartproxy.com")
+PROXY_FIRST_STICKY_PORT = int(os.getenv("PROXY_FIRST_STICKY_PORT", "10001"))
+PROXY_STICKY_PORTS = int(os.getenv("PROXY_STICKY_PORTS", "100"))
+TRANSCRIPT_PROXY_SESSIONS = int(os.getenv("TRANSCRIPT_PROXY_SESSIONS", "4"))
+# smartproxy keeps a sticky exit IP for 10 minutes
+TRANSCRIPT_PROXY_SESSION_TTL_S = float(os.getenv("TRANSCRIPT_PROXY_SESSION_TTL_S", "540"))
+
+# Retries stop at whichever comes first: the attempts or the total deadline.
+# The deadline stays below the transcript stage timeout.
+TRANSCRIPT_FETCH_ATTEMPTS = int(os.getenv("TRANSCRIPT_FETCH_ATTEMPTS", "4"))
+TRANSCRIPT_FETCH_DEADLINE_S = float(os.getenv("TRANSCRIPT_FETCH_DEADLINE_S", "45"))
+TRANSCRIPT_REQUEST_TIMEOUT_S = float(os.getenv("TRANSCRIPT_REQUEST_TIMEOUT_S", "10"))
+TRANSCRIPT_BACKOFF_BASE_S = float(os.getenv("TRANSCRIPT_BACKOFF_BASE_S", "0.5"))
+TRANSCRIPT_BACKOFF_MAX_S = float(os.getenv("TRANSCRIPT_BACKOFF_MAX_S", "8"))
+
+# After this many transient failures in a row the proxy is assumed down and
+# fetches fail fast for TRANSCRIPT_BREAKER_RESET_S, then one probe is let through.
+TRANSCRIPT_BREAKER_FAILURES = int(os.getenv("TRANSCRIPT_BREAKER_FAILURES", "8"))
+TRANSCRIPT_BREAKER_RESET_S = float(os.getenv("TRANSCRIPT_BREAKER_RESET_S", "30"))
+
+TRANSCRIPT_LANGUAGES = ("en",)
+
+transcript_fetch_stats = {
+    "fetches": 0,
+    "attempts": 0,
+    "retries": 0,
+    "transient_errors": 0,
+    "permanent_errors": 0,
+    "rotations": 0,
+    "breaker_trips": 0,
+    "fast_failures": 0,
+}
+
+
+def is_transient(error: BaseException) -> bool:
+    # Errors worth retrying through another exit IP: network and proxy
+    # failures, YouTube's captcha page and 429/403/5xx responses. Missing or
+    # disabled transcripts will not change on a retry.
+    from requests import RequestException
+    from youtube_transcript_api import (
+        FailedToCreateConsentCookie,
+        TooManyRequests,
+        YouTubeRequestFailed,
+    )
+
+    if isinstance(error, (RequestException, TooManyRequests, FailedToCreateConsentCookie)):
+        return True
+    if isinstance(error, YouTubeRequestFailed):
+        # raised while handling the requests HTTPError, which has the response
+        response = getattr(error.__context__, "response", None)
+        status = getattr(response, "status_code", None)
+        return status is None or status in (403, 429) or status >= 500
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def describe(error: BaseException) -> str:
+    # the transcript library's messages run to a dozen lines of advice
+    lines = str(error).strip().splitlines()
+    return f"{type(error).__name__}: {lines[0]}" if lines else type(error).__name__
+
+
+def fetch_transcript_once(session, video_id: str) -> List[dict]:
+    # YouTubeTranscriptApi.get_transcript opens a new requests.Session per call;
+    # the list fetcher takes ours so connections to the proxy are reused
+    from youtube_transcript_api._transcripts import TranscriptListFetcher
+
+    transcript_list = TranscriptListFetcher(session).fetch(video_id)
+    return transcript_list.find_transcript(TRANSCRIPT_LANGUAGES).fetch()
+
+
+def new_http_session(proxy_url: Optional[str], pool_size: int):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if proxy_url is not None:
+        session.proxies = {"http": proxy_url, "https": proxy_url}
+    # the transcript library never passes a timeout, and a stalled proxy
+    # connection would otherwise hold a pool thread forever
+    request = session.request
+    session.request = lambda method, url, **kwargs: request(
+        method, url, **{"timeout": TRANSCRIPT_REQUEST_TIMEOUT_S, **kwargs}
+    )
+    return session
+
+
+class ProxySession:
+    def __init__(self, port: Optional[int], session):
+        self.port = port
+        self.session = session
+        self.created_at = time.monotonic()
+
+
+class ProxyPool:
+    # A fixed number of slots, each holding one sticky proxy session. Attempts
+    # take slots round-robin; a slot whose exit IP failed, or that is about to
+    # be re-assigned a new IP by the provider, moves on to the next port.
+    def __init__(
+        self,
+        username: Optional[str],
+        password: Optional[str],
+        host: str = PROXY_HOST,
+        first_port: int = PROXY_FIRST_STICKY_PORT,
+        ports: int = PROXY_STICKY_PORTS,
+        slots: int = TRANSCRIPT_PROXY_SESSIONS,
+        session_ttl_s: float = TRANSCRIPT_PROXY_SESSION_TTL_S,
+        pool_size: int = 8,
+    ):
+        self.credentials = f"{username}:{password}@" if username else ""
+        self.host = host
+        self.first_port = first_port
+        self.ports = max(ports, slots)
+        self.session_ttl_s = session_ttl_s
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._next_port = 0
+        self._next_slot = 0
+        self._slots: List[ProxySession] = [self._open() for _ in range(slots)]
+
+    def _open(self) -> ProxySession:
+        port = self.first_port + self._next_port % self.ports
+        self._next_port += 1
+        proxy_url = f"http://{self.credentials}{self.host}:{port}"
+        return ProxySession(port, new_http_session(proxy_url, self.pool_size))
+
+    def acquire(self) -> ProxySession:
+        with self._lock:
+            index = self._next_slot % len(self._slots)
+            self._next_slot += 1
+            slot = self._slots[index]
+            if time.monotonic() - slot.created_at > self.session_ttl_s:
+                slot = self._replace(index)
+            return slot
+
+    def rotate(self, failed: ProxySession):
+        with self._lock:
+            if failed in self._slots:
+                self._replace(self._slots.index(failed))
+
+    def _replace(self, index: int) -> ProxySession:
+        transcript_fetch_stats["rotations"] += 1
+        old = self._slots[index]
+        self._slots[index] = self._open()
+        # requests still in flight on the old session finish on their own
+        # connections; closing only drops the idle ones
+        old.session.close()
+        return self._slots[index]
+
+    def close(self):
+        for slot in self._slots:
+            slot.session.close()
+
+
+class DirectPool:
+    # one pooled session without a proxy, for local development
+    def __init__(self, pool_size: int = 8):
+        self.slot = ProxySession(None, new_http_session(None, pool_size))
+
+    def acquire(self) -> ProxySession:
+        return self.slot
+
+    def rotate(self, failed: ProxySession):
+        pass
+
+    def close(self):
+        self.slot.session.close()
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = TRANSCRIPT_BREAKER_FAILURES,
+        reset_s: float = TRANSCRIPT_BREAKER_RESET_S,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_s:
+            return "open"
+        return "half_open"
+
+    def retry_after_s(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_s - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._probing or (
+            self.opened_at is None and self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.opened_at is None:
+                transcript_fetch_stats["breaker_trips"] += 1
+                logger.error(
+                    f"Transcript proxy failed {self.consecutive_failures} times in a row, "
+                    f"failing fast for {self.reset_s}s"
+                )
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        # the probe ended without saying anything about the proxy
+        self._probing = False
+
+
+def backoff_s(attempt: int) -> float:
+    # "full jitter": spreads the retries of requests that failed together
+    return random.uniform(0, min(TRANSCRIPT_BACKOFF_MAX_S, TRANSCRIPT_BACKOFF_BASE_S * 2**attempt))
+
+
+class TranscriptFetcher:
+    def __init__(self, pool, breaker: Optional[CircuitBreaker] = None, fetch_once=fetch_transcript_once):
+        self.pool = pool
+        self.breaker = breaker or CircuitBreaker()
+        self.fetch_once = fetch_once
+
+    def unavailable(self, video_id: str, detail: str, retry_after_s: float) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=f"Could not fetch the transcript for video {video_id}: {detail}",
+            headers={"Retry-After": str(max(1, round(retry_after_s)))},
+        )
+
+    async def fetch(self, video_id: str, deadline_s: float = TRANSCRIPT_FETCH_DEADLINE_S) -> List[dict]:
+        transcript_fetch_stats["fetches"] += 1
+        deadline = time.monotonic() + deadline_s
+        last_error: Optional[BaseException] = None
+        for attempt in range(TRANSCRIPT_FETCH_ATTEMPTS):
+            if not self.breaker.allow():
+                transcript_fetch_stats["fast_failures"] += 1
+                raise self.unavailable(
+                    video_id, "the transcript proxy is unavailable", self.breaker.retry_after_s()
+                )
+            remaining = deadline - time.monotonic()
+            slot = self.pool.acquire()
+            transcript_fetch_stats["attempts"] += 1
+            try:
+                # the request timeout bounds the thread; wait_for bounds this call
+                raw = await asyncio.wait_for(
+                    run_blocking(self.fetch_once, slot.session, video_id), remaining
+                )
+            except asyncio.TimeoutError as e:
+                last_error = e
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # the proxy did its job; the video has no usable transcript
+                    transcript_fetch_stats["permanent_errors"] += 1
+                    self.breaker.record_success()
+                    raise
+                last_error = e
+            else:
+                self.breaker.record_success()
+                return raw
+
+            transcript_fetch_stats["transient_errors"] += 1
+            self.breaker.record_failure()
+            self.pool.rotate(slot)
+            logger.warning(
+                f"Transcript fetch for video {video_id} failed on attempt {attempt + 1} "
+                f"(proxy port {slot.port}): {describe(last_error)}"
+            )
+            delay = backoff_s(attempt)
+            if attempt + 1 == TRANSCRIPT_FETCH_ATTEMPTS or time.monotonic() + delay >= deadline:
+                break
+            transcript_fetch_stats["retries"] += 1
+            await asyncio.sleep(delay)
+        raise self.unavailable(
+            video_id,
+            describe(last_error),
+            TRANSCRIPT_BACKOFF_MAX_S,
+        )
+
+    def summary(self):
+        return {
+            **transcript_fetch_stats,
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+        }
+
+
+@lru_cache
+def get_transcript_fetcher() -> TranscriptFetcher:
+    # youtube transcript api works locally but not in cloud envs
+    # https://github.com/jdepoix/youtube-transcript-api/issues/303
+    if is_prod():
+        pool = ProxyPool(os.getenv("PROXY_USERNAME"), os.getenv("PROXY_PASSWORD"))
+    else:
+        pool = DirectPool()
+    return TranscriptFetcher(pool)
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from functools import lru_cache
+from typing import Optional
+
+from .video_overview_schemas import Moment, Transcript
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Transcripts are fetched through a paid proxy, so keep them on local disk.
+# Each transcript is stored column-wise: packed start and duration doubles, one
+# utf-8 text buffer and the byte offsets of each moment's text inside it.
+TRANSCRIPT_STORE_PATH = os.getenv("TRANSCRIPT_STORE_PATH", "data/transcripts.sqlite3")
+TRANSCRIPT_STORE_MAX_BYTES = int(
+    os.getenv("TRANSCRIPT_STORE_MAX_BYTES", str(512 * 1024 * 1024))
+)
+DEFAULT_TRANSCRIPT_LANGUAGE = "en"
+
+
+def pack_transcript(transcript: Transcript):
+    starts = array("d", (m.start for m in transcript.moments))
+    durations = array("d", (m.duration for m in transcript.moments))
+    offsets = array("I", [0])
+    encoded = []
+    for moment in transcript.moments:
+        text = moment.text.encode()
+        encoded.append(text)
+        offsets.append(offsets[-1] + len(text))
+    return starts.tobytes(), durations.tobytes(), b"".join(encoded), offsets.tobytes()
+
+
+def unpack_transcript(starts: bytes, durations: bytes, text: bytes, offsets: bytes) -> Transcript:
+    start_values = array("d")
+    start_values.frombytes(starts)
+    duration_values = array("d")
+    duration_values.frombytes(durations)
+    offset_values = array("I")
+    offset_values.frombytes(offsets)
+    return Transcript(
+        moments=[
+            Moment(
+                text=text[offset_values[i] : offset_values[i + 1]].decode(),
+                start=start_values[i],
+                duration=duration_values[i],
+            )
+            for i in range(len(start_values))
+        ]
+    )
+
+
+class TranscriptStore:
+    # sqlite3 calls block, so callers go through run_blocking
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            """create table if not exists transcripts (
+                video_id text not null,
+                language text not null,
+                starts blob not null,
+                durations blob not null,
+                text blob not null,
+                offsets blob not null,
+                size integer not null,
+                last_access real not null,
+                primary key (video_id, language)
+            )"""
+        )
+        self._conn.execute(
+            "create index if not exists transcripts_last_access on transcripts (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, video_id: str, language: str = DEFAULT_TRANSCRIPT_LANGUAGE) -> Optional[Transcript]:
+        with self._lock:
+            row = self._conn.execute(
+                "select starts, durations, text, offsets from transcripts where video_id = ? and language = ?",
+                (video_id, language),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "update transcripts set last_access = ? where video_id = ? and language = ?",
+                (time.time(), video_id, language),
+            )
+            self._conn.commit()
+        return unpack_transcript(*row)
+
+    def put(self, video_id: str, transcript: Transcript, language: str = DEFAULT_TRANSCRIPT_LANGUAGE):
+        starts, durations, text, offsets = pack_transcript(transcript)
+        size = len(starts) + len(durations) + len(text) + len(offsets)
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into transcripts values (?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, language, starts, durations, text, offsets, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (total,) = self._conn.execute("select coalesce(sum(size), 0) from transcripts").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "select video_id, language, size from transcripts order by last_access"
+        )
+        evicted = []
+        for video_id, language, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((video_id, language))
+            total -= size
+        self._conn.executemany(
+            "delete from transcripts where video_id = ? and language = ?", evicted
+        )
+        logger.info(f"Evicted {len(evicted)} transcripts from the transcript store")
+
+
+@lru_cache
+def get_transcript_store() -> Optional[TranscriptStore]:
+    # an empty TRANSCRIPT_STORE_PATH disables the store
+    if not TRANSCRIPT_STORE_PATH:
+        return None
+    return TranscriptStore(TRANSCRIPT_STORE_PATH, TRANSCRIPT_STORE_MAX_BYTES)
@@ -0,0 +1,11 @@
+import os
+
+# Benchmarks run fully offline and must not reuse state from earlier runs
+os.environ.setdefault("TRANSCRIPT_STORE_PATH", "")
+os.environ.setdefault("JOB_STORE_PATH", "")
+os.environ.setdefault("SEARCH_INDEX_PATH", "")
+
+# the in-process httpx client would otherwise log every request at INFO
+import logging
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -0,0 +1,154 @@
+# Overload: generate requests arrive faster than the (fake) LLM can serve them,
+# 20% of them with a user API key, while clients keep reading cached overviews.
+# Without admission control every request is accepted and waits inside the LLM
+# client, so latency and in-flight work grow for as long as the spike lasts.
+# With it, work in flight stays bounded, the overflow gets a fast 503, and
+# key holders go first.
+# python -m bench.admission_load --rate 40 --seconds 10
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from app.main import app
+from app.video_overview import video_overview
+from app.video_overview.video_overview_admission import AdmissionController
+from app.video_overview.video_overview_rate_limit import get_rate_limiter
+
+from .fakes import install_fakes
+from .overview_encoding import sample_overview
+from .report import percentile
+
+
+async def run(client, args, run_id: str):
+    rng = random.Random(0)
+    arrivals = random.Random(1)
+    results = {"priority": [], "free": []}
+    shed = {"priority": [], "free": []}
+    reads = []
+    peak_in_flight = 0
+    stop = asyncio.Event()
+
+    async def generate(i: int, with_key: bool):
+        start = time.perf_counter()
+        response = await client.post(
+            f"/generate-overview/{run_id}-{i:05d}",
+            json={"user_api_key": "sk-bench"} if with_key else {},
+            headers={"cf-connecting-ip": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}"},
+        )
+        elapsed = time.perf_counter() - start
+        priority_class = "priority" if with_key else "free"
+        if response.status_code == 200:
+            results[priority_class].append(elapsed)
+        elif response.status_code == 503:
+            assert "retry-after" in response.headers
+            shed[priority_class].append(elapsed)
+        else:
+            raise AssertionError(f"{response.status_code}: {response.text}")
+
+    async def cached_reader(video_ids):
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = await client.get(f"/get-overview/{rng.choice(video_ids)}")
+            assert response.status_code == 200
+            reads.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    # generations started and not finished, queued ones included
+    async def sample_in_flight():
+        nonlocal peak_in_flight
+        while not stop.is_set():
+            peak_in_flight = max(peak_in_flight, video_overview.generation_flight.in_flight_count())
+            await asyncio.sleep(0.05)
+
+    readers = [asyncio.create_task(cached_reader(args.cached_ids)) for _ in range(4)]
+    sampler = asyncio.create_task(sample_in_flight())
+    requests = []
+    start = time.perf_counter()
+    for i in range(int(args.rate * args.seconds)):
+        # open loop: arrivals do not wait for earlier responses
+        await asyncio.sleep(max(0.0, start + i / args.rate - time.perf_counter()))
+        requests.append(asyncio.create_task(generate(i, arrivals.random() < args.key_share)))
+    await asyncio.gather(*requests)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*readers, sampler)
+    return results, shed, reads, peak_in_flight, elapsed
+
+
+def ms(samples, p):
+    return f"{percentile(samples, p) * 1000:8.0f}" if samples else f"{'-':>8}"
+
+
+async def main(args):
+    fakes = install_fakes(
+        app,
+        db_latency_s=0.005,
+        transcript_latency_s=0.05,
+        youtube_latency_s=0.02,
+        llm_latency_s=args.llm_latency,
+    )
+    fakes.llm.capacity = asyncio.Semaphore(args.llm_capacity)
+    get_rate_limiter().total_limit = 10**9
+    args.cached_ids = [f"cached-{i}" for i in range(20)]
+    await video_overview.save_video_overviews(
+        [(video_id, sample_overview(20)) for video_id in args.cached_ids], fakes.supabase
+    )
+
+    capacity_rps = args.llm_capacity / args.llm_latency
+    print(
+        f"{args.rate:.0f} generate req/s for {args.seconds:.0f}s against ~{capacity_rps:.0f} req/s "
+        f"of LLM capacity, {args.key_share:.0%} with a user key"
+    )
+    print(
+        f"{'admission':<10}{'class':<10}{'ok':>5}{'p50 ms':>8}{'p99 ms':>8}"
+        f"{'503':>6}{'503 p99':>9}"
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        for name, controller in [
+            ("off", AdmissionController(max_in_flight=10**9)),
+            (
+                "on",
+                AdmissionController(
+                    max_in_flight=args.max_in_flight,
+                    max_queued=args.max_queued,
+                    queue_timeout_s=args.queue_timeout,
+                ),
+            ),
+        ]:
+            video_overview.generation_admission = controller
+            usage = fakes.supabase.tables["api_usage"][0]
+            hits_before = usage["total_hits"]
+            results, shed, reads, peak, elapsed = await run(client, args, name)
+            # quota is only charged for requests that got a slot
+            served = sum(len(ok) for ok in results.values())
+            assert usage["total_hits"] - hits_before == served, (usage, hits_before, served)
+            for priority_class in ["priority", "free"]:
+                ok, rejected = results[priority_class], shed[priority_class]
+                print(
+                    f"{name:<10}{priority_class:<10}{len(ok):>5}{ms(ok, 50)}{ms(ok, 99)}"
+                    f"{len(rejected):>6}{ms(rejected, 99):>9}"
+                )
+            print(
+                f"{name:<10}{'cached':<10}{len(reads):>5}{ms(reads, 50)}{ms(reads, 99)}"
+                f"   peak in flight {peak}, drained after {elapsed:.1f}s"
+            )
+            print(f"{'':<10}shed by reason: {controller.shed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=40)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--key-share", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-capacity", type=int, default=8)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--max-queued", type=int, default=16)
+    parser.add_argument("--queue-timeout", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+# A listing page's worth of overviews: one GET per id vs. one POST /get-overviews,
+# with and without projection. The overview cache is cleared before each run so
+# every variant pays for the database.
+# python -m bench.batch_read --videos 24
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.main import app
+from app.video_overview import video_overview
+from app.video_overview.video_overview_cache import overview_cache
+
+from .fakes import install_fakes
+from .overview_encoding import sample_overview
+
+
+async def timed(func, video_ids):
+    for video_id in video_ids:
+        overview_cache.invalidate(video_id)
+    start = time.perf_counter()
+    size = await func()
+    return (time.perf_counter() - start) * 1000, size
+
+
+async def main(args):
+    fakes = install_fakes(app, db_latency_s=args.db_latency_s)
+    video_ids = [f"list-{i:07d}" for i in range(args.videos)]
+    await video_overview.save_video_overviews(
+        [(video_id, sample_overview(30)) for video_id in video_ids], fakes.supabase
+    )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one_by_one():
+            responses = await asyncio.gather(
+                *(client.get(f"/get-overview/{video_id}") for video_id in video_ids)
+            )
+            return sum(len(r.content) for r in responses)
+
+        async def batch(fields=None):
+            response = await client.post(
+                "/get-overviews", json={"video_ids": video_ids, "fields": fields}
+            )
+            return len(response.content)
+
+        print(f"{args.videos} overviews, {args.db_latency_s * 1000:.0f} ms per query")
+        for name, func in [
+            ("GET /get-overview per id", one_by_one),
+            ("POST /get-overviews", batch),
+            (
+                "POST /get-overviews, projected",
+                lambda: batch(["video_title", "channel_title", "chapter_titles"]),
+            ),
+        ]:
+            elapsed_ms, size = await timed(func, video_ids)
+            print(f"  {name:<32}{elapsed_ms:8.1f} ms{size:10d} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=24)
+    parser.add_argument("--db-latency-s", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+# Compares single-prompt vs. chunked generation wall-clock time on a stubbed LLM.
+# python -m bench.chunked_generation --hours 3
+import argparse
+import asyncio
+import time
+
+from app.video_overview.video_overview import (
+    chapter_max_range,
+    chapter_min_range,
+    generate_chapters,
+    get_timestamped_transcript_text,
+)
+from app.video_overview.video_overview_chunking import (
+    CHUNK_MAX_CHARS,
+    generate_chunked_chapters,
+    split_transcript_windows,
+)
+from app.video_overview.video_overview_schemas import Moment, Transcript, VideoMetadata
+
+from .fakes import FakeAnthropic, synthetic_transcript
+
+
+async def main(args):
+    transcript = Transcript(
+        moments=[Moment(**m) for m in synthetic_transcript(int(args.hours * 3600))]
+    )
+    metadata = VideoMetadata(
+        title="bench",
+        chapters=[],
+        published_iso="2024-01-01T00:00:00Z",
+        duration_iso="PT3H",
+        channel_title="bench",
+    )
+    transcript_text = get_timestamped_transcript_text(transcript)
+    llm = FakeAnthropic(latency_s=1.0, latency_per_1k_chars=args.latency_per_1k_chars)
+
+    start = time.perf_counter()
+    await generate_chapters(transcript_text, [], llm)
+    single_s = time.perf_counter() - start
+
+    windows = split_transcript_windows(transcript, metadata, CHUNK_MAX_CHARS)
+    start = time.perf_counter()
+    chapters = await generate_chunked_chapters(
+        windows,
+        lambda window, chapter_range: generate_chapters(
+            get_timestamped_transcript_text(Transcript(moments=window.moments)),
+            window.existing_chapters,
+            llm,
+            chapter_range,
+        ),
+        (chapter_min_range, chapter_max_range),
+        concurrency=args.concurrency,
+    )
+    chunked_s = time.perf_counter() - start
+
+    print(f"transcript chars: {len(transcript_text)}, windows: {len(windows)}")
+    print(f"single prompt: {single_s:6.2f}s")
+    print(f"chunked:       {chunked_s:6.2f}s ({len(chapters)} chapters)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-per-1k-chars", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
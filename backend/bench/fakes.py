@@ -0,0 +1,589 @@
+# Offline stand-ins for the upstream services the backend talks to.
+# Blocking fakes use time.sleep on purpose: they model the sync SDKs, so any
+# call that is not offloaded from the event loop shows up in the numbers.
+import asyncio
+import base64
+import copy
+import html
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Optional
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+def jsonb_text(value) -> str:
+    # what Postgres prints for jsonb::text: keys shortest first, then
+    # bytewise, with ", " and ": " separators
+    def reorder(value):
+        if isinstance(value, dict):
+            return {key: reorder(value[key]) for key in sorted(value, key=lambda k: (len(k), k))}
+        if isinstance(value, list):
+            return [reorder(item) for item in value]
+        return value
+
+    return json.dumps(reorder(value), ensure_ascii=False)
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.payload = None
+        self.filters = []
+        self.columns = ["*"]
+        self.order_by = None
+        self.max_rows = None
+
+    def select(self, *columns):
+        self.op = "select"
+        self.columns = [c.strip() for column in columns for c in column.split(",")]
+        return self
+
+    def insert(self, row):
+        self.op = "insert"
+        self.payload = row
+        return self
+
+    def update(self, values):
+        self.op = "update"
+        self.payload = values
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) < value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) > value)
+        return self
+
+    def order(self, column):
+        self.order_by = column
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def _project(self, row):
+        # PostgREST column lists, including `column::text` casts
+        if self.columns == ["*"]:
+            return row
+        projected = {}
+        for column in self.columns:
+            name, _, cast = column.partition("::")
+            value = row.get(name)
+            if cast == "text" and value is not None and not isinstance(value, str):
+                value = jsonb_text(value)
+            projected[name] = value
+        return projected
+
+    def execute(self):
+        time.sleep(self.db.latency_s)
+        rows = self.db.tables.setdefault(self.table, [])
+        with self.db.lock:
+            if self.op == "insert":
+                new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                rows.extend(copy.deepcopy(new_rows))
+                return FakeResult(copy.deepcopy(new_rows))
+            matched = [row for row in rows if self._matches(row)]
+            if self.op == "update":
+                for row in matched:
+                    row.update(self.payload)
+            if self.op == "delete":
+                rows[:] = [row for row in rows if not self._matches(row)]
+            if self.op == "select":
+                if self.order_by is not None:
+                    matched.sort(key=lambda row: row[self.order_by])
+                if self.max_rows is not None:
+                    matched = matched[: self.max_rows]
+                matched = [self._project(row) for row in matched]
+            return FakeResult(copy.deepcopy(matched))
+
+
+class FakeSupabase:
+    def __init__(self, latency_s: float = 0.01):
+        self.latency_s = latency_s
+        self.lock = threading.Lock()
+        self.tables = {"api_usage": [{"id": 1, "total_hits": 0}], "rate_limits": []}
+
+    def table(self, name: str):
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict):
+        return FakeRpc(self, name, params)
+
+
+class FakeRpc:
+    # emulates the stored procedures in sql/rate_limits.sql
+    def __init__(self, db: FakeSupabase, name: str, params: dict):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        time.sleep(self.db.latency_s)
+        with self.db.lock:
+            usage = self.db.tables["api_usage"][0]
+            if self.name == "incr_api_usage":
+                usage["total_hits"] += 1
+                return FakeResult(None)
+            if self.name == "refund_free_generation":
+                for row in self.db.tables["rate_limits"]:
+                    if row["ip"] == self.params["p_ip"]:
+                        row["count"] = max(row["count"] - 1, 0)
+                usage["total_hits"] = max(usage["total_hits"] - 1, 0)
+                return FakeResult(None)
+            if self.name == "decr_api_usage":
+                usage["total_hits"] = max(usage["total_hits"] - 1, 0)
+                return FakeResult(None)
+            if self.name == "admit_free_generation":
+                rows = self.db.tables["rate_limits"]
+                row = next((r for r in rows if r["ip"] == self.params["p_ip"]), None)
+                if row is not None and row["count"] >= self.params["p_user_limit"]:
+                    return FakeResult("user_limit")
+                if usage["total_hits"] >= self.params["p_total_limit"]:
+                    return FakeResult("total_limit")
+                if row is None:
+                    rows.append({"ip": self.params["p_ip"], "count": 1})
+                else:
+                    row["count"] += 1
+                usage["total_hits"] += 1
+                return FakeResult("ok")
+        raise ValueError(f"unknown rpc {self.name}")
+
+
+def synthetic_transcript(duration_s: int, caption_s: float = 3.0):
+    words = "so the key idea here is that we iterate quickly and learn from users".split()
+    moments = []
+    t = 0.0
+    i = 0
+    while t < duration_s:
+        text = " ".join(words[(i + k) % len(words)] for k in range(8))
+        moments.append({"text": text, "start": round(t, 2), "duration": caption_s})
+        t += caption_s
+        i += 1
+    return moments
+
+
+class FakeTranscriptApi:
+    # durations_s: transcript lengths to pick from, stable per video id
+    def __init__(self, latency_s: float = 0.2, duration_s: int = 1800, durations_s=None):
+        self.latency_s = latency_s
+        self.durations_s = durations_s or [duration_s]
+        self.calls = 0
+
+    def duration_for(self, video_id: str) -> int:
+        return self.durations_s[zlib.crc32(video_id.encode()) % len(self.durations_s)]
+
+    def fetch(self, session, video_id):
+        # the TranscriptFetcher's per-attempt call
+        self.calls += 1
+        time.sleep(self.latency_s)
+        return synthetic_transcript(self.duration_for(video_id))
+
+
+class FakeYouTubeClient:
+    def __init__(self, latency_s: float = 0.05):
+        self.latency_s = latency_s
+
+    def videos(self):
+        return self
+
+    def list(self, part, id):
+        ids = id.split(",")
+        latency_s = self.latency_s
+
+        def execute():
+            time.sleep(latency_s)
+            return {
+                "items": [
+                    {
+                        "id": video_id,
+                        "snippet": {
+                            "title": f"Video {video_id}",
+                            "publishedAt": "2024-01-01T00:00:00Z",
+                            "channelTitle": "Bench Channel",
+                            "description": "",
+                        },
+                        "contentDetails": {"duration": "PT30M"},
+                    }
+                    for video_id in ids
+                ]
+            }
+
+        return SimpleNamespace(execute=execute)
+
+
+def fake_overview_json(n_chapters: int = 10, start_s: int = 0) -> str:
+    chapters = [
+        {
+            "title": f"Chapter {i}",
+            "key_points": [f"Point {i}.{j}" for j in range(3)],
+            "key_point_start_times": [start_s + i * 60 + j * 10 for j in range(3)],
+            "associations": [f"topic {i}"],
+        }
+        for i in range(n_chapters)
+    ]
+    return json.dumps({"chapters": chapters})
+
+
+def prompt_chars(messages) -> int:
+    total = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            total += len(content)
+        else:
+            total += sum(len(block.get("text", "")) for block in content)
+    return total
+
+
+def transcript_start_s(messages) -> int:
+    # first timestamp of the transcript in the final user turn
+    match = re.search(r"Here is the transcript: \n(\d+):", messages[-2]["content"])
+    return int(match.group(1)) if match else 0
+
+
+class FakeAnthropic:
+    # latency_per_1k_chars models prompt processing time growing with input size;
+    # max_output_chars cuts the completion off the way max_tokens does;
+    # max_concurrency models the upstream's throughput: extra calls wait their turn
+    def __init__(
+        self,
+        latency_s: float = 2.0,
+        n_chapters: int = 10,
+        latency_per_1k_chars: float = 0.0,
+        max_output_chars: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.latency_s = latency_s
+        self.n_chapters = n_chapters
+        self.latency_per_1k_chars = latency_per_1k_chars
+        self.max_output_chars = max_output_chars
+        self.capacity = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.calls = 0
+        self.output_chars = 0
+        self.messages = self
+
+    def latency_for(self, messages) -> float:
+        return self.latency_s + self.latency_per_1k_chars * prompt_chars(messages) / 1000
+
+    def completion_text(self, messages) -> str:
+        # the real prompt pre-fills the opening brace; chapters start where the
+        # transcript does, so continuations get later timestamps
+        text = fake_overview_json(self.n_chapters, transcript_start_s(messages))[1:]
+        if self.max_output_chars is not None:
+            text = text[: self.max_output_chars]
+        self.output_chars += len(text)
+        return text
+
+    def message(self, text: str):
+        truncated = self.max_output_chars is not None and len(text) >= self.max_output_chars
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=text)],
+            stop_reason="max_tokens" if truncated else "end_turn",
+            usage=SimpleNamespace(input_tokens=0, output_tokens=0),
+        )
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.capacity is not None:
+            async with self.capacity:
+                await asyncio.sleep(self.latency_for(kwargs["messages"]))
+        else:
+            await asyncio.sleep(self.latency_for(kwargs["messages"]))
+        return self.message(self.completion_text(kwargs["messages"]))
+
+    def stream(self, **kwargs):
+        self.calls += 1
+        return FakeMessageStream(
+            self, self.latency_for(kwargs["messages"]), self.completion_text(kwargs["messages"])
+        )
+
+
+class FakeMessageStream:
+    # Emits the completion in small deltas spread evenly over the call latency
+    def __init__(self, llm: FakeAnthropic, latency_s: float, text: str, piece_chars: int = 16):
+        self.llm = llm
+        self.latency_s = latency_s
+        self.text = text
+        self.pieces = [
+            self.text[i : i + piece_chars] for i in range(0, len(self.text), piece_chars)
+        ]
+
+    async def __aenter__(self):
+        if self.llm.capacity is not None:
+            await self.llm.capacity.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.llm.capacity is not None:
+            self.llm.capacity.release()
+        return False
+
+    @property
+    async def text_stream(self):
+        delay = self.latency_s / max(1, len(self.pieces))
+        for piece in self.pieces:
+            await asyncio.sleep(delay)
+            yield piece
+
+    async def get_final_message(self):
+        return self.llm.message(self.text)
+
+
+def install_fakes(
+    app,
+    db_latency_s: float = 0.01,
+    transcript_latency_s: float = 0.2,
+    transcript_durations_s=(1800,),
+    youtube_latency_s: float = 0.05,
+    llm_latency_s: float = 2.0,
+    llm_latency_per_1k_chars: float = 0.0,
+    n_chapters: int = 10,
+):
+    # Points the app at in-process fakes; no network access is needed afterwards
+    from app.video_overview import video_overview, video_overview_services
+    from app.video_overview.video_overview_deps import get_supabase_client
+    from app.video_overview.video_overview_transcript_fetch import (
+        DirectPool,
+        TranscriptFetcher,
+    )
+
+    fakes = SimpleNamespace(
+        supabase=FakeSupabase(latency_s=db_latency_s),
+        transcripts=FakeTranscriptApi(
+            latency_s=transcript_latency_s, durations_s=list(transcript_durations_s)
+        ),
+        youtube=FakeYouTubeClient(latency_s=youtube_latency_s),
+        llm=FakeAnthropic(
+            latency_s=llm_latency_s,
+            n_chapters=n_chapters,
+            latency_per_1k_chars=llm_latency_per_1k_chars,
+        ),
+    )
+    app.dependency_overrides[get_supabase_client] = lambda: fakes.supabase
+    video_overview.get_supabase_client = lambda: fakes.supabase
+    transcript_fetcher = TranscriptFetcher(DirectPool(), fetch_once=fakes.transcripts.fetch)
+    video_overview_services.get_transcript_fetcher = lambda: transcript_fetcher
+    video_overview_services.get_youtube_client = lambda: fakes.youtube
+    video_overview.get_anthropic_client = lambda *args, **kwargs: fakes.llm
+    return fakes
+
+
+class FakeRateLimitError(Exception):
+    # stands in for the SDKs' RateLimitError, which is matched by name
+    status_code = 429
+
+
+FakeRateLimitError.__name__ = "RateLimitError"
+
+
+class ScriptedProvider:
+    # An LLM provider for the router whose n-th call takes latencies[n] seconds
+    # (cycling). outcomes[n] is "ok", "rate_limit" or "invalid"; default "ok".
+    def __init__(self, name: str, latencies, outcomes=None, n_chapters: int = 10):
+        from app.video_overview.video_overview_llm_router import Completion
+
+        self.completion_type = Completion
+        self.name = name
+        self.latencies = list(latencies)
+        self.outcomes = list(outcomes or ["ok"])
+        self.n_chapters = n_chapters
+        self.calls = 0
+        self.cancelled = 0
+
+    async def complete(self, messages, system_prompt):
+        n = self.calls
+        self.calls += 1
+        outcome = self.outcomes[n % len(self.outcomes)]
+        try:
+            await asyncio.sleep(self.latencies[n % len(self.latencies)])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if outcome == "rate_limit":
+            raise FakeRateLimitError(f"{self.name} is rate limited")
+        text = fake_overview_json(self.n_chapters)[1:]
+        if outcome == "invalid":
+            text = text[: len(text) // 3] + "}"
+        return self.completion_type(text, "end_turn", None)
+
+
+class FakeYouTubeProxy:
+    # A forward HTTP proxy on `ports` consecutive ports (one per sticky exit
+    # IP) that answers for www.youtube.com itself: watch pages with a caption
+    # track, and timedtext XML. Clients must fetch plain-http YouTube URLs
+    # (see use_plain_http_watch_url) since there is no TLS to tunnel into.
+    # Failure knobs, changeable while running:
+    #   down          every connection is dropped without a response
+    #   blocked_ports those exit IPs get the captcha page
+    #   error_rate    fraction of requests answered with a 502
+    #   stall_rate    fraction of requests that hang for stall_s
+    def __init__(
+        self,
+        ports: int = 4,
+        latency_s: float = 0.02,
+        duration_s: int = 600,
+        credentials: str = "user:pass",
+        seed: int = 0,
+    ):
+        self.latency_s = latency_s
+        self.duration_s = duration_s
+        self.credentials = credentials
+        self.down = False
+        self.blocked_ports = set()
+        self.error_rate = 0.0
+        self.stall_rate = 0.0
+        self.stall_s = 30.0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.servers = self._bind(ports)
+        self.first_port = self.servers[0].server_address[1]
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def _bind(self, ports: int):
+        handler = self._handler()
+        for _ in range(50):
+            first = random.randint(20000, 60000 - ports)
+            servers = []
+            try:
+                for port in range(first, first + ports):
+                    servers.append(ThreadingHTTPServer(("127.0.0.1", port), handler))
+                return servers
+            except OSError:
+                for server in servers:
+                    server.server_close()
+        raise RuntimeError("no free port range for the fake proxy")
+
+    def proxy_url(self, port: Optional[int] = None) -> str:
+        return f"http://{self.credentials}@127.0.0.1:{port or self.first_port}"
+
+    def close(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def _roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.rng.random() < rate
+
+    def watch_page(self, video_id: str) -> str:
+        captions = {
+            "playerCaptionsTracklistRenderer": {
+                "captionTracks": [
+                    {
+                        "baseUrl": f"http://www.youtube.com/api/timedtext?v={video_id}&lang=en",
+                        "name": {"simpleText": "English (auto-generated)"},
+                        "languageCode": "en",
+                        "kind": "asr",
+                        "isTranslatable": False,
+                    }
+                ]
+            }
+        }
+        return (
+            '<html><script>var ytInitialPlayerResponse = {"playabilityStatus":{"status":"OK"},'
+            f'"captions":{json.dumps(captions)},"videoDetails":{{"videoId":"{video_id}"}}}};'
+            "</script></html>"
+        )
+
+    def timedtext(self) -> str:
+        lines = [
+            f'<text start="{m["start"]}" dur="{m["duration"]}">{html.escape(m["text"])}</text>'
+            for m in synthetic_transcript(self.duration_s)
+        ]
+        return '<?xml version="1.0" encoding="utf-8" ?><transcript>' + "".join(lines) + "</transcript>"
+
+    def _handler(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes; with Nagle on, a
+            # kept-alive connection waits on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with proxy.lock:
+                    proxy.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status: int, body: str, content_type: str = "text/html"):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                with proxy.lock:
+                    proxy.requests += 1
+                if proxy.down:
+                    self.close_connection = True
+                    return
+                expected = "Basic " + base64.b64encode(proxy.credentials.encode()).decode()
+                if self.headers.get("Proxy-Authorization") != expected:
+                    return self.reply(407, "proxy authentication required")
+                time.sleep(proxy.latency_s)
+                if proxy._roll(proxy.stall_rate):
+                    time.sleep(proxy.stall_s)
+                    self.close_connection = True
+                    return
+                if proxy._roll(proxy.error_rate):
+                    return self.reply(502, "bad gateway")
+                port = self.server.server_address[1]
+                query = dict(
+                    part.split("=", 1) for part in self.path.split("?", 1)[-1].split("&") if "=" in part
+                )
+                if "/watch" in self.path:
+                    if port in proxy.blocked_ports:
+                        return self.reply(200, '<html><div class="g-recaptcha"></div></html>')
+                    return self.reply(200, proxy.watch_page(query.get("v", "")))
+                if "/api/timedtext" in self.path:
+                    return self.reply(200, proxy.timedtext(), "text/xml")
+                self.reply(404, "not found")
+
+        return Handler
+
+
+def use_plain_http_watch_url():
+    # lets FakeYouTubeProxy serve the watch page without a TLS tunnel
+    from youtube_transcript_api import _transcripts
+
+    _transcripts.WATCH_URL = "http://www.youtube.com/watch?v={video_id}"
@@ -0,0 +1,115 @@
+# End-to-end offline benchmark of app.main:app. Upstream services are replaced by
+# fakes with configurable latency, and the real FastAPI app is driven in-process
+# under concurrent load.
+#
+#   python -m bench.harness --save baseline.json
+#   python -m bench.harness --baseline baseline.json
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+import httpx
+
+from app.main import app
+from app.video_overview.video_overview import job_queue
+from app.video_overview.video_overview_cache import overview_cache
+from app.video_overview.video_overview_deps import client_registry
+
+from .fakes import install_fakes
+from .report import load_results, print_results, save_results, summarize
+
+GENERATE_BODY = {"user_api_key": "bench"}
+
+
+async def run_load(
+    concurrency: int, total: int, send: Callable[[int], Awaitable[httpx.Response]]
+):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def client_loop():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await send(i)
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def main(args):
+    install_fakes(
+        app,
+        db_latency_s=args.db_latency,
+        transcript_latency_s=args.transcript_latency,
+        transcript_durations_s=[int(m * 60) for m in args.transcript_minutes],
+        youtube_latency_s=args.youtube_latency,
+        llm_latency_s=args.llm_latency,
+        llm_latency_per_1k_chars=args.llm_latency_per_1k_chars,
+    )
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        # the ASGI transport does not run the lifespan
+        client_registry.start()
+        await job_queue.start()
+
+        run_id = int(time.time())
+        results["generate-overview"] = await run_load(
+            args.generate_concurrency,
+            args.generate_requests,
+            lambda i: client.post(f"/generate-overview/gen-{run_id}-{i}", json=GENERATE_BODY),
+        )
+
+        # reads target the overviews generated above
+        stored = [f"gen-{run_id}-{i}" for i in range(args.generate_requests)]
+        results["get-overview (cached)"] = await run_load(
+            args.read_concurrency,
+            args.read_requests,
+            lambda i: client.get(f"/get-overview/{stored[i % len(stored)]}"),
+        )
+
+        async def uncached_read(i):
+            video_id = stored[i % len(stored)]
+            overview_cache.invalidate(video_id)
+            return await client.get(f"/get-overview/{video_id}")
+
+        results["get-overview (database)"] = await run_load(
+            args.read_concurrency, args.read_requests, uncached_read
+        )
+
+        await job_queue.stop()
+        await client_registry.close()
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    print_results(results, baseline)
+    if args.save:
+        save_results(args.save, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--generate-requests", type=int, default=40)
+    parser.add_argument("--generate-concurrency", type=int, default=8)
+    parser.add_argument("--read-requests", type=int, default=2000)
+    parser.add_argument("--read-concurrency", type=int, default=32)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    parser.add_argument("--transcript-latency", type=float, default=0.3)
+    parser.add_argument(
+        "--transcript-minutes", type=float, nargs="+", default=[10, 30, 90, 180]
+    )
+    parser.add_argument("--youtube-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--llm-latency-per-1k-chars", type=float, default=0.01)
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,51 @@
+# Reports `python -X importtime` totals for app.main, plus the heaviest top-level
+# packages. Run from a checkout to compare cold-start cost between revisions.
+# python -m bench.import_time [--module app.main] [--runs 5]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+
+def import_times(module: str):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    total_us = 0
+    packages = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        if name == module:
+            total_us = int(cumulative_us)
+        packages[name.split(".")[0]] += int(self_us)
+    return total_us, packages
+
+
+def main(args):
+    totals = []
+    packages = None
+    for _ in range(args.runs):
+        total_us, packages = import_times(args.module)
+        totals.append(total_us)
+    print(f"import {args.module}: median {statistics.median(totals) / 1000:.0f} ms over {args.runs} runs")
+    print("heaviest packages (self time, last run):")
+    for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"  {name:<28} {self_us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,96 @@
+# The LLM router against scripted fake providers (latencies scaled down ~20x):
+# tail latency with and without a hedged backup, failover from a rate-limited
+# primary, and unusable completions.
+# python -m bench.llm_router --requests 300
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from app.video_overview import video_overview_llm_router
+from app.video_overview.video_overview import completion_is_usable
+from app.video_overview.video_overview_llm_router import LLMRouter
+
+from .fakes import ScriptedProvider
+from .report import percentile
+
+
+async def run(router, providers, requests, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def client_loop():
+        nonlocal errors
+        for _ in counter:
+            start = time.perf_counter()
+            try:
+                completion = await router.complete(providers, [], "", completion_is_usable)
+                if not completion_is_usable(completion):
+                    errors += 1
+                    continue
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def report(name, router, providers, latencies, errors):
+    backup_calls = sum(p.calls for p in providers[1:])
+    cancelled = sum(p.cancelled for p in providers)
+    print(
+        f"{name:<34}{errors:>5}{percentile(latencies, 50) * 1000:>8.0f}"
+        f"{percentile(latencies, 95) * 1000:>8.0f}{percentile(latencies, 99) * 1000:>8.0f}"
+        f"{router.hedges:>8}{router.failovers:>10}{backup_calls:>8}{cancelled:>8}"
+    )
+
+
+async def main(args):
+    # the default 5 s floor is meant for real completions
+    video_overview_llm_router.LLM_HEDGE_MIN_DELAY_S = 0.0
+    logging.getLogger(video_overview_llm_router.__name__).setLevel(logging.ERROR)
+    rng = random.Random(0)
+    # 8% of primary calls are 8x slower than usual
+    tail = [0.8 if rng.random() < 0.08 else rng.uniform(0.08, 0.12) for _ in range(997)]
+
+    print(f"{'scenario':<34}{'err':>5}{'p50':>8}{'p95':>8}{'p99':>8}{'hedges':>8}{'failover':>10}{'backup':>8}{'cancel':>8}")
+    for name, make_providers in [
+        ("slow tail, primary only", lambda: [ScriptedProvider("primary", tail)]),
+        (
+            "slow tail, hedged",
+            lambda: [ScriptedProvider("primary", tail), ScriptedProvider("backup", [0.15])],
+        ),
+        (
+            "primary rate limited, no backup",
+            lambda: [ScriptedProvider("primary", [0.02], ["rate_limit"])],
+        ),
+        (
+            "primary rate limited, failover",
+            lambda: [
+                ScriptedProvider("primary", [0.02], ["rate_limit"]),
+                ScriptedProvider("backup", [0.15]),
+            ],
+        ),
+        (
+            "20% unusable, with backup",
+            lambda: [
+                ScriptedProvider("primary", [0.1], ["ok"] * 4 + ["invalid"]),
+                ScriptedProvider("backup", [0.15]),
+            ],
+        ),
+    ]:
+        router = LLMRouter()
+        providers = make_providers()
+        latencies, errors = await run(router, providers, args.requests, args.concurrency)
+        report(name, router, providers, latencies or [0.0], errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
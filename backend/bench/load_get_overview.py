@@ -0,0 +1,71 @@
+# Shows that cached /get-overview reads stay fast while generations are in flight.
+# python -m bench.load_get_overview --generations 8
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.main import app
+
+from .fakes import install_fakes
+from .report import percentile
+
+
+async def read_latencies(client, video_id, duration_s):
+    latencies = []
+    deadline = time.perf_counter() + duration_s
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(f"/get-overview/{video_id}")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label, latencies):
+    print(
+        f"{label:<28} n={len(latencies):<5} "
+        f"p50={statistics.median(latencies) * 1000:7.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:7.1f}ms"
+    )
+
+
+async def main(args):
+    install_fakes(
+        app,
+        db_latency_s=args.db_latency,
+        transcript_latency_s=args.transcript_latency,
+        llm_latency_s=args.llm_latency,
+    )
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # seed one stored overview to read back
+        seed = await client.post("/generate-overview/seed", json={"user_api_key": "bench"})
+        seed.raise_for_status()
+
+        report("idle", await read_latencies(client, "seed", args.duration))
+
+        generations = [
+            asyncio.create_task(
+                client.post(f"/generate-overview/gen-{i}", json={"user_api_key": "bench"})
+            )
+            for i in range(args.generations)
+        ]
+        report(
+            f"{args.generations} generations in flight",
+            await read_latencies(client, "seed", args.duration),
+        )
+        await asyncio.gather(*generations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--generations", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    parser.add_argument("--transcript-latency", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=3.0)
+    asyncio.run(main(parser.parse_args()))
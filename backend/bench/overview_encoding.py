@@ -0,0 +1,109 @@
+# Per-overview cost of the read and write paths for a 30-chapter overview:
+# the previous pydantic round trip, the jsonb-as-text path parsed by orjson, and the
+# msgpack+zstd compact column. Sizes are what goes over the wire / into the row.
+# python -m bench.overview_encoding --chapters 30
+import argparse
+import json
+import random
+import time
+
+from app.video_overview.video_overview_codec import (
+    decode_overview_row,
+    overview_body,
+    pack_overview,
+)
+from app.video_overview.video_overview_schemas import VideoOverview
+
+from .fakes import jsonb_text
+
+
+WORDS = (
+    "the speaker explains how approach trades latency accuracy consensus leader "
+    "election log replication quorum failure detector snapshot partition network "
+    "clock drift lease read write path client retries idempotent state machine "
+    "membership change joint heartbeat timeout term vote commit index follower"
+).split()
+
+
+def sentence(rng: random.Random) -> str:
+    # varied text, so compression ratios are not flattered by repetition
+    return " ".join(rng.choice(WORDS) for _ in range(14))
+
+
+def sample_overview(n_chapters: int) -> VideoOverview:
+    rng = random.Random(0)
+    return VideoOverview(
+        video_title="A fairly long lecture title about distributed systems",
+        published_iso="2024-01-01T00:00:00Z",
+        duration_iso="PT2H31M",
+        channel_title="Bench Channel",
+        chapters=[
+            {
+                "title": sentence(rng)[:48],
+                "key_points": [
+                    {"text": sentence(rng), "time": i * 300 + j * 45}
+                    for j in range(5)
+                ],
+                "associations": [rng.choice(WORDS).title() for _ in range(3)],
+            }
+            for i in range(n_chapters)
+        ],
+    )
+
+
+def per_call_us(func, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def main(args):
+    overview = sample_overview(args.chapters)
+    stored_json = overview.model_dump_json()
+    packed = pack_overview(overview)
+    # postgrest returns jsonb as nested JSON, text as a JSON string, bytea as hex
+    wire_jsonb = json.dumps([{"overview": json.loads(stored_json)}])
+    wire_text = json.dumps([{"overview": jsonb_text(json.loads(stored_json))}])
+    wire_compact = json.dumps([{"overview": None, "overview_compact": "\\x" + packed.hex()}])
+
+    def read_pydantic():
+        row = json.loads(wire_jsonb)[0]
+        return VideoOverview(**row["overview"]).model_dump_json().encode()
+
+    def read_text():
+        return decode_overview_row(json.loads(wire_text)[0])
+
+    def read_compact():
+        return decode_overview_row(json.loads(wire_compact)[0])
+
+    def write_json():
+        return json.dumps({"overview": overview.model_dump()})
+
+    def write_compact():
+        return json.dumps({"overview_compact": "\\x" + pack_overview(overview).hex()})
+
+    # every path gives the bytes a freshly generated overview is cached with
+    assert read_text() == overview_body(overview)
+    assert read_compact() == overview_body(overview)
+    assert json.loads(read_text()) == json.loads(read_pydantic())
+
+    print(f"{args.chapters}-chapter overview, {args.runs} runs each")
+    print(f"{'path':<28}{'read us':>10}{'write us':>10}{'stored B':>10}{'wire B':>10}")
+    rows = [
+        ("jsonb + pydantic (before)", read_pydantic, write_json, len(stored_json), len(wire_jsonb)),
+        ("jsonb as text, orjson", read_text, write_json, len(stored_json), len(wire_text)),
+        ("msgpack+zstd", read_compact, write_compact, len(packed), len(wire_compact)),
+    ]
+    for name, read, write, stored, wire in rows:
+        print(
+            f"{name:<28}{per_call_us(read, args.runs):>10.1f}"
+            f"{per_call_us(write, args.runs):>10.1f}{stored:>10}{wire:>10}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chapters", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+# Bulk pre-generation throughput on the fakes, sequential vs. pipelined, plus a
+# crash halfway through a run followed by a resume from the checkpoint.
+# python -m bench.pregenerate --videos 40
+import argparse
+import asyncio
+import os
+import tempfile
+
+from app.main import app
+from app.pregenerate import Checkpoint, pregenerate, print_stats
+
+from .fakes import install_fakes
+
+
+async def run_once(fakes, video_ids, checkpoint_path, fetch_concurrency, llm_concurrency):
+    checkpoint = Checkpoint(checkpoint_path)
+    try:
+        return await pregenerate(
+            video_ids,
+            fakes.llm,
+            fakes.supabase,
+            checkpoint,
+            fetch_concurrency=fetch_concurrency,
+            llm_concurrency=llm_concurrency,
+        )
+    finally:
+        checkpoint.close()
+
+
+async def main(args):
+    # the LLM call dominates, as it does against the real API
+    fakes = install_fakes(
+        app, transcript_latency_s=0.3, youtube_latency_s=0.1, llm_latency_s=args.llm_latency_s
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        video_ids = [f"seq-{i:07d}" for i in range(args.videos)]
+        print("sequential (1 fetch, 1 LLM call at a time)")
+        print_stats(await run_once(fakes, video_ids, os.path.join(tmp, "seq.sqlite3"), 1, 1))
+
+        video_ids = [f"par-{i:07d}" for i in range(args.videos)]
+        # a few already exist and must be skipped
+        fakes.supabase.tables.setdefault("video_overviews", []).extend(
+            {"video_id": video_id} for video_id in video_ids[:3]
+        )
+        path = os.path.join(tmp, "par.sqlite3")
+        print(f"\npipelined ({args.fetch_concurrency} fetches, {args.llm_concurrency} LLM calls)")
+        calls_before = fakes.llm.calls
+        task = asyncio.create_task(
+            run_once(fakes, video_ids, path, args.fetch_concurrency, args.llm_concurrency)
+        )
+        await asyncio.sleep(args.llm_latency_s * args.videos / args.llm_concurrency / 2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        print(f"crashed after {fakes.llm.calls - calls_before} LLM calls, resuming")
+        calls_before = fakes.llm.calls
+        print_stats(
+            await run_once(fakes, video_ids, path, args.fetch_concurrency, args.llm_concurrency)
+        )
+        stored = {
+            row["video_id"] for row in fakes.supabase.tables["video_overviews"]
+        } & set(video_ids)
+        print(f"LLM calls after resume: {fakes.llm.calls - calls_before}")
+        print(f"stored overviews:       {len(stored)}/{len(video_ids)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=40)
+    parser.add_argument("--llm-latency-s", type=float, default=1.0)
+    parser.add_argument("--fetch-concurrency", type=int, default=16)
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
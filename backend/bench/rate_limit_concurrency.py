@@ -0,0 +1,54 @@
+# Hammers the rate limiters from many concurrent requests and checks that no
+# increment is lost and no limit is overshot. tests/test_rate_limit.py makes the
+# same checks from many threads and through the generate endpoint.
+# python -m bench.rate_limit_concurrency
+import argparse
+import asyncio
+
+from app.video_overview.video_overview_rate_limit import (
+    Admission,
+    InMemoryRateLimiter,
+    SupabaseRateLimiter,
+)
+
+from .fakes import FakeSupabase
+
+
+async def hammer(limiter, supabase, ips, requests_per_ip):
+    admissions = await asyncio.gather(
+        *(
+            limiter.admit_free(ip, supabase)
+            for ip in ips
+            for _ in range(requests_per_ip)
+        )
+    )
+    return sum(1 for a in admissions if a == Admission.OK)
+
+
+async def main(args):
+    ips = [f"10.0.0.{i}" for i in range(args.ips)]
+    expected = min(args.total_limit, args.ips * min(args.user_limit, args.requests_per_ip))
+
+    memory = InMemoryRateLimiter(args.user_limit, args.total_limit, decision_ttl_s=0)
+    admitted = await hammer(memory, None, ips, args.requests_per_ip)
+    assert admitted == memory.total_hits == expected, (admitted, memory.total_hits, expected)
+    for ip in ips:
+        assert memory.usage(ip)[0] <= args.user_limit
+    print(f"in-memory: admitted {admitted}, total_hits {memory.total_hits}, expected {expected}")
+
+    supabase = FakeSupabase(latency_s=0.001)
+    remote = SupabaseRateLimiter(args.user_limit, args.total_limit, decision_ttl_s=0)
+    admitted = await hammer(remote, supabase, ips, args.requests_per_ip)
+    total_hits = supabase.tables["api_usage"][0]["total_hits"]
+    counted = sum(row["count"] for row in supabase.tables["rate_limits"])
+    assert admitted == total_hits == counted == expected, (admitted, total_hits, counted)
+    print(f"supabase rpc: admitted {admitted}, total_hits {total_hits}, expected {expected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ips", type=int, default=20)
+    parser.add_argument("--requests-per-ip", type=int, default=25)
+    parser.add_argument("--user-limit", type=int, default=10)
+    parser.add_argument("--total-limit", type=int, default=150)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,49 @@
+import json
+import statistics
+from typing import Dict, List, Optional
+
+
+def percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def summarize(latencies: List[float], elapsed_s: float, errors: int = 0) -> Dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed_s if elapsed_s else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else 0.0,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else 0.0,
+    }
+
+
+def print_results(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]] = None):
+    print(
+        f"{'scenario':<30} {'n':>6} {'err':>4} {'rps':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<30} {result['requests']:>6} {result['errors']:>4} {result['rps']:>9.1f} "
+            f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f}"
+        )
+        previous = (baseline or {}).get(name)
+        if previous:
+            deltas = " ".join(
+                f"{key}={(result[key] - previous[key]) / previous[key] * 100:+.0f}%"
+                for key in ("rps", "p50_ms", "p99_ms")
+                if previous[key]
+            )
+            print(f"{'  vs baseline':<30} {deltas}")
+
+
+def save_results(path: str, results: Dict[str, Dict]):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Dict]:
+    with open(path) as f:
+        return json.load(f)
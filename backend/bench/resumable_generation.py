@@ -0,0 +1,67 @@
+# A long transcript whose overview does not fit in one completion. Previously
+# the truncated JSON was discarded with a ValueError; now the complete chapters
+# are kept and continuation calls cover the rest of the transcript.
+# python -m bench.resumable_generation --hours 3
+import argparse
+import asyncio
+import time
+
+from app.video_overview.video_overview import (
+    generate_chapters,
+    get_timestamped_transcript_text,
+)
+from app.video_overview.video_overview_schemas import Moment, Transcript
+
+from .fakes import FakeAnthropic, fake_overview_json, synthetic_transcript
+
+
+async def run(transcript_text, max_output_chars, continuations, stream):
+    llm = FakeAnthropic(latency_s=1.0, n_chapters=12, max_output_chars=max_output_chars)
+    streamed = []
+    start = time.perf_counter()
+    try:
+        chapters = await generate_chapters(
+            transcript_text,
+            [],
+            llm,
+            on_chapter=streamed.append if stream else None,
+            continuations=continuations,
+        )
+        outcome = f"{len(chapters)} chapters"
+        starts = [chapter.key_points[0].time for chapter in chapters]
+        assert starts == sorted(starts), "chapters out of order"
+    except ValueError as e:
+        outcome = f"ValueError: {e}"
+    elapsed = time.perf_counter() - start
+    return outcome, llm.calls, llm.output_chars, elapsed, len(streamed)
+
+
+async def main(args):
+    transcript = Transcript(
+        moments=[Moment(**m) for m in synthetic_transcript(int(args.hours * 3600))]
+    )
+    transcript_text = get_timestamped_transcript_text(transcript)
+    # room for about 40% of the overview per completion
+    max_output_chars = int(len(fake_overview_json(12)) * 0.4)
+
+    print(f"{'variant':<34}{'outcome':<44}{'calls':>6}{'out chars':>10}{'s':>6}")
+    for name, continuations, stream in [
+        ("fits in one completion", 0, False),
+        ("truncated, no continuation", 0, False),
+        ("truncated, continued", args.continuations, False),
+        ("truncated, continued, streaming", args.continuations, True),
+    ]:
+        limit = None if name == "fits in one completion" else max_output_chars
+        outcome, calls, out_chars, elapsed, streamed = await run(
+            transcript_text, limit, continuations, stream
+        )
+        if stream:
+            outcome += f" ({streamed} streamed)"
+        print(f"{name:<34}{outcome:<44}{calls:>6}{out_chars:>10}{elapsed:>6.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--continuations", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
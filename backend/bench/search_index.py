@@ -0,0 +1,233 @@
+# Full-text search over a synthetic library of overviews (Zipf-distributed
+# vocabulary): index build time, incremental add latency, size on disk and
+# query latency, next to a linear scan over the stored JSON.
+# Also checks the /search endpoint and the rebuild command end to end.
+# python -m bench.search_index --docs 20000
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import httpx
+
+from app import rebuild_search_index
+from app.main import app
+from app.video_overview import video_overview
+from app.video_overview.video_overview_schemas import VideoOverview
+from app.video_overview.video_overview_search import SearchIndex, tokenize
+
+from .fakes import install_fakes
+from .report import percentile
+
+SYLLABLES = "ka lo mi ne ru sa ti vo ze pa do fe gu hi ja".split()
+
+
+def vocabulary(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Corpus:
+    def __init__(self, vocabulary_size: int, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.words = vocabulary(vocabulary_size, self.rng)
+        # Zipf: the word of rank r turns up in proportion to 1 / r
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(1, len(self.words) + 1):
+            total += 1 / rank
+            self.cum_weights.append(total)
+
+    def sample(self, k: int):
+        return self.rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+
+    def overview(self, n_chapters: int) -> VideoOverview:
+        return VideoOverview(
+            video_title=" ".join(self.sample(6)),
+            published_iso="2024-01-01T00:00:00Z",
+            duration_iso="PT1H",
+            channel_title=" ".join(self.sample(2)),
+            chapters=[
+                {
+                    "title": " ".join(self.sample(5)),
+                    "key_points": [
+                        {"text": " ".join(self.sample(14)), "time": i * 300 + j * 45}
+                        for j in range(5)
+                    ],
+                    "associations": self.sample(3),
+                }
+                for i in range(n_chapters)
+            ],
+        )
+
+
+def scan(stored, query: str, limit: int):
+    # the baseline: every stored overview, every query
+    terms = set(tokenize(query))
+    hits = []
+    for video_id, body in stored:
+        matched = sum(1 for token in tokenize(body) if token in terms)
+        if matched:
+            hits.append((matched, video_id))
+    hits.sort(reverse=True)
+    return hits[:limit]
+
+
+def ms(samples, p):
+    return f"{percentile(samples, p) * 1000:9.2f}"
+
+
+def measure(args, directory):
+    corpus = Corpus(args.vocabulary)
+    overviews = [(f"video-{i:06d}", corpus.overview(args.chapters)) for i in range(args.docs)]
+    stored = [(video_id, overview.model_dump_json()) for video_id, overview in overviews]
+    path = os.path.join(directory, "search.sqlite3")
+    index = SearchIndex(path)
+
+    bulk = overviews[: -args.single_adds]
+    start = time.perf_counter()
+    for i in range(0, len(bulk), args.batch):
+        index.add(bulk[i : i + args.batch])
+        index.merge()
+    build_s = time.perf_counter() - start
+
+    # one overview per call, as save_video_overviews does after a generation;
+    # merges run afterwards, off the request path
+    adds, merges = [], []
+    for item in overviews[-args.single_adds :]:
+        start = time.perf_counter()
+        index.add([item])
+        adds.append(time.perf_counter() - start)
+        if index.merge_due():
+            start = time.perf_counter()
+            index.merge()
+            merges.append(time.perf_counter() - start)
+
+    index._conn.execute("pragma wal_checkpoint(truncate)")
+    index_bytes = os.path.getsize(path)
+    json_bytes = sum(len(body) for _, body in stored)
+    print(f"{args.docs} overviews, {args.chapters} chapters each, {args.vocabulary} words")
+    print(f"build in batches of {args.batch}: {build_s:.1f}s, {index.summary()}")
+    print(f"single add: p50 {ms(adds, 50)} ms   p99 {ms(adds, 99)} ms")
+    if merges:
+        print(f"background merges: {len(merges)}, longest {max(merges) * 1000:.0f} ms")
+    print(
+        f"on disk: {index_bytes / 2**20:.1f} MiB index (records included), "
+        f"{json_bytes / 2**20:.1f} MiB of overview JSON"
+    )
+
+    # 1 to 3 words per query. The 50 most frequent words are each in almost
+    # every overview, so queries made only of them are the worst case.
+    query_rng = random.Random(1)
+    common, topical = corpus.words[:50], corpus.words[1000:]
+    kinds = {
+        "topical": lambda n: query_rng.sample(topical, n),
+        "mixed": lambda n: [query_rng.choice(common)] + query_rng.sample(topical, max(n - 1, 1)),
+        "common": lambda n: query_rng.sample(common, n),
+    }
+    queries = {
+        kind: [" ".join(words(query_rng.randint(1, 3))) for _ in range(args.queries)]
+        for kind, words in kinds.items()
+    }
+    print(f"{'':<22}{'queries':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, run, n in [
+        ("index", lambda q: index.search(q, 10), args.queries),
+        ("json scan", lambda q: scan(stored, q, 10), args.scan_queries),
+    ]:
+        for kind in kinds:
+            latencies = []
+            for query in queries[kind][:n]:
+                start = time.perf_counter()
+                run(query)
+                latencies.append(time.perf_counter() - start)
+            print(f"{name + ', ' + kind:<22}{n:>8}{ms(latencies, 50)}{ms(latencies, 99)}")
+
+    # pruning must not change the top results
+    for query in [query for kind in kinds for query in queries[kind][:50]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        pruned, total = index._score(terms, 10)
+        exhaustive, exhaustive_total = index._score(terms, 10**9)
+        assert total == exhaustive_total, (query, total, exhaustive_total)
+        assert [round(score, 9) for _, score in pruned] == [
+            round(score, 9) for _, score in exhaustive[:10]
+        ], query
+
+    # a second worker sharing the file sees another worker's writes
+    other = SearchIndex(path)
+    extra = ("video-extra", corpus.overview(args.chapters))
+    extra_title = extra[1].video_title
+    index.add([extra])
+    found = [result.video_id for result in other.search(extra_title, 3).results]
+    assert "video-extra" in found, found
+    other.close()
+    index.close()
+
+
+async def end_to_end(directory):
+    fakes = install_fakes(app, db_latency_s=0.0)
+    corpus = Corpus(2000, seed=2)
+    index = SearchIndex(os.path.join(directory, "live.sqlite3"))
+    video_overview.get_search_index = lambda: None
+    overviews = [(f"e2e-{i:04d}", corpus.overview(8)) for i in range(300)]
+    video_id, overview = overviews[123]
+    overview.video_title = "Quantum chromodynamics for beginners"
+    overview.chapters[2].key_points[3].text = "Gluons carry the colour charge"
+    for i in range(0, len(overviews), 10):
+        if i == 20:
+            video_overview.get_search_index = lambda: index
+        # the first 20 are saved while search is off, so the index misses them
+        await video_overview.save_video_overviews(overviews[i : i + 10], fakes.supabase)
+    if video_overview.search_merge is not None:
+        await video_overview.search_merge
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get("/search", params={"q": "quantum chromodynamics"})
+        assert response.status_code == 200, response.text
+        assert response.json()["results"][0]["video_id"] == video_id, response.json()
+        response = await client.get("/search", params={"q": "gluon", "limit": 3})
+        result = response.json()["results"][0]
+        assert result["video_id"] == video_id, result
+        key_point = overview.chapters[2].key_points[3]
+        assert result["chapters"] == [
+            {
+                "title": overview.chapters[2].title,
+                "time": overview.chapters[2].key_points[0].time,
+                "key_points": [{"text": key_point.text, "time": key_point.time}],
+            }
+        ], result
+        assert (await client.get("/search", params={"q": ""})).status_code == 422
+
+    assert await rebuild_search_index.rebuild(index.path, fakes.supabase, missing_only=True) == 20
+    start = time.perf_counter()
+    indexed = await rebuild_search_index.rebuild(index.path, fakes.supabase)
+    rebuild_s = time.perf_counter() - start
+    assert indexed == len(overviews), indexed
+    # the server's index sees the swap on its next query
+    results = index.search(overview.video_title, 1).results
+    assert results[0].video_id == video_id, results
+    assert len(index.indexed_video_ids()) == len(overviews)
+    print(f"end to end: /search and rebuild ok ({len(overviews)} overviews rebuilt in {rebuild_s:.2f}s)")
+    index.close()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        measure(args, directory)
+        asyncio.run(end_to_end(directory))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--single-adds", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--scan-queries", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,110 @@
+# Latency of one generate request with the stages run strictly in sequence (the
+# previous flow) vs. the stage graph, where the transcript-store lookup
+# overlaps the database lookup and rate limit, and the transcript and metadata
+# fetches overlap each other. Also checks that a rejected (429) request and a
+# re-POST of a stored overview never reach the transcript API.
+# python -m bench.stage_overlap
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.main import app
+from app.video_overview import video_overview
+from app.video_overview.video_overview_deps import client_registry
+from app.video_overview.video_overview_stages import stage_stats
+
+from .fakes import install_fakes
+
+
+class _FakeRequest:
+    def __init__(self, ip: str):
+        self.headers = {"cf-connecting-ip": ip}
+
+
+async def sequential_generate(video_id: str, request, supabase):
+    # lookup, rate limit, transcript, metadata and generation one after another
+    existing = await video_overview.load_video_overview(video_id, supabase)
+    if existing:
+        return existing
+    client = await video_overview.select_anthropic_client(request, None, supabase)
+    return await video_overview.generate_with_lease(video_id, client, supabase)
+
+
+async def main(args):
+    fakes = install_fakes(
+        app,
+        db_latency_s=args.db_latency,
+        transcript_latency_s=args.transcript_latency,
+        youtube_latency_s=args.youtube_latency,
+        llm_latency_s=args.llm_latency,
+    )
+    client_registry.start()
+
+    # every request comes from its own IP, so the free tier admits it
+    sequential = []
+    for i in range(args.runs):
+        start = time.perf_counter()
+        await sequential_generate(f"seq-{i}", _FakeRequest(f"10.0.0.{i}"), fakes.supabase)
+        sequential.append(time.perf_counter() - start)
+
+    graph = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(args.runs):
+            start = time.perf_counter()
+            response = await client.post(
+                f"/generate-overview/graph-{i}",
+                json={},
+                headers={"cf-connecting-ip": f"10.0.1.{i}"},
+            )
+            assert response.status_code == 200, response.text
+            graph.append(time.perf_counter() - start)
+
+        # one IP over its free quota: rejected at the rate-limit stage
+        fakes.supabase.tables["rate_limits"].append({"ip": "10.0.2.1", "count": 100})
+        transcripts_before = fakes.transcripts.calls
+        start = time.perf_counter()
+        response = await client.post(
+            "/generate-overview/rejected", json={}, headers={"cf-connecting-ip": "10.0.2.1"}
+        )
+        rejected_ms = (time.perf_counter() - start) * 1000
+        rejected_fetches = fakes.transcripts.calls - transcripts_before
+        assert response.status_code == 429, response.text
+        assert rejected_fetches == 0, rejected_fetches
+
+        transcripts_before = fakes.transcripts.calls
+        for i in range(3):
+            stored = await client.post(
+                "/generate-overview/graph-0", json={}, headers={"cf-connecting-ip": f"10.0.3.{i}"}
+            )
+            assert stored.status_code == 200, stored.text
+            # the response cache would answer before the graph runs
+            video_overview.overview_cache.invalidate("graph-0")
+        stored_fetches = fakes.transcripts.calls - transcripts_before
+        assert stored_fetches == 0, stored_fetches
+
+    print(
+        f"fakes: db {args.db_latency * 1000:.0f} ms, transcript {args.transcript_latency * 1000:.0f} ms, "
+        f"youtube {args.youtube_latency * 1000:.0f} ms, llm {args.llm_latency * 1000:.0f} ms"
+    )
+    print(f"sequential stages:  median {statistics.median(sequential) * 1000:7.1f} ms")
+    print(f"stage graph:        median {statistics.median(graph) * 1000:7.1f} ms")
+    print(
+        f"429 rejection:      {rejected_ms:7.1f} ms (status {response.status_code}, "
+        f"{rejected_fetches} transcript fetches started, "
+        f"{stage_stats['cancelled']} stages cancelled in total)"
+    )
+    print(f"stored overview re-POSTed 3 times: {stored_fetches} transcript fetches started")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--db-latency", type=float, default=0.05)
+    parser.add_argument("--transcript-latency", type=float, default=0.4)
+    parser.add_argument("--youtube-latency", type=float, default=0.15)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    asyncio.run(main(parser.parse_args()))
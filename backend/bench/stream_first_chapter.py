@@ -0,0 +1,67 @@
+# Time to first chapter for the SSE endpoint vs. the blocking endpoint.
+# python -m bench.stream_first_chapter
+import argparse
+import asyncio
+import time
+
+import httpx
+import uvicorn
+
+from app.main import app
+
+from .fakes import install_fakes
+
+
+async def main(args):
+    install_fakes(
+        app,
+        transcript_latency_s=0.1,
+        llm_latency_s=args.llm_latency,
+        n_chapters=args.chapters,
+    )
+
+    # httpx's ASGITransport buffers whole responses, so serve over a real socket
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{args.port}", timeout=None
+    ) as client:
+        start = time.perf_counter()
+        response = await client.post(
+            "/generate-overview/blocking", json={"user_api_key": "bench"}
+        )
+        response.raise_for_status()
+        blocking_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        first_chapter_s = None
+        chapters = 0
+        async with client.stream(
+            "POST", "/generate-overview-stream/streaming", json={"user_api_key": "bench"}
+        ) as response:
+            async for line in response.aiter_lines():
+                if line == "event: chapter":
+                    chapters += 1
+                    if first_chapter_s is None:
+                        first_chapter_s = time.perf_counter() - start
+        streaming_s = time.perf_counter() - start
+
+    server.should_exit = True
+    await serving
+
+    print(f"blocking endpoint:      full response after {blocking_s:6.2f}s")
+    print(f"streaming endpoint:     first chapter after {first_chapter_s:6.2f}s")
+    print(f"                        {chapters} chapters, done after {streaming_s:6.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=5.0)
+    parser.add_argument("--chapters", type=int, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,60 @@
+# Prompt build time and size for a synthetic 3-hour transcript, before and after
+# compaction. Token counts use the SDK's local tokenizer when available.
+# python -m bench.transcript_compaction --hours 3
+import argparse
+import time
+
+from app.video_overview.video_overview_schemas import Moment
+from app.video_overview.video_overview_transcript import (
+    TRANSCRIPT_TOKEN_BUDGET,
+    compact_transcript_text,
+    estimate_tokens,
+)
+
+from .fakes import synthetic_transcript
+
+
+def legacy_transcript_text(moments):
+    # the previous per-moment float timestamp format and += concatenation
+    result = ""
+    for moment in moments:
+        result += f"{moment.start}: {moment.text}\n"
+    return result
+
+
+def count_tokens(text: str):
+    try:
+        import anthropic
+
+        return anthropic.Anthropic(api_key="bench").count_tokens(text), "tokenizer"
+    except Exception:
+        return estimate_tokens(text), "estimate"
+
+
+def measure(label, build):
+    start = time.perf_counter()
+    text = build()
+    elapsed = time.perf_counter() - start
+    tokens, method = count_tokens(text)
+    print(f"{label:<24} build={elapsed * 1000:8.1f}ms chars={len(text):>8} tokens={tokens:>7} ({method})")
+
+
+def main(args):
+    moments = [
+        Moment(**m) for m in synthetic_transcript(int(args.hours * 3600), args.caption_s)
+    ]
+    print(f"{len(moments)} caption moments")
+    measure("legacy", lambda: legacy_transcript_text(moments))
+    measure("compacted", lambda: compact_transcript_text(moments))
+    measure(
+        f"compacted, budget {args.budget}",
+        lambda: compact_transcript_text(moments, args.budget),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--caption-s", type=float, default=2.5)
+    parser.add_argument("--budget", type=int, default=TRANSCRIPT_TOKEN_BUDGET)
+    main(parser.parse_args())
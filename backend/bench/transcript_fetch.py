@@ -0,0 +1,139 @@
+# Transcript fetches through FakeYouTubeProxy, a local forward proxy with four
+# sticky ports, while it is healthy, returns 10% errors, has one blocked exit IP,
+# and is down. The previous path (a fresh session per call, one attempt, one
+# port) is compared with TranscriptFetcher: pooled sessions, retries with
+# jittered backoff, port rotation and the circuit breaker. Backoff and breaker
+# timings are scaled down so the run takes seconds.
+# python -m bench.transcript_fetch --fetches 200
+import argparse
+import asyncio
+import logging
+import time
+
+from app.video_overview import video_overview_transcript_fetch
+from app.video_overview.video_overview_io import run_blocking
+from app.video_overview.video_overview_transcript_fetch import (
+    CircuitBreaker,
+    ProxyPool,
+    TranscriptFetcher,
+)
+
+from .fakes import FakeYouTubeProxy, use_plain_http_watch_url
+from .report import percentile
+
+
+def previous_fetch(proxy: FakeYouTubeProxy):
+    from youtube_transcript_api import YouTubeTranscriptApi
+
+    proxies = {"http": proxy.proxy_url(), "https": proxy.proxy_url()}
+
+    async def fetch(video_id):
+        return await run_blocking(YouTubeTranscriptApi.get_transcript, video_id, proxies=proxies)
+
+    return fetch
+
+
+def new_fetcher(proxy: FakeYouTubeProxy, ports: int):
+    pool = ProxyPool(
+        "user", "pass", host="127.0.0.1", first_port=proxy.first_port, ports=ports, slots=2
+    )
+    return TranscriptFetcher(pool, CircuitBreaker(failure_threshold=8, reset_s=1.0))
+
+
+async def run(fetch, proxy, fetches, concurrency):
+    latencies = []
+    failed = 0
+    connections_before, requests_before = proxy.connections, proxy.requests
+    counter = iter(range(fetches))
+    start = time.perf_counter()
+
+    async def client_loop():
+        nonlocal failed
+        for i in counter:
+            t0 = time.perf_counter()
+            try:
+                await fetch(f"video-{i:05d}")
+            except Exception:
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return (
+        failed,
+        latencies or [0.0],
+        time.perf_counter() - start,
+        proxy.connections - connections_before,
+        proxy.requests - requests_before,
+    )
+
+
+async def main(args):
+    # retry timings scaled down for the bench
+    video_overview_transcript_fetch.TRANSCRIPT_BACKOFF_BASE_S = 0.02
+    video_overview_transcript_fetch.TRANSCRIPT_BACKOFF_MAX_S = 0.2
+    logging.getLogger(video_overview_transcript_fetch.__name__).setLevel(logging.CRITICAL)
+    use_plain_http_watch_url()
+    ports = 4
+    proxy = FakeYouTubeProxy(ports=ports, latency_s=args.latency)
+
+    def healthy():
+        proxy.down, proxy.blocked_ports, proxy.error_rate = False, set(), 0.0
+
+    def flaky():
+        proxy.down, proxy.blocked_ports, proxy.error_rate = False, set(), 0.1
+
+    def blocked():
+        # the exit IP behind the first port (the only one the previous code used)
+        # gets YouTube's captcha page
+        proxy.down, proxy.blocked_ports, proxy.error_rate = False, {proxy.first_port}, 0.0
+
+    def outage():
+        proxy.down = True
+
+    print(
+        f"{args.fetches} fetches, {args.concurrency} concurrent, "
+        f"{args.latency * 1000:.0f} ms per proxied request"
+    )
+    print(
+        f"{'scenario':<10}{'fetcher':<10}{'failed':>8}{'p50 ms':>8}{'p99 ms':>8}"
+        f"{'s':>6}{'conns':>7}{'reqs':>6}"
+    )
+    for scenario, setup in [
+        ("healthy", healthy),
+        ("flaky", flaky),
+        ("blocked", blocked),
+        ("outage", outage),
+    ]:
+        for name in ["previous", "new"]:
+            setup()
+            fetch = previous_fetch(proxy) if name == "previous" else new_fetcher(proxy, ports).fetch
+            failed, latencies, elapsed, connections, requests = await run(
+                fetch, proxy, args.fetches, args.concurrency
+            )
+            print(
+                f"{scenario:<10}{name:<10}{failed:>8}{percentile(latencies, 50) * 1000:>8.0f}"
+                f"{percentile(latencies, 99) * 1000:>8.0f}{elapsed:>6.1f}{connections:>7}{requests:>6}"
+            )
+
+    # the breaker lets a probe through after reset_s and closes once it succeeds
+    fetcher = new_fetcher(proxy, ports)
+    outage()
+    await run(fetcher.fetch, proxy, 20, 1)
+    state_during = fetcher.breaker.state
+    healthy()
+    await asyncio.sleep(fetcher.breaker.reset_s)
+    failed, *_ = await run(fetcher.fetch, proxy, 20, 1)
+    print(
+        f"recovery: breaker {state_during} during the outage, {fetcher.breaker.state} "
+        f"{fetcher.breaker.reset_s:.0f}s after, {failed}/20 failed afterwards"
+    )
+    proxy.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fetches", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,7 @@
+-- Cross-worker lease used to coalesce concurrent overview generations.
+-- Enabled with GENERATION_LEASE_BACKEND=supabase.
+create table if not exists generation_leases (
+    video_id text primary key,
+    owner text not null,
+    expires_at timestamptz not null
+);
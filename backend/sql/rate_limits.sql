@@ -0,0 +1,58 @@
+-- Atomic rate limiting used by SupabaseRateLimiter.
+-- admit_free_generation checks the per-ip and total limits and increments both
+-- counters in one transaction. IPs without a rate_limits row are inserted.
+-- The refund functions give a charge back when the work it paid for was never
+-- started.
+
+create or replace function admit_free_generation(
+    p_ip text, p_user_limit int, p_total_limit int
+) returns text
+language plpgsql
+as $$
+declare
+    user_count int;
+    total int;
+begin
+    select count into user_count from rate_limits where ip = p_ip;
+    if user_count is not null and user_count >= p_user_limit then
+        return 'user_limit';
+    end if;
+
+    -- the api_usage row lock serializes admissions
+    select total_hits into total from api_usage where id = 1 for update;
+    if total >= p_total_limit then
+        return 'total_limit';
+    end if;
+
+    user_count := null;
+    insert into rate_limits (ip, count) values (p_ip, 1)
+    on conflict (ip) do update set count = rate_limits.count + 1
+        where rate_limits.count < p_user_limit
+    returning count into user_count;
+    if user_count is null then
+        return 'user_limit';
+    end if;
+
+    update api_usage set total_hits = total_hits + 1 where id = 1;
+    return 'ok';
+end;
+$$;
+
+create or replace function incr_api_usage() returns void
+language sql
+as $$
+    update api_usage set total_hits = total_hits + 1 where id = 1;
+$$;
+
+create or replace function refund_free_generation(p_ip text) returns void
+language sql
+as $$
+    update rate_limits set count = greatest(count - 1, 0) where ip = p_ip;
+    update api_usage set total_hits = greatest(total_hits - 1, 0) where id = 1;
+$$;
+
+create or replace function decr_api_usage() returns void
+language sql
+as $$
+    update api_usage set total_hits = greatest(total_hits - 1, 0) where id = 1;
+$$;
@@ -0,0 +1,4 @@
+-- Column for OVERVIEW_STORAGE_FORMAT=compact: the overview as zstd-compressed
+-- msgpack. Rows keep exactly one of overview / overview_compact.
+alter table video_overviews add column if not exists overview_compact bytea;
+alter table video_overviews alter column overview drop not null;
@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.main import app
+from app.video_overview.video_overview_deps import client_registry
+from bench.fakes import install_fakes
+
+
+@pytest.fixture
+def fakes():
+    return install_fakes(
+        app,
+        db_latency_s=0.0,
+        transcript_latency_s=0.0,
+        youtube_latency_s=0.0,
+        llm_latency_s=0.0,
+    )
+
+
+@pytest.fixture
+def run_app():
+    # runs `test(client)` against app.main:app in-process; the ASGI transport
+    # does not run the lifespan
+    def run_app(test):
+        async def run():
+            client_registry.start()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await test(client)
+
+        return asyncio.run(run())
+
+    return run_app
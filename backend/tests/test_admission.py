@@ -0,0 +1,66 @@
+import asyncio
+
+from app.video_overview import video_overview
+from app.video_overview.video_overview_admission import AdmissionController
+
+
+def post_generate(client, video_id: str, ip: str, user_api_key=None):
+    body = {"user_api_key": user_api_key} if user_api_key else {}
+    return client.post(
+        f"/generate-overview/{video_id}", json=body, headers={"cf-connecting-ip": ip}
+    )
+
+
+def test_shed_requests_are_not_charged(fakes, run_app, monkeypatch):
+    fakes.llm.latency_s = 0.3
+    controller = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout_s=5)
+    monkeypatch.setattr(video_overview, "generation_admission", controller)
+    usage = fakes.supabase.tables["api_usage"][0]
+
+    async def test(client):
+        running = asyncio.create_task(post_generate(client, "shed-0", "10.0.0.1", "key"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(post_generate(client, "shed-1", "10.0.0.2"))
+        await asyncio.sleep(0.05)
+        # the priority request takes the free-tier waiter's place in the queue
+        priority = asyncio.create_task(post_generate(client, "shed-2", "10.0.0.3", "key"))
+        await asyncio.sleep(0.05)
+        full = await post_generate(client, "shed-3", "10.0.0.4")
+        responses = [await running, await queued, await priority, full]
+        assert [response.status_code for response in responses] == [200, 503, 200, 503]
+
+    run_app(test)
+    assert controller.shed == {"queue_full": 1, "queue_timeout": 0, "displaced": 1}
+    assert usage["total_hits"] == 2
+    assert controller.in_flight == 0
+
+
+def test_queue_timeout_is_not_charged(fakes, run_app, monkeypatch):
+    fakes.llm.latency_s = 0.3
+    controller = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout_s=0.05)
+    monkeypatch.setattr(video_overview, "generation_admission", controller)
+    usage = fakes.supabase.tables["api_usage"][0]
+
+    async def test(client):
+        running = asyncio.create_task(post_generate(client, "wait-0", "10.0.1.1"))
+        await asyncio.sleep(0.05)
+        timed_out = await post_generate(client, "wait-1", "10.0.1.2")
+        assert timed_out.status_code == 503
+        assert (await running).status_code == 200
+
+    run_app(test)
+    assert controller.shed["queue_timeout"] == 1
+    assert usage["total_hits"] == 1
+
+
+def test_slot_is_released_when_the_request_fails(fakes, run_app, monkeypatch):
+    controller = AdmissionController(max_in_flight=1)
+    monkeypatch.setattr(video_overview, "generation_admission", controller)
+
+    async def test(client):
+        # without cf-connecting-ip the free tier is refused once the slot is taken
+        response = await client.post("/generate-overview/refused", json={})
+        assert response.status_code == 429
+
+    run_app(test)
+    assert controller.in_flight == 0
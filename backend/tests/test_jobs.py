@@ -0,0 +1,161 @@
+import asyncio
+
+from app.video_overview import video_overview
+from app.video_overview.video_overview_jobs import JobQueue
+from app.video_overview.video_overview_schemas import JobStatus
+
+
+def test_live_workers_do_not_take_each_others_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    runs = []
+
+    async def run():
+        done = asyncio.Event()
+
+        async def run_job(job, user_api_key):
+            runs.append(job.job_id)
+            await done.wait()
+
+        first = JobQueue(path, run_job, heartbeat_interval_s=0.05, stale_after_s=0.3)
+        second = JobQueue(path, run_job, heartbeat_interval_s=0.05, stale_after_s=0.3)
+        await first.start()
+        job = await first.enqueue("video")
+        await asyncio.sleep(0.05)
+        await second.start()
+        # several stale periods: first keeps beating, so second leaves the job alone
+        await asyncio.sleep(1.0)
+        assert runs == [job.job_id]
+        done.set()
+        await asyncio.sleep(0.05)
+        assert (await second.get(job.job_id)).status == JobStatus.SUCCEEDED
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(run())
+
+
+def test_jobs_of_a_stopped_worker_are_recovered(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    started = []
+
+    async def run():
+        blocked = asyncio.Event()
+
+        async def block(job, user_api_key):
+            started.append(job.job_id)
+            await blocked.wait()
+
+        async def finish(job, user_api_key):
+            pass
+
+        stopping = JobQueue(path, block, concurrency=1, heartbeat_interval_s=0.05)
+        await stopping.start()
+        running = await stopping.enqueue("running")
+        queued = await stopping.enqueue("queued")
+        await asyncio.sleep(0.05)
+        assert started == [running.job_id]
+        await stopping.stop()
+
+        survivor = JobQueue(path, finish, heartbeat_interval_s=0.05)
+        await survivor.start()
+        await asyncio.sleep(0.1)
+        for job in [running, queued]:
+            assert (await survivor.get(job.job_id)).status == JobStatus.SUCCEEDED
+        await survivor.stop()
+
+    asyncio.run(run())
+
+
+def test_a_dead_workers_jobs_are_recovered_once_stale(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def run():
+        async def never(job, user_api_key):
+            raise AssertionError("the dead worker never runs jobs")
+
+        async def finish(job, user_api_key):
+            pass
+
+        # enqueued, then the worker hangs: no runs, no heartbeats, no stop()
+        dead = JobQueue(path, never, concurrency=0, heartbeat_interval_s=60)
+        await dead.start()
+        job = await dead.enqueue("video")
+
+        survivor = JobQueue(path, finish, heartbeat_interval_s=0.05, stale_after_s=0.3)
+        await survivor.start()
+        await asyncio.sleep(0.1)
+        assert (await survivor.get(job.job_id)).status == JobStatus.QUEUED
+        await asyncio.sleep(0.4)
+        assert (await survivor.get(job.job_id)).status == JobStatus.SUCCEEDED
+        await survivor.stop()
+
+    asyncio.run(run())
+
+
+def test_finished_jobs_are_reused_and_expire(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def run():
+        async def finish(job, user_api_key):
+            pass
+
+        queue = JobQueue(path, finish, heartbeat_interval_s=0.05, retention_s=0.2)
+        await queue.start()
+        first = await queue.record_finished("stored")
+        assert (await queue.record_finished("stored")).job_id == first.job_id
+        await asyncio.sleep(0.4)
+        assert await queue.get(first.job_id) is None
+        await queue.stop()
+
+    asyncio.run(run())
+
+
+def post_enqueue(client, video_id: str, ip: str):
+    return client.post(
+        f"/jobs/generate-overview/{video_id}", json={}, headers={"cf-connecting-ip": ip}
+    )
+
+
+def test_concurrent_enqueues_share_one_charged_job(fakes, run_app, monkeypatch, tmp_path):
+    fakes.supabase.latency_s = 0.02
+    usage = fakes.supabase.tables["api_usage"][0]
+
+    async def run_job(job, user_api_key):
+        await asyncio.sleep(1.0)
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), run_job)
+    monkeypatch.setattr(video_overview, "job_queue", queue)
+
+    async def test(client):
+        await queue.start()
+        responses = await asyncio.gather(
+            post_enqueue(client, "same-video", "10.0.2.1"),
+            post_enqueue(client, "same-video", "10.0.2.2"),
+        )
+        await queue.stop()
+        return responses
+
+    responses = run_app(test)
+    assert [response.status_code for response in responses] == [202, 202]
+    assert len({response.json()["job_id"] for response in responses}) == 1
+    assert usage["total_hits"] == 1
+
+
+def test_refused_enqueue_leaves_no_job(fakes, run_app, monkeypatch, tmp_path):
+    async def run_job(job, user_api_key):
+        pass
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), run_job)
+    monkeypatch.setattr(video_overview, "job_queue", queue)
+
+    async def test(client):
+        await queue.start()
+        # no client IP counts as an exhausted free tier, and there is no key
+        response = await client.post("/jobs/generate-overview/refused", json={})
+        active = await queue.find_active("refused")
+        await queue.stop()
+        return response, active
+
+    response, active = run_app(test)
+    assert response.status_code == 429
+    assert active is None
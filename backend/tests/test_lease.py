@@ -0,0 +1,33 @@
+import asyncio
+
+from app.video_overview.video_overview_lease import FileLease, holding
+
+
+def test_held_lease_outlives_its_ttl(tmp_path):
+    holder = FileLease(str(tmp_path), ttl_s=1)
+    other = FileLease(str(tmp_path), ttl_s=1)
+
+    async def run():
+        assert await holder.acquire("video", None)
+        async with holding(holder, "video", None):
+            await asyncio.sleep(1.6)
+            assert not await other.acquire("video", None)
+        assert await other.acquire("video", None)
+
+    asyncio.run(run())
+
+
+def test_expired_lease_is_not_released_by_its_old_holder(tmp_path):
+    holder = FileLease(str(tmp_path), ttl_s=1)
+    other = FileLease(str(tmp_path), ttl_s=1)
+    third = FileLease(str(tmp_path), ttl_s=1)
+
+    async def run():
+        assert await holder.acquire("video", None)
+        await asyncio.sleep(1.2)
+        assert await other.acquire("video", None)
+        assert not await holder.renew("video", None)
+        await holder.release("video", None)
+        assert not await third.acquire("video", None)
+
+    asyncio.run(run())
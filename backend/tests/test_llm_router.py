@@ -0,0 +1,79 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.video_overview.video_overview import get_prompt_prefix, get_transcript_prompt
+from app.video_overview.video_overview_deps import assistant, user
+from app.video_overview.video_overview_llm_router import ChatCompletionsProvider
+
+
+class FakeChatClient:
+    # OpenAI-style client with the API's own JSON mode rule: some message has
+    # to mention JSON
+    def __init__(self, content: str, finish_reason: str = "stop"):
+        self.content = content
+        self.finish_reason = finish_reason
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if kwargs.get("response_format", {}).get("type") == "json_object" and not any(
+            "json" in message["content"].lower() for message in kwargs["messages"]
+        ):
+            raise ValueError("400: 'messages' must contain the word 'json'")
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    message=SimpleNamespace(content=self.content),
+                    finish_reason=self.finish_reason,
+                )
+            ],
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=34),
+        )
+
+
+def overview_messages():
+    # the request generate_chapters makes
+    system_prompt, few_shot = get_prompt_prefix()
+    messages = [
+        *few_shot,
+        user(get_transcript_prompt("0: hello\n30: world\n", [], (1, 2))),
+        assistant("Here is the JSON overview:\n{"),
+    ]
+    return messages, system_prompt
+
+
+ANSWER = json.dumps({"chapters": []})
+
+
+@pytest.mark.parametrize("content", [ANSWER, "  " + ANSWER])
+def test_chat_request_shape(content):
+    client = FakeChatClient(content)
+    provider = ChatCompletionsProvider(client, "openai", "gpt-test", 1000)
+    messages, system_prompt = overview_messages()
+
+    completion = asyncio.run(provider.complete(messages, system_prompt))
+
+    request = client.requests[0]
+    chat = request["messages"]
+    assert chat[0]["role"] == "system"
+    assert "json" in chat[0]["content"].lower()
+    # no assistant prefill: the answer is the model's own turn
+    assert chat[-1]["role"] == "user"
+    assert len(chat) == len(messages)
+    assert all(isinstance(message["content"], str) for message in chat)
+    # callers prepend the prefill's "{", as with the Anthropic answer
+    assert "{" + completion.text == ANSWER
+    assert completion.stop_reason == "stop"
+    assert (completion.usage.input_tokens, completion.usage.output_tokens) == (12, 34)
+
+
+def test_truncated_chat_answer_reports_max_tokens():
+    client = FakeChatClient(ANSWER[:10], finish_reason="length")
+    provider = ChatCompletionsProvider(client, "fireworks", "llama-test", 1000)
+    completion = asyncio.run(provider.complete(*overview_messages()))
+    assert completion.stop_reason == "max_tokens"
+    assert "{" + completion.text == ANSWER[:10]
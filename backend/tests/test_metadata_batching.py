@@ -0,0 +1,27 @@
+import asyncio
+import gc
+
+from app.video_overview.video_overview_metadata import MicroBatcher
+
+
+def test_batches_survive_garbage_collection_and_are_dropped_after():
+    async def run():
+        release = asyncio.Event()
+
+        async def fetch_batch(keys):
+            await release.wait()
+            return {key: key.upper() for key in keys}
+
+        batcher = MicroBatcher(fetch_batch, window_s=0.01, max_batch=2)
+        callers = [asyncio.create_task(batcher.get(key)) for key in ["a", "b", "c"]]
+        await asyncio.sleep(0.05)
+        # nothing but the batcher refers to the batch tasks now
+        assert len(batcher._running) == 2
+        gc.collect()
+        release.set()
+        assert await asyncio.gather(*callers) == ["A", "B", "C"]
+        await asyncio.sleep(0)
+        assert not batcher._running
+        assert batcher.batches == 2
+
+    asyncio.run(run())
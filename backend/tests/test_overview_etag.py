@@ -0,0 +1,30 @@
+import orjson
+
+from app.video_overview.video_overview_cache import overview_cache
+
+GENERATE_BODY = {"user_api_key": "test"}
+
+
+def test_stored_overview_keeps_the_generated_etag(fakes, run_app):
+    async def test(client):
+        generated = await client.post("/generate-overview/etag-video", json=GENERATE_BODY)
+        assert generated.status_code == 200
+        # the next read comes from the jsonb column, with Postgres' key order
+        overview_cache.invalidate("etag-video")
+        stored = await client.get("/get-overview/etag-video")
+        assert stored.content == generated.content
+        assert stored.headers["etag"] == generated.headers["etag"]
+
+        overview_cache.invalidate("etag-video")
+        revalidated = await client.get(
+            "/get-overview/etag-video", headers={"If-None-Match": generated.headers["etag"]}
+        )
+        assert revalidated.status_code == 304
+
+        overview_cache.invalidate("etag-video")
+        listed = await client.post("/get-overviews", json={"video_ids": ["etag-video"]})
+        assert orjson.loads(listed.content)["overviews"]["etag-video"] == orjson.loads(
+            generated.content
+        )
+
+    run_app(test)
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.video_overview import video_overview_rate_limit
+from app.video_overview.video_overview_rate_limit import (
+    Admission,
+    InMemoryRateLimiter,
+    RateLimiter,
+    SupabaseRateLimiter,
+)
+from bench.fakes import FakeSupabase
+
+IPS = [f"10.0.0.{i}" for i in range(20)]
+REQUESTS_PER_IP = 25
+USER_LIMIT = 10
+TOTAL_LIMIT = 150
+
+
+@pytest.fixture
+def frequent_switches(monkeypatch):
+    # every clock read gives up the GIL, so threads interleave between the
+    # limiter's check and its decrement
+    monotonic = time.monotonic
+
+    def yielding_monotonic():
+        time.sleep(0)
+        return monotonic()
+
+    monkeypatch.setattr(video_overview_rate_limit.time, "monotonic", yielding_monotonic)
+
+
+def admit_in_threads(limiter, supabase):
+    requests = [ip for ip in IPS for _ in range(REQUESTS_PER_IP)]
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        admissions = list(
+            pool.map(lambda ip: asyncio.run(limiter.admit_free(ip, supabase)), requests)
+        )
+    return [ip for ip, admission in zip(requests, admissions) if admission == Admission.OK]
+
+
+def test_in_memory_limits_hold_across_threads(frequent_switches):
+    limiter = InMemoryRateLimiter(USER_LIMIT, TOTAL_LIMIT, decision_ttl_s=0)
+    admitted = admit_in_threads(limiter, None)
+    assert len(admitted) == limiter.total_hits == TOTAL_LIMIT
+    for ip in IPS:
+        assert admitted.count(ip) <= USER_LIMIT
+        assert limiter.usage(ip)[0] == admitted.count(ip)
+
+
+def test_supabase_limits_hold_under_parallel_requests(frequent_switches):
+    supabase = FakeSupabase(latency_s=0.001)
+    limiter = SupabaseRateLimiter(USER_LIMIT, TOTAL_LIMIT, decision_ttl_s=0)
+    admitted = admit_in_threads(limiter, supabase)
+    assert len(admitted) == supabase.tables["api_usage"][0]["total_hits"] == TOTAL_LIMIT
+    counts = {row["ip"]: row["count"] for row in supabase.tables["rate_limits"]}
+    for ip in IPS:
+        assert admitted.count(ip) == counts.get(ip, 0) <= USER_LIMIT
+
+
+def test_parallel_generate_requests_stop_at_the_user_limit(fakes, run_app):
+    fakes.llm.latency_s = 0.05
+
+    async def test(client):
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    f"/generate-overview/limited-{i}",
+                    json={},
+                    headers={"cf-connecting-ip": "10.1.0.1"},
+                )
+                for i in range(3 * USER_LIMIT)
+            )
+        )
+        statuses = [response.status_code for response in responses]
+        assert statuses.count(200) == USER_LIMIT
+        assert statuses.count(429) == 2 * USER_LIMIT
+
+    run_app(test)
+
+
+def test_idle_and_excess_buckets_are_evicted():
+    limiter = InMemoryRateLimiter(2, 10**6, refill_per_s=1000, max_tracked_ips=100)
+
+    async def run():
+        for i in range(1000):
+            assert await limiter.admit_free(f"10.2.{i // 256}.{i % 256}", None) == Admission.OK
+
+    asyncio.run(run())
+    assert len(limiter._user_buckets) <= 100
+
+    lifetime = InMemoryRateLimiter(1, 10**6, refill_per_s=0, max_tracked_ips=100)
+
+    async def spend():
+        assert await lifetime.admit_free("10.3.0.0", None) == Admission.OK
+        assert await lifetime.admit_free("10.3.0.0", None) == Admission.USER_LIMIT
+        for i in range(1, 1000):
+            await lifetime.admit_free(f"10.3.{i // 256}.{i % 256}", None)
+
+    asyncio.run(spend())
+    assert len(lifetime._user_buckets) <= 100
+    assert lifetime.evicted_ips >= 900
+
+
+def test_refunds_give_the_charge_back():
+    limiter = InMemoryRateLimiter(1, 10**6, refill_per_s=0, decision_ttl_s=0)
+    supabase = FakeSupabase(latency_s=0)
+    remote = SupabaseRateLimiter(1, 10**6, decision_ttl_s=0)
+
+    async def run():
+        for rate_limiter, db in ((limiter, None), (remote, supabase)):
+            assert await rate_limiter.admit_free("10.4.0.1", db) == Admission.OK
+            await rate_limiter.refund_free("10.4.0.1", db)
+            assert await rate_limiter.admit_free("10.4.0.1", db) == Admission.OK
+            assert await rate_limiter.admit_free("10.4.0.1", db) == Admission.USER_LIMIT
+
+    asyncio.run(run())
+    assert limiter.total_hits == 1
+    assert supabase.tables["api_usage"][0]["total_hits"] == 1
+
+
+def test_backends_must_implement_every_operation():
+    class NoRefunds(RateLimiter):
+        async def _admit_free(self, ip, supabase):
+            return Admission.OK
+
+        async def _user_limit_exceeded(self, ip, supabase):
+            return False
+
+        async def record_api_usage(self, supabase):
+            pass
+
+    with pytest.raises(TypeError, match="refund_api_usage"):
+        NoRefunds()
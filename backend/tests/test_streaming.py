@@ -0,0 +1,135 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.video_overview.video_overview import generate_chapters
+from app.video_overview.video_overview_parsing import ChapterStreamParser
+from bench.fakes import FakeAnthropic
+
+CHAPTERS = [
+    {"title": 'Braces } { and "quotes" [', "key_points": ["a \\\\ b"], "associations": []},
+    {"title": "Second", "key_points": ["c", "d"], "associations": ["x"]},
+    {"title": "Third", "key_points": [], "associations": []},
+]
+DOCUMENT = json.dumps({"chapters": CHAPTERS})
+EXPECTED = [json.dumps(chapter) for chapter in CHAPTERS]
+
+
+def test_chapters_split_across_deltas():
+    for size in [1, 2, 3, 7, 16, len(DOCUMENT)]:
+        parser = ChapterStreamParser()
+        completed = []
+        for i in range(0, len(DOCUMENT), size):
+            completed += parser.feed(DOCUMENT[i : i + size])
+        assert completed == EXPECTED, size
+
+
+def test_every_split_point():
+    for split in range(len(DOCUMENT) + 1):
+        parser = ChapterStreamParser()
+        assert parser.feed(DOCUMENT[:split]) + parser.feed(DOCUMENT[split:]) == EXPECTED
+
+
+def test_trailing_partial_chapter_is_held_back():
+    cut = DOCUMENT.index('"Third"')
+    parser = ChapterStreamParser()
+    assert parser.feed(DOCUMENT[:cut]) == EXPECTED[:2]
+    assert parser.feed(DOCUMENT[cut:]) == EXPECTED[2:]
+
+
+def sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_chapters_then_the_overview(fakes, run_app):
+    async def test(client):
+        response = await client.post(
+            "/generate-overview-stream/streamed", json={"user_api_key": "test"}
+        )
+        assert response.status_code == 200
+        events = sse_events(response.text)
+        names = [name for name, _ in events]
+        assert names == ["chapter"] * fakes.llm.n_chapters + ["overview"]
+        overview = events[-1][1]
+        assert [data for _, data in events[:-1]] == overview["chapters"]
+
+        # a stored overview is a single event
+        again = await client.post(
+            "/generate-overview-stream/streamed", json={"user_api_key": "test"}
+        )
+        assert sse_events(again.text) == [("overview", overview)]
+
+    run_app(test)
+
+
+def test_stream_reports_a_failed_generation(fakes, run_app, monkeypatch):
+    def fail(**kwargs):
+        raise RuntimeError("upstream is down")
+
+    monkeypatch.setattr(fakes.llm, "stream", fail)
+
+    async def test(client):
+        response = await client.post(
+            "/generate-overview-stream/failing", json={"user_api_key": "test"}
+        )
+        assert response.status_code == 200
+        events = sse_events(response.text)
+        assert [name for name, _ in events] == ["error"]
+        assert events[0][1]["status_code"] >= 500
+
+    run_app(test)
+
+
+class ScriptedLLM(FakeAnthropic):
+    # answers each call with the next (text, stop_reason)
+    def __init__(self, responses):
+        super().__init__(latency_s=0)
+        self.responses = list(responses)
+
+    def completion_text(self, messages):
+        text, self.stop_reason = self.responses.pop(0)
+        return text
+
+    def message(self, text: str):
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=text)],
+            stop_reason=self.stop_reason,
+            usage=SimpleNamespace(input_tokens=0, output_tokens=0),
+        )
+
+
+def chapters_json(starts):
+    return json.dumps(
+        {
+            "chapters": [
+                {
+                    "title": f"At {start}",
+                    "key_points": ["one", "two"],
+                    "key_point_start_times": [start, start + 20],
+                    "associations": [],
+                }
+                for start in starts
+            ]
+        }
+    )
+
+
+def test_continuation_chapters_are_filtered_before_streaming():
+    transcript_text = "".join(f"{t}: words at {t}\n" for t in range(0, 600, 30))
+    truncated = chapters_json([0, 60, 120, 180])
+    truncated = truncated[: truncated.index('"At 180"')]
+    # the continuation starts again with the chapter the cut-off one belonged to
+    llm = ScriptedLLM(
+        [(truncated[1:], "max_tokens"), (chapters_json([120, 180, 240])[1:], "end_turn")]
+    )
+    streamed = []
+    chapters = asyncio.run(
+        generate_chapters(transcript_text, [], llm, on_chapter=streamed.append)
+    )
+    starts = [chapter.key_points[0].time for chapter in chapters]
+    assert starts == [0, 60, 120, 180, 240]
+    assert streamed == chapters